@@ -0,0 +1,115 @@
+import pickle
+import numpy as np
+
+# Direction each piezo moves the swarm in image coordinates (see the action table in main_pipeline.py),
+# used to resolve the sign of the angles predicted by construct_model (np.arctan(dY / dX) loses the quadrant)
+NOMINAL_DIRECTIONS = np.array([[-1, 0],  # Action 0 --> Move: Left
+                               [0, -1],  # Action 1 --> Move: Up
+                               [1, 0],  # Action 2 --> Move: Right
+                               [0, 1]])  # Action 3 --> Move: Down
+
+
+class DynamicsTable:
+
+    def __init__(self, vpps, frequencies, displacements, positions=None):
+        """
+        Lookup table of the predicted swarm displacement for every (Vpp, Frequency, Action, position) on a discrete grid
+        :param vpps:            Vpp grid, shape (n_vpp,)
+        :param frequencies:     Frequency grid, shape (n_freq,)
+        :param displacements:   Predicted displacements (dX, dY), shape (n_vpp, n_freq, NR_OF_PIEZOS, n_pos, n_pos, 2)
+        :param positions:       Position grid (same for x and y), shape (n_pos,), None if the dynamics do not depend on position
+        """
+        self.vpps = np.asarray(vpps, dtype=float)
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.positions = np.zeros(1) if positions is None else np.asarray(positions, dtype=float)
+        self.displacements = np.asarray(displacements, dtype=float)
+
+    @classmethod
+    def from_model(cls, model, vpps, frequencies, positions=None, nr_actions=4):
+        """
+        Precompile a trained regressor (as pickled by construct_model.py) into a lookup table with one predict call
+        :param model:       Regressor predicting (Angle, Magnitude) from (Vpp, Frequency, Action[, X0, Y0])
+        :param vpps:        Vpp grid
+        :param frequencies: Frequency grid
+        :param positions:   Position grid, only used if the model takes X0 and Y0 as features
+        :param nr_actions:  NR_OF_PIEZOS
+        :return:            DynamicsTable
+        """
+        if getattr(model, "n_features_in_", 3) == 3:
+            positions = None
+        grid_positions = np.zeros(1) if positions is None else np.asarray(positions, dtype=float)
+
+        # All feature combinations in one array
+        grid = np.meshgrid(vpps, frequencies, np.arange(nr_actions), grid_positions, grid_positions, indexing='ij')
+        features = np.stack([g.ravel() for g in grid], axis=1)
+        if positions is None:
+            features = features[:, :3]
+
+        # Predict angle and magnitude and convert to a displacement vector
+        angle, magnitude = np.asarray(model.predict(features), dtype=float).T
+        vectors = magnitude[:, np.newaxis] * np.stack((np.cos(np.radians(angle)), np.sin(np.radians(angle))), axis=1)
+
+        # Point the vectors along the direction the piezo moves the swarm
+        actions = features[:, 2].astype(int)
+        flip = np.sum(vectors * NOMINAL_DIRECTIONS[actions], axis=1) < 0
+        vectors[flip] *= -1
+
+        shape = (len(vpps), len(frequencies), nr_actions, len(grid_positions), len(grid_positions), 2)
+        return cls(vpps=vpps, frequencies=frequencies, displacements=vectors.reshape(shape), positions=positions)
+
+    @classmethod
+    def from_pickle(cls, filename, vpps, frequencies, positions=None):
+        """
+        Precompile a pickled regressor into a lookup table
+        """
+        with open(filename, 'rb') as f:
+            model = pickle.load(f)
+        return cls.from_model(model=model, vpps=vpps, frequencies=frequencies, positions=positions)
+
+    def save(self, filename):
+        np.savez(filename, vpps=self.vpps, frequencies=self.frequencies,
+                 positions=self.positions, displacements=self.displacements)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(vpps=data['vpps'], frequencies=data['frequencies'],
+                   displacements=data['displacements'], positions=data['positions'])
+
+    def _position_index(self, positions):
+        """
+        Index of the nearest grid position
+        """
+        if len(self.positions) == 1:
+            return np.zeros(np.shape(positions), dtype=int)
+        idx = np.clip(np.searchsorted(self.positions, positions), 1, len(self.positions) - 1)
+        return idx - (np.abs(positions - self.positions[idx - 1]) <= np.abs(self.positions[idx] - positions))
+
+    def query(self, pos0, offset):
+        """
+        Choose the action and drive parameters whose predicted displacement brings the swarm closest to the target
+        :param pos0:    Swarm position
+        :param offset:  Offset to target (position - target)
+        :return:        action, vpp, frequency
+        """
+        ix, iy = self._position_index(np.asarray(pos0, dtype=float))
+        errors = np.linalg.norm(self.displacements[:, :, :, ix, iy, :] + np.asarray(offset, dtype=float), axis=-1)
+        v, f, action = np.unravel_index(np.argmin(errors), errors.shape)
+        return int(action), self.vpps[v], self.frequencies[f]
+
+    def query_batch(self, positions, offsets):
+        """
+        Batched version of query
+        :param positions:   Swarm positions, shape (N, 2)
+        :param offsets:     Offsets to target, shape (N, 2)
+        :return:            actions, vpps, frequencies (arrays of shape (N,))
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+        ix, iy = self._position_index(positions[:, 0]), self._position_index(positions[:, 1])
+
+        # (N, n_vpp, n_freq, NR_OF_PIEZOS, 2)
+        displacements = np.moveaxis(self.displacements[:, :, :, ix, iy, :], 3, 0)
+        errors = np.linalg.norm(displacements + offsets[:, np.newaxis, np.newaxis, np.newaxis, :], axis=-1)
+        v, f, actions = np.unravel_index(np.argmin(errors.reshape(len(offsets), -1), axis=1), errors.shape[1:])
+        return actions, self.vpps[v], self.frequencies[f]
@@ -6,21 +6,29 @@ import time
 import serial
 from settings import *
 import matplotlib.pyplot as plt
-import binascii
 from collections import deque
 import settings
 import pyvisa as visa
-import pymmcore
 import tqdm
 import pandas as pd
 import tektronix_func_gen as tfg
 import atexit
-from model import calc_action, update_q_values
+from concurrent.futures import ThreadPoolExecutor
+from model import calc_action, calc_actions, random_action, update_q_values
+from q_value_checkpoints import QValueCheckpoints
+from tiled_q_values import TiledQValues
+from dynamics_table import DynamicsTable
+from metadata_logger import MetadataLogger, SWARM_ENV_COLUMNS, DATA_GATHER_ENV_COLUMNS
+from experiment_catalog import ExperimentCatalog
+from piezo_driver import PiezoDriver, OFF
+from translator_leica import TranslatorLeica
+from latency_calibration import load_latencies, onset_latency
 
 
 class VideoStreamHammamatsu:
 
     def __init__(self):
+        import pymmcore
 
         # Initialiye core object
         self.core = pymmcore.CMMCore()
@@ -87,209 +95,204 @@ class VideoStreamKronos:
 
 class ActuatorPiezos:
 
-    def __init__(self):
-
-        # Initiate contact with arduino
-        self.arduino = serial.Serial(port=SERIAL_PORT_ARDUINO, baudrate=BAUDRATE_ARDUINO)
-        print(f"Arduino: {self.arduino.readline().decode()}")
-        time.sleep(1)  # Give serial communication time to establish
+    def __init__(self, port=SERIAL_PORT_ARDUINO):
 
-        # Initiate status of 4 piëzo transducers
-        self.arduino.write(b"9")  # Turn all outputs to LOW
+        # Initiate contact with arduino (waits for its greeting, turns all outputs to LOW)
+        self.driver = PiezoDriver(port=port, baudrate=BAUDRATE_ARDUINO, ack=ACK_PIEZOS)
 
     def move(self, action: int):
 
         if action == -1:
             return
 
-        self.arduino.write(b"9")  # Turn old piezo off
-        self.arduino.write(f"{action}".encode())  # Turn new piezo on
-
-    def close(self):
-
-        self.arduino.write(b"9")
-
+        self.driver.send(action)  # Turn old piezo off and new piezo on (one message, written in the background)
 
-class TranslatorLeica:
+    def stop(self):
 
-    def __init__(self, port=SERIAL_PORT_LEICA):
-
-        # Open Leica
-        self.observer = serial.Serial(port=port,
-                                      baudrate=BAUDRATE_LEICA,  # Baudrate has to be 9600
-                                      timeout=2)  # 2 seconds timeout recommended by the manual
-        print(f"Opened port {port}: {self.observer.isOpen()}")
-        self.pos = (0, 0)  # Reset position to (0, 0)
-
-    def reset(self):
-        self.observer.write(bytearray([255, 82]))  # Reset device
-        time.sleep(2)  # Give the device time to reset before issuing new commands
+        self.driver.send(OFF)  # Turn all outputs LOW
+        self.driver.flush()
 
     def close(self):
-        self.observer.close()
-        print(f"Closed serial connection")
-
-    def get_status(self, motor: int):  # TODO --> use check_status to make sure the motor does not get command while still busy
-        assert motor in [0, 1, 2]  # Check if device number is valid
-        self.observer.write(bytearray([motor, 63, 58]))  # Ask for device status
-        received = self.observer.read(1)  # Read response (1 byte)
-        if received:
-            print(f"Received: {received.decode()}")  # Print received message byte
-        time.sleep(SLEEP_TIME)
-
-    def write_target_pos(self, motor: int, target_pos: int):
-
-        # Translate coordinate to a 3-byte message
-        msg = self.coord_to_msg(int(target_pos))
-        self.observer.write(bytearray([motor, 84, 3, msg[0], msg[1], msg[2], 58]))  # [device number, command, 3, message, stop signal]
-        time.sleep(SLEEP_TIME)
-
-    def get_motor_pos(self, motor):
-
-        # Ask for position
-        self.observer.write(bytearray([motor, 97, 58]))
-
-        # Initialise received variable
-        received = b''
-
-        # For timeout functionality
-        t0 = time.time()
-
-        # Check for received message until timeout
-        while not received:
-            received = self.observer.read(3)  # Read response (3 bytes)
-            if received == b'\x00\x00\x00':
-                return 0
-            if time.time() - t0 >= SLEEP_TIME:  # Check if it takes longer than a second
-                print(f"No bytes received: {received}")
-                return 0
-
-        # Return translated message
-        translated = self.msg_to_coord(received)
-        # self.observer.write(bytearray([71, 58]))
-        # self.reset()
-        time.sleep(SLEEP_TIME)
-
-        return translated
-
-    def get_target_pos(self, motor: int):
-
-        # Ask for position
-        self.observer.write(bytearray([motor, 116, 58]))
 
-        # Initialise received variable
-        received = b''
+        self.driver.close()
+        print(f"Piezo driver: {self.driver.stats()}")
 
-        # For timeout functionality
-        t0 = time.time()
 
-        # Check for received message until timeout
-        while not received:
-            received = self.observer.read(3)  # Read response (3 bytes)
-            if received == b'\x00\x00\x00':
-                return 0
-            if time.time() - t0 >= SLEEP_TIME:  # Check if it takes longer than a second
-                print(f"No bytes received: {received}")
-                return 0
-
-        # Return translated message
-        translated = self.msg_to_coord(received)
-        time.sleep(SLEEP_TIME)
-
-        return translated
-
-    def move_to_target(self, motor: int, target_pos: int):  # TODO --> Coordinate boundaries so we don't overshoot the table and get the motor stuck, as we need to reset then
+class FunctionGenerator:
 
+    def __init__(self, instrument_descriptor=INSTR_DESCRIPTOR, preset_mode=PIEZO_PRESET_MODE,
+                 dual_channel=DUAL_CHANNEL_ACTUATION, resource_manager=None):
         """
-        100k steps is 1 cm in real life
+        Tektronix function generator, drives the piezos with channel 1 or (dual channel) with the active one of both
+        channels while the idle channel is pre-tuned to the next piezo
+        :param instrument_descriptor:   VISA address
+        :param preset_mode:             Piezo resonance switching: "command" (prepared commands), "recall" (setup memory)
+                                        or None (set_frequency)
+        :param dual_channel:            Switch piezos by swapping the outputs of the two channels if the idle channel
+                                        was armed with the resonance frequency of the new piezo
+        :param resource_manager:        VISA resource manager (e.g. SimulatedResourceManager), pyvisa's if None
         """
+        assert preset_mode in ['command', 'recall', None], f'Invalid preset mode: {preset_mode}'
+        assert not (dual_channel and preset_mode == 'recall'), 'Setup recalls would overwrite the idle channel'
+        self.fgen = tfg.FuncGen(instrument_descriptor, resource_manager=resource_manager)
+        self.AFG3000 = self.fgen.ch1  # Active channel
+
+        # Piezo presets
+        self.preset_mode = preset_mode
+        self.presets = {}
+        self.resonances = PIEZO_RESONANCES  # Resonances of the presets
+        self.switch_times = deque(maxlen=1000)  # Durations of piezo switches (s)
+
+        # Dual channel actuation
+        self.dual_channel = dual_channel
+        self.armed = None  # Piezo the idle channel is tuned to
+        self.swaps = 0
+
+    @property
+    def channels(self):
+        """
+        Channels that drive the piezos
+        """
+        return self.fgen.channels if self.dual_channel else (self.AFG3000,)
 
-        # Write target position
-        self.write_target_pos(motor=motor, target_pos=target_pos)
-
-        # Move motor to target coordinate
-        self.observer.write(bytearray([motor, 71, 58]))
-
-        # Give motor time to move
-        time.sleep(SLEEP_TIME)
-
-    def coord_to_msg(self, coord: int):
-
-        # Convert from two's complement
-        if np.sign(coord) == -1:
-            coord += 16777216
-
-        # Convert to hexadecimal and pad coordinate with zeros of necessary (len should be 6 if data length is 3)
-        hexa = hex(coord).split("x")[-1].zfill(6)
-
-        # Get the four digit binary code for each hex value
-        four_digit_binaries = [bin(int(n, 16))[2:].zfill(4) for n in hexa]
-
-        # Convert to 3-byte message
-        eight_digit_binaries = [f"{four_digit_binaries[n] + four_digit_binaries[n + 1]}".encode() for n in range(0, 6, 2)][::-1]
-
-        return [int(m, 2) for m in eight_digit_binaries]
-
-    def msg_to_coord(self, msg: str):
-
-        # Read LSB first
-        msg = msg[::-1]
-
-        # Convert incoming hex to readable hex
-        hexa = binascii.hexlify(bytearray(msg))
-
-        # Convert hex to decimal
-        coord = int(hexa, 16)
-
-        # Convert to negative coordinates if applicable
-        if bin(coord).zfill(24)[2] == '1':
-            coord -= 16777216
-        return int(coord)
-
-    def pixels_to_increment(self, pixels: np.array):
-        return np.array([pixels[0]*PIXEL_MULTIPLIER_LEFT_RIGHT, pixels[1]*PIXEL_MULTIPLIER_UP_DOWN])
-
-    def move_increment(self, offset_pixels: np.array):
-
-        # Get increments and add to current position
-        self.pos += self.pixels_to_increment(pixels=offset_pixels)
-
-        # Move motors x and y
-        print("Moving...")
-        self.move_to_target(motor=1, target_pos=self.pos[0])  # Move left/right
-        self.move_to_target(motor=2, target_pos=self.pos[1])  # Move up/down
-        time.sleep(3)  # TODO --> check optimal sleep time
+    @property
+    def idle(self):
+        """
+        Channel that is not driving the piezos (dual channel only)
+        """
+        return self.fgen.ch2 if self.AFG3000 is self.fgen.ch1 else self.fgen.ch1
 
+    def batch(self, check_errors=False):
+        """
+        Context manager that sends all settings changed inside it as one compound command
+        :param check_errors:    Query the error queue after the command (an extra round trip, not for switching)
+        """
+        return self.fgen.batch(check_errors=check_errors)
 
-class FunctionGenerator:
+    def reset(self, vpp=1, frequency=1):
 
-    def __init__(self, instrument_descriptor=INSTR_DESCRIPTOR):
-        self.AFG3000 = tfg.FuncGen(instrument_descriptor).ch1
+        with self.batch(check_errors=True):
+            self.set_vpp(vpp=vpp)
+            self.set_frequency(frequency=frequency)
+            self.set_waveform('SQUARE')
+            if self.dual_channel:
+                self.idle.set_output("OFF")
+                self.armed = None
+            self.turn_on()
 
-    def reset(self, vpp=1, frequency=1):
+        print(f'FG settings: {self.AFG3000.state}')  # Settings confirmed by the writes above (no read-back)
 
-        self.set_vpp(vpp=vpp)
-        self.set_frequency(frequency=frequency)
-        self.set_waveform('SQUARE')
-        self.turn_on()
+    def prepare_presets(self, resonances=PIEZO_RESONANCES):
+        """
+        Validate the resonance frequency of every piezo once, so switching piezos is a single short command
+        :param resonances:  Dictionary of piezo and resonance frequency (kHz)
+        """
+        self.presets = {}
+        self.resonances = resonances
+        if self.preset_mode == 'command':
+            for action, frequency in resonances.items():
+                self.presets[action] = {ch: ch.prepare_frequency(frequency * 1e3) for ch in self.channels}
+
+        elif self.preset_mode == 'recall':
+
+            # Save the current settings with every resonance frequency in setup memory (piezo 0 --> location 1, ...)
+            frequency = self.get_frequency()
+            for action, resonance in resonances.items():
+                self.set_frequency(frequency=resonance)
+                self.fgen.save_setup(action + 1)
+                self.presets[action] = action + 1
+            self.AFG3000.set_frequency(frequency)
+
+    def switch_to(self, action: int):
+        """
+        Tune to the resonance frequency of a piezo using its preset
+        :param action:  Piezo (0-3)
+        :return:        Duration of the switch (s)
+        """
+        t0 = time.perf_counter()
+        if self.dual_channel and action == self.armed:
+            self.swap()
+        elif action not in self.presets:
+            self.set_frequency(frequency=PIEZO_RESONANCES[action])
+        elif self.preset_mode == 'recall':
+            self.fgen.recall_setup(self.presets[action])
+        else:
+            command, frequency = self.presets[action][self.AFG3000]
+            if not self.AFG3000.is_set("frequency", frequency):
+                self.AFG3000.write_prepared(command, "frequency", frequency)
+        duration = time.perf_counter() - t0
+        self.switch_times.append(duration)
+        return duration
+
+    def arm(self, action):
+        """
+        Tune the idle channel to the resonance frequency of the piezo that is expected next (dual channel only)
+        :param action:  Piezo (0-3), None to keep the armed piezo
+        """
+        if not self.dual_channel or action is None or action == self.armed:
+            return
+        self.idle.set_frequency(PIEZO_RESONANCES[action] * 1e3)
+        self.armed = action
 
-        print(f'FG settings: {self.AFG3000.get_settings()}')
+    def swap(self):
+        """
+        Make the armed idle channel the active one, both outputs change in one compound command
+        """
+        old, new = self.AFG3000, self.idle
+        with self.batch():
+            old.set_output("OFF")
+            new.set_output("ON")
+        self.AFG3000 = new
+        self.armed = None
+        self.swaps += 1
+
+    def switch_stats(self):
+        """
+        Statistics of the piezo switch durations (ms)
+        """
+        stats = {"switches": len(self.switch_times), "preset_mode": self.preset_mode}
+        if self.dual_channel:
+            stats["swaps"] = self.swaps
+        if self.switch_times:
+            times = np.array(self.switch_times) * 1e3
+            stats.update(mean=round(float(times.mean()), 3),
+                         p95=round(float(np.percentile(times, 95)), 3),
+                         max=round(float(times.max()), 3))
+        return stats
 
     def set_vpp(self, vpp: float):
-        self.AFG3000.set_amplitude(vpp)
+        changed = not self.AFG3000.is_set("amplitude", vpp)
+        for channel in self.channels:
+            channel.set_amplitude(vpp)  # Skipped if vpp is already set
+        if self.preset_mode == 'recall' and changed and self.presets:
+            self.prepare_presets(self.resonances)  # Saved setups contain the old vpp
 
-    def get_vpp(self):
-        return self.AFG3000.get_amplitude()
+    def get_vpp(self, query=False):
+        return self.AFG3000.get_amplitude() if query else self.AFG3000.cached("amplitude")
 
     def set_frequency(self, frequency: float):
-        self.AFG3000.set_frequency(frequency * 1e3)
+        self.AFG3000.set_frequency(frequency * 1e3)  # Skipped if frequency is already set
+
+    def get_frequency(self, query=False):
+        return self.AFG3000.get_frequency() if query else self.AFG3000.cached("frequency")
 
-    def get_frequency(self):
-        return self.AFG3000.get_frequency()
+    def set_sweep(self, start: float, stop: float, sweep_time: float, spacing='LINear'):
+        """
+        Configure a frequency sweep on the active channel, started by AFG3000.start_sweep()
+        :param start:       Start frequency (kHz)
+        :param stop:        Stop frequency (kHz)
+        :param sweep_time:  Duration of the sweep (s)
+        :param spacing:     "LINear" or "LOGarithmic"
+        """
+        self.AFG3000.set_sweep(start * 1e3, stop * 1e3, sweep_time, spacing=spacing)
+
+    def stop_sweep(self):
+        self.AFG3000.stop_sweep()
 
     def set_waveform(self, waveform: str):
         assert waveform in ['SIN', 'SQUARE', 'RAMP'], f'Invalid waveform: {waveform}'
-        self.AFG3000.set_function(waveform)
+        for channel in self.channels:
+            channel.set_function(waveform)
 
     def get_waveform(self):
         return self.AFG3000.get_function()
@@ -298,23 +301,170 @@ class FunctionGenerator:
         self.AFG3000.set_output("ON")
 
     def turn_off(self):
-        self.AFG3000.set_output("OFF")
+        for channel in self.channels:
+            channel.set_output("OFF")
+
+
+def open_simulated_hardware():
+    """
+    Start the simulated devices (SIMULATE_HARDWARE), imported here because the pseudo terminals are POSIX only
+    :return:    SimulatedHardware
+    """
+    from simulated_hardware import SimulatedHardware
+    hardware = SimulatedHardware()
+    print(f"Simulated hardware: Arduino {hardware.arduino.port}, Leica {hardware.leica.port}")
+    return hardware
+
+
+_OPEN_DEVICES = {}  # Devices kept open for the next environment (KEEP_DEVICES_ALIVE)
+
+
+def device_factories(simulation=None):
+    """
+    Functions that open the devices
+    :param simulation:  SimulatedHardware, None for the real devices
+    :return:            Dictionary of device name and function
+    """
+    if simulation:
+        return {'source': lambda: simulation.camera,
+                'actuator': lambda: ActuatorPiezos(port=simulation.arduino.port),
+                'translator': lambda: TranslatorLeica(port=simulation.leica.port),
+                'function_generator': lambda: FunctionGenerator(resource_manager=simulation.resource_manager)}
+    return {'source': VideoStreamHammamatsu,  # Camera
+            'actuator': ActuatorPiezos,  # Piezo's
+            'translator': TranslatorLeica,  # Leica xy-platform
+            'function_generator': FunctionGenerator}  # Function generator
+
+
+def _open_timed(factory):
+    t0 = time.perf_counter()
+    device = factory()
+    return device, time.perf_counter() - t0
+
+
+def open_devices(names, keep_alive=KEEP_DEVICES_ALIVE):
+    """
+    Open devices concurrently and wait until all of them are ready
+    :param names:       Names of the devices (keys of device_factories)
+    :param keep_alive:  Reuse the devices kept open by a previous environment
+    :return:            Dictionary of device name and device ('simulation' is the SimulatedHardware or None)
+    """
+    t0 = time.perf_counter()
+    devices = {name: _OPEN_DEVICES[name] for name in ['simulation', *names] if keep_alive and name in _OPEN_DEVICES}
+    reused = set(devices)
+    if 'simulation' not in devices:
+        devices['simulation'] = open_simulated_hardware() if SIMULATE_HARDWARE else None
+    factories = device_factories(simulation=devices['simulation'])
+
+    # Open the other devices concurrently (their handshakes and sleeps overlap)
+    to_open = [name for name in names if name not in devices]
+    timings, errors = {}, {}
+    if to_open:
+        with ThreadPoolExecutor(max_workers=len(to_open)) as executor:
+            futures = {name: executor.submit(_open_timed, factories[name]) for name in to_open}
+        for name, future in futures.items():
+            try:
+                devices[name], timings[name] = future.result()
+            except Exception as err:
+                errors[name] = err
+
+    # Close what was opened if a device failed
+    if errors:
+        close_devices({name: device for name, device in devices.items() if name not in reused})
+        name, err = next(iter(errors.items()))
+        raise RuntimeError(f"Could not open {', '.join(errors)}") from err
+
+    # Startup report
+    report = ', '.join([f"{name} {duration:.2f}s" for name, duration in timings.items()] +
+                       [f"{name} reused" for name in names if name in reused])
+    print(f"Devices ready in {time.perf_counter() - t0:.2f}s ({report})")
+    return devices
+
+
+def release_devices(devices, keep_alive=KEEP_DEVICES_ALIVE):
+    """
+    Turn the actuation off and keep the devices open for the next environment (keep_alive) or close them
+    :param devices:     Dictionary of device name and device
+    :param keep_alive:  Keep the devices open
+    """
+    if 'function_generator' in devices:
+        devices['function_generator'].turn_off()
+    if not keep_alive:
+        close_devices(devices)
+        return
+    if 'actuator' in devices:
+        devices['actuator'].stop()
+    if 'translator' in devices:
+        devices['translator'].wait()
+    _OPEN_DEVICES.update(devices)
+
+
+def close_devices(devices=None):
+    """
+    Close devices
+    :param devices: Dictionary of device name and device, the devices kept alive if None
+    """
+    if devices is None:
+        devices = dict(_OPEN_DEVICES)
+    for name, device in devices.items():
+        if _OPEN_DEVICES.get(name) is device:
+            del _OPEN_DEVICES[name]
+        if name in ('actuator', 'translator', 'simulation') and device is not None:
+            device.close()  # Close communication
+
+
+atexit.register(close_devices)
+
+
+def catalog_episode(metadata):
+    """
+    Record the episode in the experiment catalog, errors are reported but not raised (the episode is saved already)
+    :param metadata:    MetadataLogger of the episode
+    """
+    try:
+        catalog = ExperimentCatalog(CATALOG_FILENAME)
+        try:
+            catalog.record_run(metadata=metadata.to_dataframe(),
+                               source=metadata.episode_log.filename,
+                               run_name=EXPERIMENT_RUN_NAME,
+                               date=str(DATE),
+                               metadata_file=METADATA_FILENAME,
+                               snapshots_dir=SNAPSHOTS_SAVE_DIR)
+        finally:
+            catalog.close()
+    except Exception as err:
+        print(f"Could not catalog the episode: {err}")
 
 
 class SwarmEnv:
 
     def __init__(self,
                  target_points=TARGET_POINTS,
-                 q_values=Q_VALUES_INITIAL,
-                 metadata=METADATA):
-
-        # Initialize devices
-        self.source = VideoStreamHammamatsu()  # Camera
-        self.actuator = ActuatorPiezos()  # Piezo's
-        self.function_generator = FunctionGenerator()  # Function generator
-
-        # Metadatastructure
-        self.metadata = metadata
+                 q_values=None,
+                 metadata=None):
+
+        # Lazy settings and data folders
+        q_values = settings.Q_VALUES_INITIAL if q_values is None else q_values
+        metadata = settings.METADATA if metadata is None else metadata
+        settings.make_data_dirs()
+
+        # Initialize devices (concurrently, or reused from the previous environment)
+        self.devices = open_devices(['source', 'actuator', 'function_generator'])
+        self.simulation = self.devices['simulation']
+        self.source = self.devices['source']  # Camera
+        self.actuator = self.devices['actuator']  # Piezo's
+        self.function_generator = self.devices['function_generator']  # Function generator
+
+        # Metadatastructure (continues the rows already in METADATA_FILENAME)
+        self.episode_name, episode_log_filename, journal_filename = settings.episode_filenames()
+        self.metadata = MetadataLogger(columns=SWARM_ENV_COLUMNS,
+                                       filename=METADATA_FILENAME,
+                                       save_rate=SAVE_RATE_METADATA,
+                                       start_index=len(metadata),
+                                       binary_filename=episode_log_filename,
+                                       journal_filename=journal_filename,
+                                       snapshots_dir=SNAPSHOTS_SAVE_DIR,
+                                       constants={"OFFSET_BOUNDS": OFFSET_BOUNDS})
         self.model = calc_action
 
         # Initialize Vpp and frequency
@@ -323,6 +473,7 @@ class SwarmEnv:
         self.action = -1
         self.function_generator.reset(vpp=self.vpp,
                                       frequency=self.frequency)
+        self.function_generator.prepare_presets()
 
         # Keep track of target point (idx in target_points)
         self.target_points = target_points
@@ -331,9 +482,29 @@ class SwarmEnv:
         # Keep track of dynamics from the near past
         self.memory = deque(maxlen=MAX_MEM_LEN)
 
-        # Initialize Q values
+        # Initialize Q values (optionally resume from the latest checkpoint)
+        self.checkpoints = QValueCheckpoints(directory=CHECKPOINTS_FOLDER, atol=CHECKPOINT_ATOL)
+        if RESUME_Q_VALUES:
+            restored = self.checkpoints.restore()
+            if restored is not None:
+                q_values = restored
+                print(f"Resumed Q values from step {self.checkpoints.manifest['step']}")
+        if TILED_Q_VALUES:
+            q_values = TiledQValues.from_dense(q_values)
         self.q_values = q_values
-        self.mode = "single_choice"
+        self.mode = POLICY_MODE
+
+        # Calibrated onset latencies of the piezos (switches wait until the current piezo had time to act)
+        self.onset_latencies = load_latencies() if SWITCH_HOLDOFF else {}
+        self.switch_time = 0
+
+        # Precompile the learned dynamics into a lookup table
+        self.dynamics = None
+        if self.mode == 'learned':
+            self.dynamics = DynamicsTable.from_pickle(filename=f"{MODELS_FOLDER}\\{DYNAMICS_MODEL_NAME}",
+                                                      vpps=DYNAMICS_VPPS,
+                                                      frequencies=DYNAMICS_FREQUENCIES,
+                                                      positions=DYNAMICS_POSITIONS)
 
         # Set exit condition
         atexit.register(self.close)
@@ -427,11 +598,13 @@ class SwarmEnv:
         img = self.source.snap(f_name=filename)
         # img = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
 
-        # Draw bbox around swarm to track
-        bbox = np.array(np.array(self.draw_bbox(img=img)), dtype=int).tolist()
-
-        # Manualy add target points
-        targets = np.array(np.array(self.draw_targets(img=img)), dtype=int).tolist()
+        # Draw bbox around swarm to track and manually add target points (known in simulation)
+        if self.simulation:
+            bbox = self.simulation.swarm.bbox()
+            targets = [] if self.target_points else self.simulation.target_points
+        else:
+            bbox = np.array(np.array(self.draw_bbox(img=img)), dtype=int).tolist()
+            targets = np.array(np.array(self.draw_targets(img=img)), dtype=int).tolist()
         if targets:
             self.target_points = targets
             self.target_idx = 0
@@ -445,20 +618,16 @@ class SwarmEnv:
         # Add position to memory
         self.memory.append(self.state)
 
-        # Add metadata to dataframe
-        self.metadata = self.metadata.append(
-            {"Filename": filename,
-             "Time": self.now,
-             "Vpp": self.vpp,
-             "Frequency": self.frequency,
-             "Size": self.size,
-             "Action": None,
-             "State": self.state,
-             "Target": self.target_points[self.target_idx],
-             "Step": self.step,
-             "OFFSET_BOUNDS": OFFSET_BOUNDS},
-             ignore_index=True
-        )
+        # Add metadata to log
+        self.metadata.append(Time=self.now,
+                             Vpp=self.vpp,
+                             Frequency=self.frequency,
+                             Size=self.size,
+                             Action=-1,
+                             State=self.state,
+                             Target=self.target_points[self.target_idx],
+                             Step=self.step,
+                             Reset=True)
 
         self.t0 = time.time()
 
@@ -481,7 +650,7 @@ class SwarmEnv:
         self.state, self.size = self.tracker.update(img=img,  # Read image
                                                     target=self.target_points[self.target_idx],  # For verbose purposes
                                                     action=self.action,
-                                                    verbose=True)  # Show live tracking
+                                                    verbose=not self.simulation)  # Show live tracking
         offset = np.array(self.state) - np.array(self.target_points[self.target_idx])
         self.memory.append(self.state)
 
@@ -491,38 +660,63 @@ class SwarmEnv:
                                             memory=self.memory,
                                             q_values=self.q_values)
 
+        # Write changed Q value tiles to the checkpoint folder
+        if not self.step % SAVE_RATE_Q_VALUES and self.step != 0:
+            self.checkpoints.save(q_values=self.q_values, step=self.step)
+
         # Only update function generator and arduino every UPDATE_RATE_ENV steps
         if not self.step % UPDATE_RATE_ENV:
 
             print(f'FPS: {1 / ((time.time() - self.t0) / UPDATE_RATE_ENV)}')
 
-            new_action = self.model(pos0=self.state,
-                                    offset=offset,
-                                    q_values=self.q_values,
-                                    mode=self.mode)
-
-            # Perform action
-            if new_action != self.action:
-                self.action = new_action
-                self.function_generator.set_frequency(frequency=PIEZO_RESONANCES[self.action])
-                self.actuator.move(self.action)
+            if self.mode == 'learned':
+
+                # Pick action and drive parameters from the learned dynamics, explore like calc_action does
+                new_action, vpp, frequency = self.dynamics.query(pos0=self.state, offset=offset)
+                if np.random.rand() < EPSILON:
+                    new_action = random_action()
+                with self.function_generator.batch():  # Vpp and frequency in one write
+                    if vpp != self.vpp:
+                        self.vpp = vpp
+                        self.function_generator.set_vpp(vpp=self.vpp)
+                    if frequency != self.frequency:
+                        self.frequency = frequency
+                        self.function_generator.set_frequency(frequency=self.frequency)
+                if new_action != self.action and self.switch_settled():
+                    self.action = new_action
+                    self.actuator.move(self.action)
+                    self.switch_time = time.perf_counter()
+
+            else:
+
+                new_action = self.model(pos0=self.state,
+                                        offset=offset,
+                                        q_values=self.q_values,
+                                        mode=self.mode)
+
+                # Perform action
+                if new_action != self.action and self.switch_settled():
+                    self.action = new_action
+                    self.function_generator.switch_to(self.action)  # Output swap or single preset command
+                    self.actuator.move(self.action)
+                    self.switch_time = time.perf_counter()
+
+                # Pre-tune the idle channel to the piezo expected next (after actuating, off the critical path)
+                if self.function_generator.dual_channel:
+                    self.function_generator.arm(self.predict_next_action(offset=offset))
 
             self.t0 = time.time()
 
-        # Add metadata to dataframe
-        self.metadata = self.metadata.append(
-            {"Filename": filename,
-             "Time": self.now,
-             "Vpp": self.vpp,
-             "Frequency": self.frequency,
-             "Size": self.size,
-             "Action": self.action,
-             "State": self.state,
-             "Target": self.target_points[self.target_idx],
-             "Step": self.step,
-             "OFFSET_BOUNDS": OFFSET_BOUNDS},
-             ignore_index=True
-        )
+        # Add metadata to log
+        self.metadata.append(Time=self.now,
+                             Vpp=self.vpp,
+                             Frequency=self.frequency,
+                             Size=self.size,
+                             Action=self.action,
+                             State=self.state,
+                             Target=self.target_points[self.target_idx],
+                             Step=self.step,
+                             Reset=False)
 
         # # Move microscope to next point if offset goes into bounds
         if np.linalg.norm(offset) < OFFSET_BOUNDS:
@@ -534,38 +728,77 @@ class SwarmEnv:
         # Return centroids of n amount of swarms
         return self.state
 
+    def switch_settled(self):
+        """
+        Check if the current piezo was on for at least its calibrated onset latency (switching earlier wastes the
+        actuation, the swarm would not have started to move yet)
+        """
+        frequency = self.frequency if self.mode == 'learned' else PIEZO_RESONANCES.get(self.action)
+        latency = onset_latency(self.onset_latencies, piezo=self.action, frequency=frequency)
+        return time.perf_counter() - self.switch_time >= latency
+
+    def predict_next_action(self, offset, horizons=(1, 2, 4)):
+        """
+        Predict the next piezo (other than the current one) with the policy at positions extrapolated from the recent
+        swarm velocity
+        :param offset:      Current offset to the target
+        :param horizons:    Extrapolation horizons (environment updates)
+        :return:            Piezo (0-3) or None if the policy keeps the current piezo
+        """
+        velocity = (np.array(self.memory[-1]) - np.array(self.memory[0])) / max(len(self.memory) - 1, 1) * UPDATE_RATE_ENV
+        displacements = np.outer(horizons, velocity)
+        positions = np.clip(np.round(np.array(self.state) + displacements), 0, IMG_SIZE - 1)
+        actions = calc_actions(positions=positions,
+                               offsets=np.array(offset) + displacements,
+                               q_values=self.q_values,
+                               mode=self.mode,
+                               epsilon=0)
+        for action in actions:
+            if action != self.action:
+                return int(action)
+        return None
+
     def close(self):
-        self.metadata.to_csv(METADATA_FILENAME)  # Save metadata
-        self.actuator.close()  # Close communication
-        self.translator.close()  # Close communication
-        self.function_generator.turn_off()
+        self.metadata.close()  # Save metadata
+        self.checkpoints.save(q_values=self.q_values, step=getattr(self, "step", 0))  # Save latest Q values
+        print(f"Piezo switching: {self.function_generator.switch_stats()}")
+        print(f"Q value checkpoints: {self.checkpoints.metrics}")
+        release_devices(self.devices)  # Close communication (or keep it for the next environment)
+        catalog_episode(self.metadata)  # Add this episode to the experiment catalog (after the actuation is off)
         np.save(f'{MODELS_FOLDER}\\{EXPERIMENT_RUN_NAME}_{self.now}_{MODEL_NAME}', self.q_values)
-        cv2.destroyAllWindows()
+        if not self.simulation:
+            cv2.destroyAllWindows()
         print('Safely closed environment...')
 
 
 class DataGatherEnv:
 
     def __init__(self,
-                 metadata=METADATA):
+                 metadata=None):
+
+        # Data folders
+        settings.make_data_dirs()
 
-        # Initialize devices
-        self.source = VideoStreamHammamatsu()  # Camera
-        self.actuator = ActuatorPiezos()  # Piezo's
-        self.translator = TranslatorLeica()  # Leica xy-platform
-        self.function_generator = FunctionGenerator()  # Function generator
+        # Initialize devices (concurrently, or reused from the previous environment)
+        self.devices = open_devices(['source', 'actuator', 'translator', 'function_generator'])
+        self.simulation = self.devices['simulation']
+        self.source = self.devices['source']  # Camera
+        self.actuator = self.devices['actuator']  # Piezo's
+        self.translator = self.devices['translator']  # Leica xy-platform
+        self.function_generator = self.devices['function_generator']  # Function generator
 
         self.function_generator.set_waveform('SQUARE')
         self.function_generator.turn_on()
 
-        # Metadata structure
-        self.metadata = pd.DataFrame(
-            {"Filename": "Initial",
-             "Time": (None, None),
-             "Vpp": None,
-             "Frequency": None,
-             "Action": None}
-        )
+        # Metadata structure (overwrites METADATA_FILENAME)
+        self.episode_name, episode_log_filename, journal_filename = settings.episode_filenames()
+        self.metadata = MetadataLogger(columns=DATA_GATHER_ENV_COLUMNS,
+                                       filename=METADATA_FILENAME,
+                                       save_rate=SAVE_RATE_METADATA,
+                                       append=False,
+                                       binary_filename=episode_log_filename,
+                                       journal_filename=journal_filename,
+                                       snapshots_dir=SNAPSHOTS_SAVE_DIR)
 
         # Set exit condition
         atexit.register(self.close)
@@ -580,23 +813,20 @@ class DataGatherEnv:
 
         # Snap a frame from the video stream
         self.source.snap(f_name=filename)
-        img = cv2.imread(filename)
-        cv2.imshow('Image', img)
-        cv2.waitKey(1)
-
-        # Add metadata to dataframe
-        self.metadata = self.metadata.append(
-            {"Filename": filename,
-             "Time": self.now,
-             "Vpp": vpp,
-             "Frequency": frequency,
-             "Action": action},
-             ignore_index=True
-        )
+        if not self.simulation:
+            img = cv2.imread(filename)
+            cv2.imshow('Image', img)
+            cv2.waitKey(1)
+
+        # Add metadata to log
+        self.metadata.append(Time=self.now,
+                             Vpp=vpp,
+                             Frequency=frequency,
+                             Action=action)
 
     def close(self):
-        self.metadata.to_csv(METADATA_FILENAME)  # Save metadata
-        self.actuator.close()  # Close communication
-        self.translator.close()  # Close communication
-        self.function_generator.turn_off()
-        cv2.destroyAllWindows()
+        self.metadata.close()  # Save metadata
+        release_devices(self.devices)  # Close communication (or keep it for the next environment)
+        catalog_episode(self.metadata)  # Add this episode to the experiment catalog (after the actuation is off)
+        if not self.simulation:
+            cv2.destroyAllWindows()
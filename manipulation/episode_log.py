@@ -0,0 +1,164 @@
+import json
+import os
+import struct
+import numpy as np
+
+STRING_WIDTH = 128  # Maximum number of characters of string columns (e.g. Filename)
+_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+def episode_dtype(columns):
+    """
+    Structured dtype of a binary episode log, positions are stored as numeric {name}_x and {name}_y columns
+    :param columns: Dictionary of column names and dtypes as used by MetadataLogger
+    :return:        numpy structured dtype
+    """
+    fields = []
+    for name, dtype in columns.items():
+        dtype = np.dtype(dtype)
+        if dtype.subdtype is not None:
+            base, (width,) = dtype.subdtype
+            fields += [(f"{name}_{axis}", base) for axis in "xyz"[:width]]
+        elif dtype == object:
+            fields.append((name, f"U{STRING_WIDTH}"))
+        else:
+            fields.append((name, dtype))
+    return np.dtype(fields)
+
+
+def derive_columns(data, attrs):
+    """
+    Columns that are not stored per row but derived from the logged columns and the episode attributes:
+    Filename ({SNAPSHOTS_SAVE_DIR}{Time}.png, {Time}-reset.png for reset rows) and the episode constants
+    :param data:    Dictionary of column names and arrays (at least Time)
+    :param attrs:   Episode attributes (SNAPSHOTS_SAVE_DIR and constants)
+    :return:        Dictionary of column names and arrays
+    """
+    n = len(data["Time"])
+    derived = {}
+    if attrs.get("SNAPSHOTS_SAVE_DIR") is not None:
+        reset = data["Reset"] if "Reset" in data else np.zeros(n, dtype=bool)
+        derived["Filename"] = np.array([f"{attrs['SNAPSHOTS_SAVE_DIR']}{t}{'-reset' if r else ''}.png"
+                                        for t, r in zip(np.asarray(data["Time"]).tolist(), reset)], dtype=object)
+    for name, value in attrs.get("constants", {}).items():
+        derived[name] = np.full(n, value)
+    return derived
+
+
+def attrs_filename(filename):
+    """
+    Sidecar file with the attributes (constants) of an episode log: {name}.episode.npy --> {name}.episode.json
+    """
+    return f"{os.path.splitext(filename)[0]}.json"
+
+
+def write_attrs(filename, attrs):
+    """
+    Write the attributes of an episode log to its sidecar file
+    """
+    with open(attrs_filename(filename), 'w') as f:
+        json.dump(attrs, f, default=lambda value: value.tolist() if hasattr(value, "tolist") else str(value))
+
+
+def read_attrs(filename):
+    """
+    Read the attributes of an episode log (empty if it has no sidecar file)
+    """
+    if not os.path.isfile(attrs_filename(filename)):
+        return {}
+    with open(attrs_filename(filename)) as f:
+        return json.load(f)
+
+
+def to_records(columns, dtype):
+    """
+    Convert logged column arrays to a structured array
+    :param columns: Dictionary of column names and arrays (positions as arrays of shape (N, 2))
+    :param dtype:   Structured dtype from episode_dtype
+    :return:        Structured array
+    """
+    n = len(next(iter(columns.values())))
+    records = np.zeros(n, dtype=dtype)
+    for name, values in columns.items():
+        if values.ndim > 1:
+            for i, axis in enumerate("xyz"[:values.shape[1]]):
+                records[f"{name}_{axis}"] = values[:, i]
+        elif values.dtype == object:
+            records[name] = [str(value) for value in values]
+        else:
+            records[name] = values
+    return records
+
+
+def from_records(records):
+    """
+    Convert a structured array back to column arrays (the inverse of to_records)
+    :param records: Structured array from to_records, read_episode_log or recover_journal
+    :return:        Dictionary of column names and arrays (positions as arrays of shape (N, 2))
+    """
+    columns = {}
+    for name in records.dtype.names:
+        stem, _, axis = name.rpartition("_")
+        if axis in ("x", "y", "z") and stem and f"{stem}_x" in records.dtype.names and f"{stem}_y" in records.dtype.names:
+            if stem not in columns:
+                axes = [f"{stem}_{axis}" for axis in "xyz" if f"{stem}_{axis}" in records.dtype.names]
+                columns[stem] = np.stack([records[field] for field in axes], axis=1)
+        else:
+            columns[name] = records[name]
+    return columns
+
+
+class EpisodeLogWriter:
+
+    def __init__(self, filename, dtype, attrs=None):
+        """
+        Appendable structured .npy file: records are appended at the end and the shape in the (fixed size) header is
+        updated, so the file can be read with np.load at any time
+        :param filename:    Episode log filename (.npy)
+        :param dtype:       Structured dtype of the records
+        :param attrs:       Episode attributes stored once in a sidecar file instead of on every row
+        """
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        if attrs:
+            write_attrs(filename, attrs)
+
+        # Reserve enough header space for any row count
+        self._header_size = len(self._header(10**18, pad_to=0))
+        self._header_size = -(-self._header_size // 64) * 64
+
+        with open(self.filename, 'wb') as f:
+            f.write(self._header(0, pad_to=self._header_size))
+
+    def _header(self, length, pad_to):
+        """
+        .npy (version 1.0) header for a structured array of length rows, padded with spaces to pad_to bytes
+        """
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (length,)})
+        header_len = max(pad_to - len(_MAGIC) - 2, len(header) + 1)
+        header = header.ljust(header_len - 1) + '\n'
+        return _MAGIC + struct.pack('<H', header_len) + header.encode('latin1')
+
+    def append(self, records):
+        """
+        Append records to the file
+        :param records: Structured array of dtype self.dtype
+        """
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        with open(self.filename, 'r+b') as f:
+            f.seek(0, 2)
+            f.write(records.tobytes())
+            self.length += len(records)
+            f.seek(0)
+            f.write(self._header(self.length, pad_to=self._header_size))
+
+
+def read_episode_log(filename, mmap=False):
+    """
+    Read a binary episode log
+    :param filename:    Episode log filename (.npy)
+    :param mmap:        Memory map the file instead of reading it
+    :return:            Structured array
+    """
+    return np.load(filename, mmap_mode='r' if mmap else None)
@@ -0,0 +1,222 @@
+import os
+import re
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    source TEXT UNIQUE,         -- File the run was indexed from (metadata CSV or binary episode log)
+    kind TEXT,                  -- 'csv' or 'episode'
+    run_name TEXT,
+    date TEXT,
+    metadata_file TEXT,
+    snapshots_dir TEXT,
+    n_steps INTEGER,
+    t_start REAL,
+    t_end REAL,
+    vpp_min REAL,
+    vpp_max REAL,
+    frequency_min REAL,
+    frequency_max REAL,
+    file_mtime REAL,
+    file_size INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS run_parameters (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    vpp REAL,
+    frequency REAL,
+    action INTEGER,
+    n_steps INTEGER
+);
+CREATE INDEX IF NOT EXISTS run_parameters_vpp_action ON run_parameters (vpp, action);
+CREATE INDEX IF NOT EXISTS run_parameters_frequency ON run_parameters (frequency);
+"""
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+_PARAMETER_COLUMNS = ["Time", "Vpp", "Frequency", "Action"]
+
+
+class ExperimentCatalog:
+
+    def __init__(self, filename):
+        """
+        SQLite catalog of experiment runs with their parameter ranges and file locations
+        :param filename:    Catalog database file
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record_run(self, metadata, source, run_name=None, date=None, metadata_file=None, snapshots_dir=None,
+                   kind="episode"):
+        """
+        Add (or replace) a run in the catalog
+        :param metadata:        DataFrame with at least the Vpp, Frequency and Action columns (Time optional)
+        :param source:          File the run is stored in, unique key of the run
+        :param run_name:        EXPERIMENT_RUN_NAME
+        :param date:            Date of the run (YYYY-MM-DD)
+        :param metadata_file:   Metadata CSV of the run
+        :param snapshots_dir:   Folder with the snapshots of the run
+        :param kind:            'csv' or 'episode'
+        :return:                Id of the run
+        """
+        metadata = metadata.dropna(subset=["Vpp", "Frequency", "Action"])
+
+        # Store float32 parameters (episode logs) by their shortest representation, so they match the set values
+        for name in ("Vpp", "Frequency"):
+            if metadata[name].dtype == np.float32:
+                metadata = metadata.assign(**{name: metadata[name].astype(str).astype(float)})
+        stat = os.stat(source) if os.path.isfile(source) else None
+        time_column = metadata["Time"] if "Time" in metadata else pd.Series(dtype=float)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM runs WHERE source = ?", (source,))
+            cursor = self.connection.execute(
+                "INSERT INTO runs (source, kind, run_name, date, metadata_file, snapshots_dir, n_steps, t_start, t_end, "
+                "vpp_min, vpp_max, frequency_min, frequency_max, file_mtime, file_size, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, kind, run_name, date, metadata_file, snapshots_dir, len(metadata),
+                 _to_float(time_column.min()), _to_float(time_column.max()),
+                 _to_float(metadata["Vpp"].min()), _to_float(metadata["Vpp"].max()),
+                 _to_float(metadata["Frequency"].min()), _to_float(metadata["Frequency"].max()),
+                 stat.st_mtime if stat else None, stat.st_size if stat else None, time.time()))
+            run_id = cursor.lastrowid
+
+            # Number of steps per parameter combination
+            combinations = metadata.groupby(["Vpp", "Frequency", "Action"]).size()
+            self.connection.executemany(
+                "INSERT INTO run_parameters (run_id, vpp, frequency, action, n_steps) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, float(vpp), float(frequency), int(action), int(n))
+                 for (vpp, frequency, action), n in combinations.items()])
+
+        return run_id
+
+    def is_indexed(self, filename):
+        """
+        Check if a file is in the catalog and has not changed since
+        """
+        stat = os.stat(filename)
+        row = self.connection.execute("SELECT file_mtime, file_size FROM runs WHERE source = ?", (filename,)).fetchone()
+        return row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size
+
+    def index_file(self, filename, date=None):
+        """
+        Index a metadata CSV or binary episode log if it is new or changed
+        :param filename:    Metadata CSV or episode log (.episode.npy)
+        :param date:        Date of the run (taken from the folder name if None)
+        :return:            True if the file was (re)indexed
+        """
+        if self.is_indexed(filename):
+            return False
+
+        folder, basename = os.path.split(filename)
+        if date is None:
+            match = _DATE_PATTERN.search(os.path.basename(folder))
+            date = match.group(0) if match else None
+
+        if basename.endswith(".episode.npy"):
+            records = np.load(filename, mmap_mode='r')
+            metadata = pd.DataFrame({name: np.asarray(records[name]) for name in _PARAMETER_COLUMNS
+                                     if name in records.dtype.names})
+            episode_name = basename[:-len(".episode.npy")]
+            run_name = episode_name.rsplit("_", 1)[0]
+            kind = "episode"
+        else:
+            header = pd.read_csv(filename, nrows=0).columns
+            metadata = pd.read_csv(filename, usecols=[name for name in _PARAMETER_COLUMNS if name in header])
+            run_name = os.path.splitext(basename)[0]
+            kind = "csv"
+
+        if not {"Vpp", "Frequency", "Action"}.issubset(metadata.columns):
+            return False
+
+        self.record_run(metadata=metadata,
+                        source=filename,
+                        run_name=run_name,
+                        date=date,
+                        metadata_file=os.path.join(folder, f"{run_name}.csv"),
+                        snapshots_dir=os.path.join(folder, run_name),
+                        kind=kind)
+        return True
+
+    def scan(self, root):
+        """
+        Incrementally index all metadata CSVs and episode logs in the date folders (SAVE_DIR) under root. A CSV of a run
+        that also has episode logs is skipped (the episode logs hold the same rows), so every step is counted once
+        :param root:    Folder containing the date folders
+        :return:        Number of (re)indexed files
+        """
+        indexed = 0
+        for folder in sorted(os.listdir(root)):
+            path = os.path.join(root, folder)
+            if not (os.path.isdir(path) and _DATE_PATTERN.fullmatch(folder)):
+                continue
+            basenames = sorted(os.listdir(path))
+            logged_runs = {basename[:-len(".episode.npy")].rsplit("_", 1)[0] for basename in basenames
+                           if basename.endswith(".episode.npy")}
+            for basename in basenames:
+                if basename.endswith(".csv") and os.path.splitext(basename)[0] in logged_runs:
+                    self.remove(os.path.join(path, basename))  # Indexed before the run had episode logs
+                elif basename.endswith(".episode.npy") or (basename.endswith(".csv") and ".parsed" not in basename):
+                    try:
+                        indexed += self.index_file(os.path.join(path, basename), date=folder)
+                    except (ValueError, OSError, pd.errors.ParserError) as err:
+                        print(f"Could not index {basename}: {err}")
+        return indexed
+
+    def remove(self, source):
+        """
+        Remove a run from the catalog
+        :param source:  File the run was indexed from
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM runs WHERE source = ?", (source,))
+
+    def query(self, vpp=None, frequency=None, action=None, date=None, run_name=None, kind=None, tolerance=1e-6):
+        """
+        Find runs that contain steps with the given parameters
+        :param vpp:         Vpp
+        :param frequency:   Frequency
+        :param action:      Action
+        :param date:        Date (YYYY-MM-DD)
+        :param run_name:    EXPERIMENT_RUN_NAME
+        :param kind:        'csv' or 'episode'
+        :param tolerance:   Tolerance for comparing Vpp and Frequency
+        :return:            DataFrame of the matching runs with the number of matching steps
+        """
+        conditions, parameters = [], []
+        for column, value in (("p.vpp", vpp), ("p.frequency", frequency)):
+            if value is not None:
+                conditions.append(f"ABS({column} - ?) <= ?")
+                parameters += [value, tolerance]
+        for column, value in (("p.action", action), ("r.date", date), ("r.run_name", run_name), ("r.kind", kind)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return pd.read_sql_query(
+            "SELECT r.*, SUM(p.n_steps) AS matching_steps FROM runs r JOIN run_parameters p ON p.run_id = r.id "
+            f"{where} GROUP BY r.id ORDER BY r.date, r.t_start",
+            self.connection, params=parameters)
+
+
+def _to_float(value):
+    return None if pd.isna(value) else float(value)
+
+
+if __name__ == "__main__":
+
+    # Index all runs: python experiment_catalog.py <catalog.sqlite> <root folder with the date folders>
+    catalog = ExperimentCatalog(sys.argv[1])
+    print(f"Indexed {catalog.scan(sys.argv[2])} files")
+    print(catalog.query())
+    catalog.close()
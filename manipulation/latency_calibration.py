@@ -0,0 +1,212 @@
+import json
+import time
+import numpy as np
+from settings import *
+import settings
+from cluster_detection_and_tracking import TrackClusters, find_clusters
+
+
+def estimate_onset(times, displacements, resolution=10):
+    """
+    Onset of motion from the displacement after a switch, least squares fit of a hinge: no displacement before the
+    onset and a constant speed after it
+    :param times:           Frame times after the switch (s)
+    :param displacements:   Distance from the position at the switch (pixels)
+    :param resolution:      Candidate onsets per frame
+    :return:                Onset (s), speed (pixels/s) and residual standard deviation (pixels)
+    """
+    times = np.asarray(times, dtype=float)
+    displacements = np.asarray(displacements, dtype=float)
+    candidates = np.linspace(0, times[-3], resolution * len(times))  # The fit needs at least two frames after the onset
+
+    # Speed of every candidate onset in closed form, keep the best fit
+    hinges = np.maximum(times[np.newaxis, :] - candidates[:, np.newaxis], 0)
+    speeds = np.sum(hinges * displacements, axis=1) / np.maximum(np.sum(hinges ** 2, axis=1), 1e-12)
+    residuals = np.sum((displacements - speeds[:, np.newaxis] * hinges) ** 2, axis=1)
+    best = np.argmin(residuals)
+    return float(candidates[best]), float(speeds[best]), float(np.sqrt(residuals[best] / len(times)))
+
+
+def measure_onset(source, actuator, piezo, duration=1.0, min_displacement=5, fit_frames=10, filename=None):
+    """
+    Switch a piezo on and track the swarm until it moved
+    :param source:              Camera (snap)
+    :param actuator:            ActuatorPiezos
+    :param piezo:               Piezo (0-3)
+    :param duration:            Maximum tracking time after the switch (s)
+    :param min_displacement:    Displacement that counts as motion (pixels)
+    :param fit_frames:          Frames tracked after the swarm moved min_displacement (to fit its speed)
+    :param filename:            File name of the snapshots (overwritten every frame)
+    :return:                    Onset latency (s) or None if the swarm did not move, frame times (since the switch,
+                                middle of the snap) and displacements (along the direction of motion)
+    """
+    filename = SNAPSHOTS_SAVE_DIR + "calibration.png" if filename is None else filename
+
+    # Track the largest cluster from its position before the switch
+    img = source.snap(f_name=filename)
+    _, _, bboxes = find_clusters(image=img, amount_of_clusters=1)
+    tracker = TrackClusters(bbox=bboxes[0])
+    start, _ = tracker.reset(img=img)
+    t_switch = time.perf_counter()
+    actuator.move(piezo)
+
+    # Follow the swarm until it moved far enough (plus fit_frames to fit its speed)
+    times, positions = [], []
+    moved = None
+    while time.perf_counter() - t_switch < duration and (moved is None or len(times) < moved + fit_frames):
+        t0 = time.perf_counter()
+        img = source.snap(f_name=filename)
+        times.append((t0 + time.perf_counter()) / 2 - t_switch)
+        position, _ = tracker.update(img=img, target=start, action=piezo)
+        positions.append(np.subtract(position, start))
+        if moved is None and np.linalg.norm(positions[-1]) >= min_displacement:
+            moved = len(times)
+    actuator.stop()
+
+    if moved is None or len(times) < 3:
+        return None, times, [np.linalg.norm(position) for position in positions]
+
+    # Displacement along the direction of motion (tracking noise across it does not count)
+    direction = positions[-1] / np.linalg.norm(positions[-1])
+    displacements = np.dot(positions, direction)
+    onset, _, _ = estimate_onset(times, displacements)
+    return onset, times, displacements
+
+
+def summarize(latencies, misses):
+    """
+    Statistics of the onset latencies of one piezo and frequency
+    """
+    stats = {"n": len(latencies), "misses": misses, "samples": [round(latency, 4) for latency in latencies]}
+    if latencies:
+        latencies = np.array(latencies)
+        stats.update(median=round(float(np.median(latencies)), 4),
+                     p10=round(float(np.percentile(latencies, 10)), 4),
+                     p90=round(float(np.percentile(latencies, 90)), 4))
+    return stats
+
+
+def calibrate(source, actuator, function_generator, frequencies=None, vpp=20, n_trials=10, rest=1.0, **kwargs):
+    """
+    Measure the onset latency from switching a piezo on to the swarm moving, per piezo and frequency. The trials of the
+    piezos are interleaved so the swarm stays near its starting point
+    :param source:              Camera (snap)
+    :param actuator:            ActuatorPiezos
+    :param function_generator:  FunctionGenerator
+    :param frequencies:         Dictionary of piezo and frequencies (kHz), the resonance frequencies if None
+    :param vpp:                 Vpp during the calibration
+    :param n_trials:            Number of switches per piezo and frequency
+    :param rest:                Time with all piezos off between switches (s)
+    :param kwargs:              Arguments of measure_onset
+    :return:                    Dictionary of piezo --> frequency (kHz) --> statistics (s)
+    """
+    if frequencies is None:
+        frequencies = {piezo: [frequency] for piezo, frequency in PIEZO_RESONANCES.items()}
+    function_generator.set_vpp(vpp=vpp)
+    function_generator.turn_on()
+
+    latencies = {piezo: {frequency: [] for frequency in piezo_frequencies}
+                 for piezo, piezo_frequencies in frequencies.items()}
+    misses = {piezo: {frequency: 0 for frequency in piezo_frequencies}
+              for piezo, piezo_frequencies in frequencies.items()}
+    for trial in range(n_trials):
+        onsets = []
+        for piezo, piezo_frequencies in frequencies.items():
+            for frequency in piezo_frequencies:
+                function_generator.set_frequency(frequency=frequency)
+                time.sleep(rest)
+                onset, _, _ = measure_onset(source=source, actuator=actuator, piezo=piezo, **kwargs)
+                if onset is None:
+                    misses[piezo][frequency] += 1
+                    onsets.append(f"piezo {piezo} at {frequency}kHz -")
+                else:
+                    latencies[piezo][frequency].append(onset)
+                    onsets.append(f"piezo {piezo} at {frequency}kHz {onset * 1e3:.0f}ms")
+        print(f"Trial {trial + 1}/{n_trials}: {', '.join(onsets)}")
+
+    function_generator.turn_off()
+    return {piezo: {frequency: summarize(latencies[piezo][frequency], misses[piezo][frequency])
+                    for frequency in piezo_frequencies}
+            for piezo, piezo_frequencies in frequencies.items()}
+
+
+def save_latencies(latencies, filename=LATENCY_CALIBRATION_FILENAME, frame_time=None):
+    """
+    Store the calibration (JSON)
+    :param latencies:   Dictionary of piezo --> frequency (kHz) --> statistics
+    :param filename:    File name
+    :param frame_time:  Mean time between frames during the calibration (s), the resolution of the latencies
+    """
+    with open(filename, "w") as f:
+        json.dump({"created": time.time(),
+                   "frame_time": frame_time,
+                   "latencies": {str(piezo): {str(frequency): stats for frequency, stats in frequencies.items()}
+                                 for piezo, frequencies in latencies.items()}}, f, indent=1)
+
+
+def load_latencies(filename=LATENCY_CALIBRATION_FILENAME):
+    """
+    Read a calibration
+    :param filename:    File name
+    :return:            Dictionary of piezo --> frequency (kHz) --> statistics, empty if there is no calibration
+    """
+    try:
+        with open(filename) as f:
+            calibration = json.load(f)
+    except FileNotFoundError:
+        print(f"No onset latency calibration in {filename}")
+        return {}
+    return {int(piezo): {float(frequency): stats for frequency, stats in frequencies.items()}
+            for piezo, frequencies in calibration["latencies"].items()}
+
+
+def onset_latency(latencies, piezo, frequency=None, statistic="median"):
+    """
+    Calibrated onset latency of a piezo at the nearest calibrated frequency
+    :param latencies:   Calibration from load_latencies
+    :param piezo:       Piezo (0-3)
+    :param frequency:   Frequency (kHz), the median over all frequencies if None
+    :param statistic:   "median", "p10" or "p90"
+    :return:            Latency (s), 0 if the piezo was not calibrated
+    """
+    calibrated = {f: stats[statistic] for f, stats in latencies.get(piezo, {}).items() if statistic in stats}
+    if not calibrated:
+        return 0.0
+    if frequency is None:
+        return float(np.median(list(calibrated.values())))
+    return calibrated[min(calibrated, key=lambda f: abs(f - frequency))]
+
+
+def main(n_trials=10, vpp=20):
+    from environment_pipeline import open_devices, release_devices
+
+    settings.make_data_dirs()
+    devices = open_devices(['source', 'actuator', 'function_generator'])
+    devices['function_generator'].reset(vpp=vpp)
+
+    # Frame time (the resolution of the latencies)
+    filename = SNAPSHOTS_SAVE_DIR + "calibration.png"
+    t0 = time.perf_counter()
+    for _ in range(10):
+        devices['source'].snap(f_name=filename)
+    frame_time = (time.perf_counter() - t0) / 10
+
+    latencies = calibrate(source=devices['source'],
+                          actuator=devices['actuator'],
+                          function_generator=devices['function_generator'],
+                          vpp=vpp,
+                          n_trials=n_trials)
+    release_devices(devices)
+
+    save_latencies(latencies, frame_time=frame_time)
+    print(f"Frame time {frame_time * 1e3:.1f}ms")
+    for piezo, frequencies in latencies.items():
+        for frequency, stats in frequencies.items():
+            print(f"Piezo {piezo} at {frequency}kHz: median {stats.get('median', np.nan) * 1e3:.0f}ms "
+                  f"(p10 {stats.get('p10', np.nan) * 1e3:.0f}ms, p90 {stats.get('p90', np.nan) * 1e3:.0f}ms), "
+                  f"{stats['misses']} of {stats['n'] + stats['misses']} switches without motion")
+    print(f"Saved to {LATENCY_CALIBRATION_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
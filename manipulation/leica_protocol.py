@@ -0,0 +1,106 @@
+import random
+import time
+
+# Commands: [device number, command, (data length, data,) stop signal]
+SET_TARGET = 84  # 'T'
+GO = 71  # 'G'
+GET_POSITION = 97  # 'a'
+GET_TARGET = 116  # 't'
+GET_STATUS = 63  # '?'
+STOP = 58  # ':'
+RESET = bytes([255, 82])  # Reset device
+COORD_BYTES = 3  # Coordinates are 24-bit two's complement, least significant byte first
+COORD_MIN = -2**23
+COORD_MAX = 2**23 - 1
+
+
+def encode_coord(coord: int):
+    """
+    Coordinate to its 3-byte message
+    :param coord:   Coordinate (steps)
+    :return:        bytes
+    """
+    if not COORD_MIN <= coord <= COORD_MAX:
+        raise ValueError(f"Coordinate {coord} out of range [{COORD_MIN}, {COORD_MAX}]")
+    return int(coord).to_bytes(COORD_BYTES, 'little', signed=True)
+
+
+def decode_coord(msg: bytes):
+    """
+    3-byte message to its coordinate
+    :param msg: bytes
+    :return:    Coordinate (steps)
+    """
+    return int.from_bytes(msg, 'little', signed=True)
+
+
+def set_target_frame(motor: int, coord: int):
+    return bytes([motor, SET_TARGET, COORD_BYTES]) + encode_coord(coord) + bytes([STOP])
+
+
+def go_frame(motor: int):
+    return bytes([motor, GO, STOP])
+
+
+def query_frame(motor: int, command: int):
+    return bytes([motor, command, STOP])
+
+
+def move_frames(targets: dict):
+    """
+    Commands that set the targets of several motors and start them, to be written one at a time (the Leica needs
+    SLEEP_TIME between commands)
+    :param targets: Dictionary of motor and target position
+    :return:        List of bytes
+    """
+    frames = []
+    for motor, coord in targets.items():
+        frames += [set_target_frame(motor, int(coord)), go_frame(motor)]
+    return frames
+
+
+def read_exact(port, n: int, timeout: float):
+    """
+    Read exactly n bytes from a serial port
+    :param port:    serial.Serial (or any object with read and a timeout attribute)
+    :param n:       Number of bytes
+    :param timeout: Maximum waiting time (s)
+    :return:        bytes
+    """
+    deadline = time.perf_counter() + timeout
+    received = b""
+    port_timeout = port.timeout
+    try:
+        while len(received) < n:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"Received {len(received)} of {n} bytes within {timeout}s: {received}")
+            port.timeout = remaining
+            received += port.read(n - len(received))
+    finally:
+        port.timeout = port_timeout
+    return received
+
+
+def benchmark(n_samples=100000, seed=0):
+    """
+    Time encoding and decoding
+    :return:    Dictionary of microseconds per call
+    """
+    rng = random.Random(seed)
+    coords = [rng.randint(COORD_MIN, COORD_MAX) for _ in range(n_samples)]
+    messages = [encode_coord(coord) for coord in coords]
+
+    timings = {}
+    for name, function, inputs in (("encode", encode_coord, coords),
+                                   ("decode", decode_coord, messages)):
+        t0 = time.perf_counter()
+        for value in inputs:
+            function(value)
+        timings[name] = (time.perf_counter() - t0) / n_samples * 1e6
+        print(f"{name}: {timings[name]:.2f}us")
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -57,7 +57,7 @@ def main():
 
             print(f'FPS: {1 / ((time.time() - t0) / (action_steps * env_steps))}')
 
-            env.metadata.to_csv(METADATA_FILENAME)
+            env.metadata.flush()
 
     env.close()
 
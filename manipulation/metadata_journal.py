@@ -0,0 +1,155 @@
+import json
+import os
+import struct
+import sys
+import time
+import numpy as np
+from episode_log import write_attrs
+
+_MAGIC = b'SWARMJNL'
+
+
+class MetadataJournal:
+
+    def __init__(self, filename, dtype, fsync_every=50, attrs=None):
+        """
+        Append-only journal of metadata records, every record is written when it is produced and the file is synced
+        to disk every fsync_every records, so a crash loses at most that many records
+        :param filename:    Journal filename
+        :param dtype:       Structured dtype of the records
+        :param fsync_every: Number of records between fsyncs
+        :param attrs:       Episode attributes (stored in the header)
+        """
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.fsync_every = fsync_every
+        self._unsynced = 0
+
+        # Header: magic, header length and the record dtype and episode attributes as JSON
+        header = json.dumps({"descr": np.lib.format.dtype_to_descr(self.dtype),
+                             "created": time.time(),
+                             "attrs": attrs or {}}).encode()
+        self._file = open(filename, 'wb')
+        self._file.write(_MAGIC + struct.pack('<I', len(header)) + header)
+        self.sync()
+
+    def append(self, records):
+        """
+        Append records (structured array of dtype self.dtype)
+        """
+        self._file.write(np.ascontiguousarray(records, dtype=self.dtype).tobytes())
+        self._unsynced += len(records)
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """
+        Flush Python's buffer and fsync the journal
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self, remove=False):
+        """
+        Sync and close the journal
+        :param remove:  Remove the journal (when its records have safely been written elsewhere)
+        """
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+        if remove:
+            os.remove(self.filename)
+
+
+def _read_header(f, filename):
+    if f.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError(f'{filename} is not a metadata journal')
+    header_len, = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(header_len).decode())
+
+
+def journal_attrs(filename):
+    """
+    Episode attributes stored in the header of a journal
+    """
+    with open(filename, 'rb') as f:
+        return _read_header(f, filename).get("attrs", {})
+
+
+def recover_journal(filename):
+    """
+    Read all complete records of a journal (a partially written last record is dropped)
+    :param filename:    Journal filename
+    :return:            Structured array
+    """
+    with open(filename, 'rb') as f:
+        header = _read_header(f, filename)
+        data = f.read()
+
+    dtype = np.lib.format.descr_to_dtype(header["descr"])
+    n = len(data) // dtype.itemsize
+    return np.frombuffer(data[:n * dtype.itemsize], dtype=dtype).copy()
+
+
+def compact_journal(filename, episode_filename=None, csv_filename=None, remove=False):
+    """
+    Write the records of a journal to a binary episode log and/or CSV
+    :param filename:            Journal filename
+    :param episode_filename:    Binary episode log (.npy) to write
+    :param csv_filename:        CSV file to write (the metadata CSV layout of MetadataLogger, see csv_rows)
+    :param remove:              Remove the journal afterwards
+    :return:                    Recovered records
+    """
+    records = recover_journal(filename)
+    attrs = journal_attrs(filename)
+    if episode_filename:
+        np.save(episode_filename, records)
+        write_attrs(episode_filename, attrs)
+    if csv_filename:
+        from metadata_logger import MetadataLogger
+        MetadataLogger.from_records(records, attrs).csv_rows().to_csv(csv_filename)
+    if remove:
+        os.remove(filename)
+    return records
+
+
+def benchmark(filename="benchmark.journal", n_steps=20000, fsync_every=50):
+    """
+    Measure the per-step overhead of journaling SwarmEnv metadata rows: MetadataLogger.append end to end (storing the
+    row and encoding and writing its journal record) with and without the journal
+    :param filename:    Temporary journal filename
+    :param n_steps:     Number of steps
+    :param fsync_every: Number of records between fsyncs
+    :return:            Mean journaling overhead per step in microseconds
+    """
+    from metadata_logger import MetadataLogger, SWARM_ENV_COLUMNS
+
+    times = {}
+    for journal_filename in (None, filename):
+        logger = MetadataLogger(columns=SWARM_ENV_COLUMNS, journal_filename=journal_filename, save_rate=fsync_every)
+        t0 = time.perf_counter()
+        for step in range(n_steps):
+            logger.append(Time=time.time(), Vpp=10, Frequency=2000, Size=12, Action=step % 4, State=(150, 150),
+                          Target=(100, 200), Step=step, Reset=False)
+        times[journal_filename] = (time.perf_counter() - t0) / n_steps
+        if journal_filename:
+            logger.journal.close()
+            records = recover_journal(filename)
+            assert len(records) == n_steps and records["Step"][-1] == n_steps - 1
+            os.remove(filename)
+
+    overhead = times[filename] - times[None]
+    print(f"MetadataLogger.append: {times[None] * 1e6:.1f}us/step without journal, {times[filename] * 1e6:.1f}us/step "
+          f"with journal ({overhead * 1e6:.1f}us journaling overhead, fsync every {fsync_every} records)")
+    return overhead * 1e6
+
+
+if __name__ == "__main__":
+
+    # Recover a journal after a crash: python metadata_journal.py <journal> [<episode log .npy>] [<csv>]
+    if len(sys.argv) > 1:
+        compact_journal(*sys.argv[1:4])
+    else:
+        benchmark()
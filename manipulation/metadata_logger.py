@@ -0,0 +1,223 @@
+import os
+import numpy as np
+import pandas as pd
+from episode_log import EpisodeLogWriter, derive_columns, episode_dtype, from_records, to_records
+from metadata_journal import MetadataJournal
+
+# Columns logged by SwarmEnv and DataGatherEnv (name: dtype, with (dtype, 2) for positions), Filename and constants
+# like OFFSET_BOUNDS are not stored per row but derived from Time/Reset and the episode attributes. The CSV keeps the
+# legacy layout (see csv_rows), the compact columns are only used by the binary episode log and the journal
+SWARM_ENV_COLUMNS = {"Time": np.float64,
+                     "Vpp": np.float32,
+                     "Frequency": np.float32,
+                     "Size": np.float32,
+                     "Action": np.int8,
+                     "State": (np.int16, 2),
+                     "Target": (np.int16, 2),
+                     "Step": np.int32,
+                     "Reset": np.bool_}
+DATA_GATHER_ENV_COLUMNS = {"Time": np.float64,
+                           "Vpp": np.float32,
+                           "Frequency": np.float32,
+                           "Action": np.int8}
+
+
+class MetadataLogger:
+
+    def __init__(self, columns, filename=None, save_rate=None, chunk_size=4096, append=True, start_index=0,
+                 binary_filename=None, journal_filename=None, snapshots_dir=None, constants=None):
+        """
+        Columnar in-memory metadata log, rows are written into preallocated typed arrays that grow in chunks
+        :param columns:         Dictionary of column names and dtypes
+        :param filename:        CSV file the rows are flushed to
+        :param binary_filename: Binary episode log (structured .npy) the rows are flushed to
+        :param journal_filename: Append-only journal every row is written to when it is logged (synced every save_rate rows)
+        :param save_rate:       Flush every save_rate rows (None to only flush on request)
+        :param chunk_size:      Number of rows allocated at once
+        :param append:          Append to an existing CSV (otherwise the first flush overwrites it)
+        :param start_index:     Index of the first row in the CSV (number of rows already in the file when appending)
+        :param snapshots_dir:   SNAPSHOTS_SAVE_DIR, the Filename column is derived from it
+        :param constants:       Dictionary of values that are constant during the episode (e.g. OFFSET_BOUNDS), stored once
+        """
+        self.columns = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.filename = filename
+        self.save_rate = save_rate
+        self.chunk_size = chunk_size
+        self.append_to_file = append
+        self.start_index = start_index if append else 0
+        self.attrs = {"SNAPSHOTS_SAVE_DIR": snapshots_dir, "constants": dict(constants or {})}
+        self.record_dtype = episode_dtype(self.columns)  # Structured dtype of the episode log and journal records
+        self._record = np.zeros(1, dtype=self.record_dtype)  # Buffer of the journal record of the last row
+
+        # Preallocate arrays
+        self._data = {name: np.empty(chunk_size, dtype=dtype) for name, dtype in self.columns.items()}
+        self._capacity = chunk_size
+        self._len = 0
+        self._flushed = 0
+
+        # Binary episode log with numeric position columns
+        self.episode_log = None
+        if binary_filename:
+            self.episode_log = EpisodeLogWriter(filename=binary_filename,
+                                                dtype=self.record_dtype,
+                                                attrs=self.attrs)
+
+        # Crash-safe journal of every row
+        self.journal = None
+        if journal_filename:
+            self.journal = MetadataJournal(filename=journal_filename,
+                                           dtype=self.record_dtype,
+                                           fsync_every=save_rate or 1,
+                                           attrs=self.attrs)
+
+    @classmethod
+    def from_records(cls, records, attrs=None):
+        """
+        Logger holding already logged records (e.g. recovered from a journal after a crash), to write them in the
+        metadata CSV layout
+        :param records: Structured array as written to the binary episode log and journal
+        :param attrs:   Episode attributes (SNAPSHOTS_SAVE_DIR and constants)
+        :return:        MetadataLogger
+        """
+        attrs = attrs or {}
+        data = from_records(records)
+        logger = cls(columns={name: (values.dtype, values.shape[1]) if values.ndim > 1 else values.dtype
+                              for name, values in data.items()},
+                     chunk_size=max(len(records), 1),
+                     snapshots_dir=attrs.get("SNAPSHOTS_SAVE_DIR"),
+                     constants=attrs.get("constants"))
+        for name, values in data.items():
+            logger._data[name][:len(records)] = values
+        logger._len = len(records)
+        return logger
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, name):
+        """
+        Array of all logged values of a column
+        """
+        return self._data[name][:self._len]
+
+    def _grow(self):
+        """
+        Extend all arrays with another chunk
+        """
+        self._capacity += self.chunk_size
+        for name, array in self._data.items():
+            grown = np.empty(self._capacity, dtype=self.columns[name])
+            grown[:self._len] = array[:self._len]
+            self._data[name] = grown
+
+    def append(self, **row):
+        """
+        Add a row, missing columns are left undefined
+        :param row: Column values as keyword arguments
+        """
+        if self._len == self._capacity:
+            self._grow()
+
+        for name, value in row.items():
+            self._data[name][self._len] = value
+        self._len += 1
+
+        # Write the row to the journal right away
+        if self.journal is not None:
+            self.journal.append(self._last_record())
+
+        # Flush to file every save_rate rows
+        if self.save_rate and not self._len % self.save_rate:
+            self.flush()
+
+    def to_dataframe(self, start=0, stop=None):
+        """
+        Build a DataFrame of the logged rows with the derived Filename and constant columns (positions as lists, the
+        same as the previous per-frame DataFrame)
+        :param start:   First row
+        :param stop:    Last row (exclusive), None for all rows
+        :return:        pandas DataFrame
+        """
+        stop = self._len if stop is None else stop
+        columns = {name: array[start:stop] for name, array in self._data.items()}
+        derived = derive_columns(columns, self.attrs)
+
+        # Same column order as before: Filename, logged columns, constants
+        data = {"Filename": derived.pop("Filename")} if "Filename" in derived else {}
+        for name, values in columns.items():
+            data[name] = values.tolist() if values.ndim > 1 else values
+        data.update(derived)
+        return pd.DataFrame(data, index=pd.RangeIndex(self.start_index + start, self.start_index + stop))
+
+    def csv_rows(self, start=0, stop=None):
+        """
+        Build a DataFrame of the logged rows in the legacy metadata CSV layout: no Reset column and an empty Action on
+        reset rows (the binary episode log stores Reset and Action -1)
+        :param start:   First row
+        :param stop:    Last row (exclusive), None for all rows
+        :return:        pandas DataFrame
+        """
+        rows = self.to_dataframe(start=start, stop=stop)
+        if "Reset" in rows:
+            reset = rows.pop("Reset").to_numpy(dtype=bool)
+            if "Action" in rows:
+                rows["Action"] = rows["Action"].astype(object).where(~reset, None)
+        return rows
+
+    def _last_record(self):
+        """
+        Record of the last row (in a reused buffer), fields in the order of episode_dtype
+        """
+        values = []
+        for name, dtype in self.columns.items():
+            value = self._data[name][self._len - 1]
+            if dtype.subdtype is not None:
+                values.extend(value)
+            elif dtype == object:
+                values.append(str(value))
+            else:
+                values.append(value)
+        self._record[0] = tuple(values)
+        return self._record
+
+    def to_records(self, start=0, stop=None):
+        """
+        Build a structured array of the logged rows (positions as numeric {name}_x and {name}_y columns)
+        :param start:   First row
+        :param stop:    Last row (exclusive), None for all rows
+        :return:        Structured array
+        """
+        stop = self._len if stop is None else stop
+        return to_records({name: array[start:stop] for name, array in self._data.items()}, self.record_dtype)
+
+    def flush(self):
+        """
+        Append the rows that were not written yet to the CSV file and the binary episode log
+        """
+        if self._flushed == self._len:
+            return
+
+        if self.filename:
+
+            # Write the header if the file is new or should be overwritten
+            header = not os.path.isfile(self.filename) or (not self.append_to_file and self._flushed == 0)
+            mode = 'w' if (not self.append_to_file and self._flushed == 0) else 'a'
+            rows = self.csv_rows(start=self._flushed)
+
+            # Keep the columns of an existing file aligned with its header
+            if not header:
+                rows = rows.reindex(columns=pd.read_csv(self.filename, nrows=0, index_col=0).columns)
+            rows.to_csv(self.filename, mode=mode, header=header)
+
+        if self.episode_log is not None:
+            self.episode_log.append(self.to_records(start=self._flushed))
+
+        self._flushed = self._len
+
+    def close(self):
+        """
+        Flush all rows and remove the journal (its rows are now in the CSV and episode log)
+        """
+        self.flush()
+        if self.journal is not None:
+            self.journal.close(remove=True)
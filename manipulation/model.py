@@ -1,6 +1,8 @@
 import numpy as np
 from settings import *
+import settings
 import matplotlib.pyplot as plt
+from tiled_q_values import TiledQValues
 
 def random_action(nr_actions=4):
     """
@@ -15,6 +17,10 @@ def update_q_values(action, memory, q_values):
     # Filter for action
     if action in [0, 1, 2, 3]:
 
+        # Tiled Q values update themselves per tile
+        if isinstance(q_values, TiledQValues):
+            return q_values.update(action=action, memory=memory, gamma=GAMMA)
+
         # Get mean position of memory
         mean_pos = np.mean(memory, 0, dtype=int)
 
@@ -25,7 +31,7 @@ def update_q_values(action, memory, q_values):
         kernel_slice_y = slice(300 - mean_pos[0], 600 - mean_pos[0])
 
         # Update q values
-        q_values[action] = GAMMA * q_values[action] + (1-GAMMA) * Q_VALUES_UPDATE_KERNEL[kernel_slice_x, kernel_slice_y] * avg_speed
+        q_values[action] = GAMMA * q_values[action] + (1-GAMMA) * settings.Q_VALUES_UPDATE_KERNEL[kernel_slice_x, kernel_slice_y] * avg_speed
 
 
         return q_values
@@ -34,13 +40,14 @@ def update_q_values(action, memory, q_values):
         return q_values
 
 
-def calc_action(pos0, offset, q_values=None, mode='naive'):
+def calc_action(pos0, offset, q_values=None, mode='naive', dynamics=None):
     """
-    Calculate optimal piezo to actuate
-    :param pos0:    Swarm position
-    :param offset:  Offset to target
-    :param mode:    Selection mode
-    :return:        integer from 0 to NR_OF_PIEZOS
+    Calculate optimal piezo to actuate, or a random piezo with probability EPSILON (in every mode)
+    :param pos0:        Swarm position
+    :param offset:      Offset to target
+    :param mode:        Selection mode
+    :param dynamics:    DynamicsTable (only used in the learned mode)
+    :return:            integer from 0 to NR_OF_PIEZOS
     """
 
     if np.random.rand() < EPSILON:
@@ -70,7 +77,7 @@ def calc_action(pos0, offset, q_values=None, mode='naive'):
         ROI = q_values[:, slice(max(pos0[0] - MAX_VELO, 0), max(pos0[0] + MAX_VELO, 0)),
                              slice(max(pos0[1] - MAX_VELO, 0), max(pos0[1] + MAX_VELO, 0)),
                              slice(0, 2)]
-        action = np.unravel_index(np.argmin(np.linalg.norm(ROI - offset, axis=-1)), ROI.shape)[0]
+        action = np.unravel_index(np.argmin(np.linalg.norm(ROI - offset, axis=-1)), ROI.shape[:-1])[0]
         return (action + 2) % 4
 
     # Choose action from ROI of the vector field based on the average of ROI - offset
@@ -81,9 +88,109 @@ def calc_action(pos0, offset, q_values=None, mode='naive'):
         action = np.argmin(np.linalg.norm(np.average(ROI, axis=(1, 2)) - offset, axis=-1))
         return (action + 2) % 4
 
+    # Choose action from the precompiled lookup table of the learned dynamics
+    elif mode == 'learned':
+        action, _, _ = dynamics.query(pos0=pos0, offset=offset)
+        return action
+
+    else:
+        raise ValueError(f'Mode {mode} is unvalid')
+
+def _roi_windows(positions, q_values, max_velo=MAX_VELO):
+    """
+    Gather the (2*max_velo, 2*max_velo) ROI around every position, the batched equivalent of the slicing in calc_action
+    :param positions:   Swarm positions, shape (N, 2)
+    :param q_values:    Q values, shape (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2)
+    :param max_velo:    Half width of the ROI
+    :return:            ROI values of shape (NR_OF_PIEZOS, N, 2*max_velo, 2*max_velo, 2) and validity mask of shape (N, 2*max_velo, 2*max_velo)
+    """
+    steps = np.arange(-max_velo, max_velo)
+    xs = positions[:, 0, np.newaxis] + steps
+    ys = positions[:, 1, np.newaxis] + steps
+
+    # Pixels outside the field are not part of the ROI (same as the clipped slices in calc_action)
+    valid_x = (xs >= 0) & (xs < q_values.shape[1])
+    valid_y = (ys >= 0) & (ys < q_values.shape[2])
+    mask = valid_x[:, :, np.newaxis] & valid_y[:, np.newaxis, :]
+
+    xs = np.clip(xs, 0, q_values.shape[1] - 1)
+    ys = np.clip(ys, 0, q_values.shape[2] - 1)
+
+    return q_values[:, xs[:, :, np.newaxis], ys[:, np.newaxis, :], :], mask
+
+
+def calc_actions(positions, offsets, q_values=None, mode='naive', rng=None, epsilon=EPSILON, chunk_size=1024,
+                 dynamics=None):
+    """
+    Calculate optimal piezo to actuate for a batch of positions, vectorised version of calc_action
+    :param positions:   Swarm positions, shape (N, 2)
+    :param offsets:     Offsets to target, shape (N, 2)
+    :param q_values:    Q values, shape (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2)
+    :param mode:        Selection mode (same modes as calc_action)
+    :param rng:         numpy Generator used for exploration and the straight_line mode
+    :param epsilon:     Exploration coefficient
+    :param chunk_size:  Number of positions per chunk for the ROI modes (bounds memory use)
+    :param dynamics:    DynamicsTable (only used in the learned mode)
+    :return:            integer array of shape (N,) from 0 to NR_OF_PIEZOS
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+    n = len(offsets)
+
+    # Draw exploration first, like calc_action does
+    explore = rng.random(n) < epsilon
+
+    # Same as walk_to_pixel function
+    if mode == 'naive':
+        axis = np.argmax(np.abs(offsets), axis=1)
+        actions = axis + 2 * (np.sign(offsets[np.arange(n), axis]) != -1)
+
+    elif mode == 'straight_line':
+        abs_offsets = np.abs(offsets)
+        total = np.sum(abs_offsets, axis=1)
+        p_x = np.divide(abs_offsets[:, 0], total, out=np.full(n, 0.5), where=total > 0)
+        axis = (rng.random(n) >= p_x).astype(int)
+        actions = axis + 2 * (np.sign(offsets[np.arange(n), axis]) != -1)
+
+    # Choose action from single vector in every position
+    elif mode == 'single_choice':
+        single_points = q_values[:, positions[:, 0], positions[:, 1], :]
+        actions = np.argmin(np.linalg.norm(single_points - offsets, axis=-1), axis=0)
+
+    # Choose action from ROI of the vector field based on the minimum/average of ROI - offset
+    elif mode in ('max', 'avg'):
+        actions = np.empty(n, dtype=int)
+        for start in range(0, n, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            ROI, mask = _roi_windows(positions[chunk], q_values)
+            if mode == 'max':
+                norms = np.linalg.norm(ROI - offsets[np.newaxis, chunk, np.newaxis, np.newaxis, :], axis=-1)
+                norms = np.where(mask, norms, np.inf)
+                actions[chunk] = np.argmin(np.min(norms, axis=(2, 3)), axis=0)
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    average = np.sum(ROI * mask[..., np.newaxis], axis=(2, 3)) / np.sum(mask, axis=(1, 2))[:, np.newaxis]
+                actions[chunk] = np.argmin(np.linalg.norm(average - offsets[chunk], axis=-1), axis=0)
+
+    # The lookup table returns actions directly (undo the remapping below)
+    elif mode == 'learned':
+        actions, _, _ = dynamics.query_batch(positions=positions, offsets=offsets)
+        actions = (actions - 2) % 4
+
     else:
         raise ValueError(f'Mode {mode} is unvalid')
 
+    actions = (actions + 2) % 4
+
+    # Replace exploring entries with random actions
+    if np.any(explore):
+        actions = np.where(explore, rng.integers(low=0, high=4, size=n), actions)
+
+    return actions
+
 def walk_to_pixel(blob_pos, target_pos):
 
     offsets = - np.subtract(target_pos[0], blob_pos[0]), - np.subtract(target_pos[1], blob_pos[1])
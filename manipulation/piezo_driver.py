@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+import serial
+
+OFF = 9  # Command that turns all piezo outputs LOW
+
+
+def switch_frame(action):
+    """
+    Single message that switches to a piezo: all outputs LOW followed by the new output HIGH
+    :param action:  Piezo (0-3), None or OFF to only turn all outputs LOW
+    :return:        Bytes to write
+    """
+    if action is None or action == OFF:
+        return b"9"
+    assert action in [0, 1, 2, 3]  # Check if piezo is valid
+    return b"9" + str(action).encode()
+
+
+class PiezoDriver:
+
+    def __init__(self, port, baudrate, ack=False, ack_timeout=0.1, greeting_timeout=2):
+        """
+        Piezo Arduino driver, switch commands are written as one message by a background thread so send() never blocks
+        the control loop. Only the newest pending command is written (an older command that was not written yet is
+        dropped, it would be switched off right away anyway)
+        :param port:                Serial port of the Arduino
+        :param baudrate:            Baudrate
+        :param ack:                 Wait for the Arduino to echo every command byte and record the round trip time
+        :param ack_timeout:         Maximum time to wait for an acknowledgement (s)
+        :param greeting_timeout:    Maximum time to wait for the greeting line of the Arduino (s)
+        """
+        self.serial = serial.Serial(port=port, baudrate=baudrate, timeout=greeting_timeout)
+        print(f"Arduino: {self.serial.readline().decode().strip()}")
+        self.serial.timeout = ack_timeout
+        self.ack = ack
+
+        # Statistics
+        self.write_times = deque(maxlen=1000)  # Time spent in serial write (s)
+        self.round_trip_times = deque(maxlen=1000)  # Write --> acknowledgement (s)
+        self.sent = 0
+        self.dropped = 0
+        self.missed_acks = 0
+
+        # Latest-wins slot shared with the writer thread
+        self._condition = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._running = True
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+        # Turn all outputs LOW
+        self.send(OFF)
+
+    def send(self, action):
+        """
+        Queue a switch command, returns immediately
+        :param action:  Piezo (0-3) or OFF
+        """
+        frame = switch_frame(action)
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = frame
+            self._condition.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while self._pending is None and self._running:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                frame, self._pending = self._pending, None
+                self._busy = True
+            self._write(frame)
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def _write(self, frame):
+        """
+        Write one frame and wait for its acknowledgement (if enabled)
+        """
+        t0 = time.perf_counter()
+        self.serial.write(frame)
+        self.write_times.append(time.perf_counter() - t0)
+        self.sent += 1
+
+        if self.ack:
+            echo = self.serial.read(len(frame))
+            if echo == frame:
+                self.round_trip_times.append(time.perf_counter() - t0)
+            else:
+                self.missed_acks += 1
+                self.serial.reset_input_buffer()
+
+    def flush(self, timeout=1.0):
+        """
+        Wait until all queued commands are written
+        :param timeout: Maximum waiting time (s)
+        :return:        True if everything was written
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._busy, timeout=timeout)
+
+    def stats(self):
+        """
+        Timing statistics of the written commands (ms)
+        """
+        stats = {"sent": self.sent, "dropped": self.dropped, "missed_acks": self.missed_acks}
+        for name, times in (("write", self.write_times), ("round_trip", self.round_trip_times)):
+            if times:
+                times = np.array(times) * 1e3
+                stats[f"{name}_mean"] = round(float(times.mean()), 4)
+                stats[f"{name}_p95"] = round(float(np.percentile(times, 95)), 4)
+                stats[f"{name}_max"] = round(float(times.max()), 4)
+        return stats
+
+    def close(self):
+        """
+        Turn all outputs LOW, stop the writer thread and close the serial connection
+        """
+        self.send(OFF)
+        self.flush()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=1.0)
+        self.serial.close()
+
+
+def benchmark(n_steps=1000, ack=True):
+    """
+    Compare the legacy two-write switching with PiezoDriver on a pty loopback Arduino
+    :param n_steps: Number of switch commands
+    :param ack:     Measure round trip times with acknowledgements
+    :return:        Statistics of PiezoDriver
+    """
+    from serial_loopback import LoopbackArduino
+
+    # Legacy: two synchronous writes on the control thread
+    device = LoopbackArduino()
+    arduino = serial.Serial(port=device.port, baudrate=115200, timeout=2)
+    arduino.readline()
+    t0 = time.perf_counter()
+    for step in range(n_steps):
+        arduino.write(b"9")  # Turn old piezo off
+        arduino.write(f"{step % 4}".encode())  # Turn new piezo on
+    t_legacy = (time.perf_counter() - t0) / n_steps
+    arduino.close()
+    device.close()
+
+    # One message per switch, written by the background thread
+    device = LoopbackArduino(ack=ack)
+    driver = PiezoDriver(port=device.port, baudrate=115200, ack=ack)
+    t_send = 0
+    for step in range(n_steps):
+        t0 = time.perf_counter()
+        driver.send(step % 4)
+        t_send += time.perf_counter() - t0
+        if ack:
+            driver.flush()  # One command in flight at a time, so every command gets a round trip time
+    t_send /= n_steps
+    driver.close()
+    device.close()
+
+    stats = driver.stats()
+    print(f"Legacy two writes: {t_legacy * 1e6:.1f}us/step on the control thread")
+    print(f"PiezoDriver send: {t_send * 1e6:.1f}us/step, {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+import numpy as np
+
+
+class QValueCheckpoints:
+
+    def __init__(self, directory, tile_size=50, atol=1e-3):
+        """
+        Incremental checkpoints of the Q values, only tiles that changed since the last checkpoint are written. Tiles
+        hold one action each, an update of one action (which decays its whole plane) leaves the other actions' tiles
+        :param directory:   Folder for the tiles and the manifest
+        :param tile_size:   Size of the square spatial tiles (pixels)
+        :param atol:        Tiles whose values changed less than atol since the last checkpoint are not rewritten, the
+                            checkpoint is then at most atol off (0.0 rewrites every tile the decay touched)
+        """
+        self.directory = directory
+        self.tile_size = tile_size
+        self.atol = atol
+        self.manifest_filename = os.path.join(directory, "manifest.json")
+        self.metrics = {"saves": 0, "tiles": 0, "bytes": 0, "last_tiles": 0, "last_bytes": 0}
+
+        if not os.path.isdir(os.path.join(directory, "tiles")):
+            os.makedirs(os.path.join(directory, "tiles"))
+
+        # Continue from the latest checkpoint in this folder (if any)
+        self.manifest = self.read_manifest()
+        self._saved = self.restore()
+
+    def read_manifest(self):
+        """
+        Read the manifest of the latest checkpoint
+        :return:    Manifest dictionary or None if there is no checkpoint yet
+        """
+        try:
+            with open(self.manifest_filename) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _tiles(self, shape):
+        """
+        Iterate over the tiles of a Q values array, one spatial tile of one action each
+        :param shape:   Shape of the Q values (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2)
+        :return:        Generator of tile keys and index tuples
+        """
+        for action in range(shape[0]):
+            for i in range(0, shape[1], self.tile_size):
+                for j in range(0, shape[2], self.tile_size):
+                    yield f"{action}_{i}_{j}", (action, slice(i, i + self.tile_size), slice(j, j + self.tile_size),
+                                                slice(None))
+
+    def save(self, q_values, step):
+        """
+        Write the tiles that changed since the last checkpoint and update the manifest
+        :param q_values:    Q values to checkpoint
+        :param step:        Environment step of the checkpoint
+        :return:            Number of tiles written (the tiles and bytes of every save are counted in metrics)
+        """
+        q_values = np.asarray(q_values)
+
+        # Start from scratch if there is no (compatible) previous checkpoint, the old tiles are removed afterwards
+        version = 0 if self.manifest is None else self.manifest["version"] + 1
+        superseded = []
+        if self._saved is None or self._saved.shape != q_values.shape or self.manifest["tile_size"] != self.tile_size \
+                or not self.manifest.get("tile_per_action"):
+            superseded = [] if self.manifest is None else list(self.manifest["tiles"].values())
+            self._saved = None
+            tiles = {}
+        else:
+            tiles = dict(self.manifest["tiles"])
+
+        # Write changed tiles under a new version so the previous checkpoint stays valid until the manifest is replaced.
+        # Tiles are compared with their saved values (not the values of the last save), so skipped tiles never drift
+        # more than atol from the checkpoint
+        fresh = self._saved is None
+        saved = np.empty_like(q_values) if fresh else self._saved.copy()
+        written = 0
+        written_bytes = 0
+        for key, index in self._tiles(q_values.shape):
+            tile = q_values[index]
+            if not fresh and np.all(np.abs(tile - saved[index]) <= self.atol):
+                continue
+            filename = os.path.join("tiles", f"{key}_{version}.npy")
+            np.save(os.path.join(self.directory, filename), tile)
+            written_bytes += os.path.getsize(os.path.join(self.directory, filename))
+            if key in tiles:
+                superseded.append(tiles[key])
+            tiles[key] = filename
+            saved[index] = tile
+            written += 1
+
+        # Atomically replace the manifest
+        manifest = {"shape": list(q_values.shape),
+                    "dtype": str(q_values.dtype),
+                    "tile_size": self.tile_size,
+                    "tile_per_action": True,
+                    "version": version,
+                    "step": int(step),
+                    "time": round(time.time(), 3),
+                    "tiles": tiles}
+        with open(self.manifest_filename + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_filename + ".tmp", self.manifest_filename)
+        self.manifest = manifest
+
+        # Remove tiles that are no longer referenced
+        for filename in superseded:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+        self._saved = saved
+        self.metrics["saves"] += 1
+        self.metrics["tiles"] += written
+        self.metrics["bytes"] += written_bytes
+        self.metrics["last_tiles"] = written
+        self.metrics["last_bytes"] = written_bytes
+        return written
+
+    def restore(self):
+        """
+        Assemble the Q values of the latest checkpoint
+        :return:    Q values or None if there is no checkpoint yet
+        """
+        manifest = self.read_manifest()
+        if manifest is None:
+            return None
+
+        q_values = np.empty(manifest["shape"], dtype=manifest["dtype"])
+        tile_size = manifest["tile_size"]
+        for key, filename in manifest["tiles"].items():
+            *action, i, j = map(int, key.split("_"))  # Checkpoints without tile_per_action have tiles of all actions
+            action = action[0] if action else slice(None)
+            q_values[action, i:i + tile_size, j:j + tile_size, :] = np.load(os.path.join(self.directory, filename))
+
+        return q_values
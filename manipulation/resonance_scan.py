@@ -0,0 +1,197 @@
+import json
+import time
+import numpy as np
+from settings import *
+import settings
+from cluster_detection_and_tracking import TrackClusters, find_clusters
+from latency_calibration import load_latencies, onset_latency
+
+
+def track_sweep(source, actuator, channel, piezo, filename=None):
+    """
+    Actuate a piezo during one frequency sweep and track the swarm with every frame
+    :param source:      Camera (snap)
+    :param actuator:    ActuatorPiezos
+    :param channel:     FuncGenChannel with a configured sweep (set_sweep)
+    :param piezo:       Piezo (0-3)
+    :param filename:    File name of the snapshots (overwritten every frame)
+    :return:            Frame times (time.perf_counter(), middle of the snap) and swarm positions (x, y)
+    """
+    filename = SNAPSHOTS_SAVE_DIR + "resonance_scan.png" if filename is None else filename
+
+    # Track the largest cluster from its position before the sweep
+    img = source.snap(f_name=filename)
+    _, _, bboxes = find_clusters(image=img, amount_of_clusters=1)
+    tracker = TrackClusters(bbox=bboxes[0])
+    start, _ = tracker.reset(img=img)
+    actuator.move(piezo)
+    times = [channel.start_sweep()]
+    positions = [start]
+
+    # One continuous acquisition until the sweep reaches the stop frequency
+    while channel.sweep_remaining() > 0:
+        t0 = time.perf_counter()
+        img = source.snap(f_name=filename)
+        times.append((t0 + time.perf_counter()) / 2)
+        position, _ = tracker.update(img=img, target=start, action=piezo)
+        positions.append(position)
+    actuator.stop()
+    return np.array(times), np.array(positions, dtype=float)
+
+
+def frequency_response(frequencies, times, positions, n_bins=100, window=5, frequency_range=None):
+    """
+    Speed of the swarm per frequency bin, from the net displacement along the overall direction of motion in a window
+    of bins around it (tracking jitter and the random motion of the swarm cancel instead of adding up)
+    :param frequencies:     Frequency of every frame interval (kHz), NaN outside the sweep
+    :param times:           Frame times (s)
+    :param positions:       Swarm positions (x, y), one more than frequencies
+    :param n_bins:          Number of frequency bins
+    :param window:          Number of bins the displacement is summed over (odd)
+    :param frequency_range: Range of the bins (kHz), the range of the frequencies if None
+    :return:                Bin centers (kHz) and speeds (pixels/s, NaN for bins without frames)
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    valid = ~np.isnan(frequencies)
+    if frequency_range is None:
+        frequency_range = (np.min(frequencies[valid]), np.max(frequencies[valid]))
+    edges = np.linspace(min(frequency_range), max(frequency_range), n_bins + 1)
+    bins = np.clip(np.digitize(frequencies[valid], edges) - 1, 0, n_bins - 1)
+
+    # Displacement along the direction of the net motion during the sweep
+    displacements = np.diff(positions, axis=0)[valid]
+    net = displacements.sum(axis=0)
+    direction = net / np.linalg.norm(net) if np.linalg.norm(net) > 0 else np.zeros(2)
+    moved = np.bincount(bins, weights=displacements @ direction, minlength=n_bins)
+    dt = np.bincount(bins, weights=np.diff(times)[valid], minlength=n_bins)
+
+    # Sum over the window of bins
+    kernel = np.ones(window)
+    moved, dt = np.convolve(moved, kernel, mode="same"), np.convolve(dt, kernel, mode="same")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        speeds = np.where(dt > 0, moved / dt, np.nan)
+    return (edges[:-1] + edges[1:]) / 2, speeds
+
+
+def find_resonance(centers, speeds):
+    """
+    Frequency of the highest speed, refined with a parabola through the neighbouring bins
+    :param centers: Bin centers (kHz)
+    :param speeds:  Speeds (pixels/s)
+    :return:        Resonance frequency (kHz), None if no bin has frames
+    """
+    if np.all(np.isnan(speeds)):
+        return None
+    peak = int(np.nanargmax(speeds))
+    if 0 < peak < len(speeds) - 1 and not np.isnan(speeds[peak - 1:peak + 2]).any():
+        left, center, right = speeds[peak - 1:peak + 2]
+        curvature = left - 2 * center + right
+        if curvature < 0:
+            shift = 0.5 * (left - right) / curvature
+            return float(centers[peak] + shift * (centers[1] - centers[0]))
+    return float(centers[peak])
+
+
+def scan(source, actuator, function_generator, piezos=None, frequency_range=RESONANCE_SCAN_RANGE,
+         sweep_time=RESONANCE_SCAN_TIME, vpp=20, n_bins=100, window=5, rest=1.0, latencies=None, **kwargs):
+    """
+    Sweep the frequency once per piezo and find the frequency that moves the swarm fastest. The frame times are mapped
+    to the instantaneous frequency of the sweep, shifted by the calibrated onset latency of the piezo
+    :param source:              Camera (snap)
+    :param actuator:            ActuatorPiezos
+    :param function_generator:  FunctionGenerator
+    :param piezos:              Piezos to scan, all piezos of PIEZO_RESONANCES if None
+    :param frequency_range:     Start and stop frequency (kHz), or a dictionary of piezo and range
+    :param sweep_time:          Duration of each sweep (s)
+    :param vpp:                 Vpp during the scan
+    :param n_bins:              Number of frequency bins of the response
+    :param window:              Number of bins the displacement is summed over (see frequency_response)
+    :param rest:                Time with all piezos off between sweeps (s)
+    :param latencies:           Onset latency calibration (load_latencies), read from LATENCY_CALIBRATION_FILENAME if None
+    :param kwargs:              Arguments of track_sweep
+    :return:                    Dictionary of piezo --> resonance (kHz), bin centers (kHz) and speeds (pixels/s)
+    """
+    piezos = list(PIEZO_RESONANCES) if piezos is None else piezos
+    latencies = load_latencies() if latencies is None else latencies
+    function_generator.set_vpp(vpp=vpp)
+
+    results = {}
+    try:
+        for piezo in piezos:
+            start, stop = frequency_range[piezo] if isinstance(frequency_range, dict) else frequency_range
+            function_generator.set_sweep(start=start, stop=stop, sweep_time=sweep_time)
+            function_generator.turn_on()
+            time.sleep(rest)
+
+            channel = function_generator.AFG3000
+            times, positions = track_sweep(source=source, actuator=actuator, channel=channel, piezo=piezo, **kwargs)
+            delay = onset_latency(latencies, piezo)
+            frequencies = channel.frequency_at((times[:-1] + times[1:]) / 2, delay=delay) / 1e3
+            centers, speeds = frequency_response(frequencies, times, positions, n_bins=n_bins, window=window,
+                                                 frequency_range=(start, stop))
+            results[piezo] = {"resonance": find_resonance(centers, speeds),
+                              "frames": len(times),
+                              "delay": delay,
+                              "frequencies": [round(float(f), 3) for f in centers],
+                              "speeds": [None if np.isnan(s) else round(float(s), 3) for s in speeds]}
+            print(f"Piezo {piezo}: {len(times)} frames from {start} to {stop}kHz in {times[-1] - times[0]:.1f}s, "
+                  f"resonance {results[piezo]['resonance']}kHz")
+    finally:
+        function_generator.stop_sweep()
+        function_generator.turn_off()
+    return results
+
+
+def save_resonances(results, filename=RESONANCE_SCAN_FILENAME, sweep_time=RESONANCE_SCAN_TIME):
+    """
+    Store the scan (JSON)
+    :param results:     Dictionary of piezo --> resonance and response from scan
+    :param filename:    File name
+    :param sweep_time:  Duration of each sweep (s)
+    """
+    with open(filename, "w") as f:
+        json.dump({"created": time.time(),
+                   "sweep_time": sweep_time,
+                   "piezos": {str(piezo): result for piezo, result in results.items()}}, f, indent=1)
+
+
+def load_resonances(filename=RESONANCE_SCAN_FILENAME):
+    """
+    Read the resonance frequencies of a scan
+    :param filename:    File name
+    :return:            Dictionary of piezo and resonance frequency (kHz) like PIEZO_RESONANCES, empty if there is no
+                        scan
+    """
+    try:
+        with open(filename) as f:
+            scanned = json.load(f)
+    except FileNotFoundError:
+        print(f"No resonance scan in {filename}")
+        return {}
+    return {int(piezo): result["resonance"] for piezo, result in scanned["piezos"].items()
+            if result["resonance"] is not None}
+
+
+def main(vpp=20, sweep_time=RESONANCE_SCAN_TIME):
+    from environment_pipeline import open_devices, release_devices
+
+    settings.make_data_dirs()
+    devices = open_devices(['source', 'actuator', 'function_generator'])
+    devices['function_generator'].reset(vpp=vpp)
+
+    results = scan(source=devices['source'],
+                   actuator=devices['actuator'],
+                   function_generator=devices['function_generator'],
+                   vpp=vpp,
+                   sweep_time=sweep_time)
+    release_devices(devices)
+
+    save_resonances(results, sweep_time=sweep_time)
+    resonances = {piezo: round(result["resonance"]) for piezo, result in results.items()
+                  if result["resonance"] is not None}
+    print(f"PIEZO_RESONANCES = {resonances}  # kHz (currently {PIEZO_RESONANCES})")
+    print(f"Saved to {RESONANCE_SCAN_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import abc
+import os
+import threading
+import time
+import tty
+import leica_protocol as protocol
+
+
+class PtyDevice(abc.ABC):
+
+    def __init__(self, greeting=b"", greeting_delay=0.2):
+        """
+        Serial device stand-in on a pseudo terminal (POSIX only): open self.port with serial.Serial like the real
+        device, the bytes written to it are passed to handle() on a background thread
+        :param greeting:        Bytes the device sends when it starts (e.g. the Arduino greeting line)
+        :param greeting_delay:  Time before the greeting is sent (s), the host flushes its input when opening the port
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # No echo or line editing
+        self.port = os.ttyname(self.slave)
+        self.received = bytearray()
+        self._running = True
+        if greeting:
+            threading.Timer(greeting_delay, self.reply, args=(greeting,)).start()
+
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                break
+            if not data:
+                break
+            self.received += data
+            self.handle(data)
+
+    @abc.abstractmethod
+    def handle(self, data):
+        """
+        Process bytes written by the host
+        """
+
+    def reply(self, data):
+        """
+        Send bytes to the host
+        """
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass  # Closed
+
+    def close(self):
+        self._running = False
+        for fd in (self.slave, self.master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class LoopbackArduino(PtyDevice):
+
+    def __init__(self, ack=False, latency=0.0):
+        """
+        Stand-in for the piezo Arduino: b"9" turns all outputs LOW, a digit 0-3 turns that output HIGH
+        :param ack:     Acknowledge every digit by echoing it (the acknowledgement mode of PiezoDriver)
+        :param latency: Simulated processing time per command (s)
+        """
+        self.ack = ack
+        self.latency = latency
+        self.outputs = [False, False, False, False]
+        self.switches = 0
+        self.switch_time = time.perf_counter()  # Time the outputs last changed
+        super().__init__(greeting=b"Arduino loopback ready\n")
+
+    def handle(self, data):
+        for byte in data:
+            if self.latency:
+                time.sleep(self.latency)
+            char = chr(byte)
+            if char == "9":
+                self.outputs = [False, False, False, False]
+            elif char in "0123":
+                self.outputs[int(char)] = True
+                self.switches += 1
+            else:
+                continue
+            self.switch_time = time.perf_counter()
+            if self.ack:
+                self.reply(bytes([byte]))
+
+
+class LoopbackLeica(PtyDevice):
+
+    def __init__(self, speed=50000, motors=(0, 1, 2)):
+        """
+        Stand-in for the Leica xy-platform: motors move to their target with a constant speed after a go command
+        Commands: [motor, 'T', 3, 3-byte coordinate, ':'] set target, [motor, 'G', ':'] go, [motor, 'a', ':'] position,
+        [motor, 't', ':'] target, [motor, '?', ':'] status ('1' moving, '0' idle), [255, 'R'] reset
+        Coordinates are 24-bit two's complement, least significant byte first
+        :param speed:   Motor speed (steps/s)
+        :param motors:  Device numbers of the motors
+        """
+        self.speed = speed
+        self.targets = {motor: 0 for motor in motors}
+        self._moves = {motor: (0, 0, 0.0) for motor in motors}  # Start position, target and start time
+        self._buffer = bytearray()
+        super().__init__()
+
+    def position(self, motor):
+        """
+        Current position of a motor
+        """
+        start, target, t0 = self._moves[motor]
+        travelled = int(self.speed * (time.perf_counter() - t0))
+        if travelled >= abs(target - start):
+            return target
+        return start + travelled if target > start else start - travelled
+
+    def handle(self, data):
+        self._buffer += data
+        while self._buffer:
+            if self._buffer[0] == 255:
+                if len(self._buffer) < 2:
+                    return
+                del self._buffer[:2]
+                self._moves = {motor: (0, 0, 0.0) for motor in self._moves}
+                self.targets = {motor: 0 for motor in self.targets}
+                continue
+            length = 7 if len(self._buffer) > 1 and self._buffer[1] == ord('T') else 3
+            if len(self._buffer) < length:
+                return
+            frame, self._buffer = bytes(self._buffer[:length]), self._buffer[length:]
+            self._command(frame[0], chr(frame[1]), frame[2:-1])
+
+    def _command(self, motor, command, payload):
+        if command == 'T':
+            self.targets[motor] = protocol.decode_coord(payload[1:4])
+        elif command == 'G':
+            self._moves[motor] = (self.position(motor), self.targets[motor], time.perf_counter())
+        elif command == 'a':
+            self.reply(protocol.encode_coord(self.position(motor)))
+        elif command == 't':
+            self.reply(protocol.encode_coord(self.targets[motor]))
+        elif command == '?':
+            self.reply(b'1' if self.position(motor) != self._moves[motor][1] else b'0')
@@ -1,12 +1,42 @@
+import ast
+import datetime
+import os
+import time
+import numpy as np
+
+
+# Environment overrides: every setting can be overridden with an environment variable SWARM_<NAME>
+def _env(name, default):
+    """
+    Value of setting name, overridden by environment variable SWARM_<name> if it is set
+    :param name:    Name of the setting
+    :param default: Value from this file
+    :return:        Setting value (parsed as a Python literal unless the default is a string)
+    """
+    value = os.environ.get(f"SWARM_{name}")
+    if value is None:
+        return default
+    if isinstance(default, str):
+        return value
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+    return np.asarray(value) if isinstance(default, np.ndarray) else value
+
+
 # Arduino settings
 SERIAL_PORT_ARDUINO = "COM5"  # Communication port with Arduino
 BAUDRATE_ARDUINO = 115200  # Baudrate Arduino
+ACK_PIEZOS = False  # Wait for the Arduino to echo switch commands and measure round trip times (needs echoing firmware)
 
 # Hammamatsu settings
 EXPOSURE_TIME = 25  # Exposure time Hammamatsu
 
 # Tektronix settings
 INSTR_DESCRIPTOR = 'USB0::0x0699::0x034F::C020081::INSTR'  # Name of Tektronix function generator
+DUAL_CHANNEL_ACTUATION = False  # Pre-tune channel 2 to the predicted next piezo and swap outputs on a switch (both outputs wired to the piezo amplifier)
+PIEZO_PRESET_MODE = "command"  # Piezo resonance switching: "command" (prepared commands), "recall" (setup memory 1-4) or None
 
 # Kronos settings
 STREAM_URL = "rtsp://10.4.51.109"  # RTSP stream url of Kronos
@@ -17,58 +47,140 @@ BAUDRATE_LEICA = 9600  # Baudrate Leica
 SLEEP_TIME = 0.03  # Time Leica takes to wait for next command
 PIXEL_MULTIPLIER_LEFT_RIGHT = 75  # Pixel --> step size correction in x
 PIXEL_MULTIPLIER_UP_DOWN = 85  # Pixel --> step size correction in y
+LEICA_POLL_INTERVAL = 0.05  # Time between position polls while moving (s)
+LEICA_MOVE_TIMEOUT = 10  # Maximum duration of a move (s)
+LEICA_TOLERANCE = 0  # Maximum distance to the target at which a motor has arrived (steps)
+
+# Device settings
+KEEP_DEVICES_ALIVE = False  # Keep the devices open when an environment closes, the next environment reuses them (warm start)
+
+# Simulation settings
+SIMULATE_HARDWARE = False  # Replace all devices with the simulated backends of simulated_hardware.py (POSIX only)
+SIMULATED_LATENCIES = {"camera": 0.025, "visa": 0.002, "visa_open": 0.2, "arduino": 0.0, "onset": 0.1}  # Frame time, VISA transfer and session opening, Arduino command, actuation onset (s)
+SIMULATED_VISA_THROUGHPUT = 200e3  # Transfer rate of waveforms to/from the simulated function generator (bytes/s)
+SIMULATED_LEICA_SPEED = 50000  # Motor speed of the simulated Leica (steps/s)
+SIMULATED_SWARM_SPEED = 20  # Speed of the simulated swarm at 10 Vpp on resonance (pixels/s)
 
 # General environment settings
 MAX_STEPS = 20000  # Number of consecutive steps in an episode
-IMG_SIZE = 300  # Size of environment/image (IMG_SIZE, IMG_SIZE)
+IMG_SIZE = _env("IMG_SIZE", 300)  # Size of environment/image (IMG_SIZE, IMG_SIZE)
 OFFSET_BOUNDS = 5  # Minimum Euclidean distance to satisfy checkpoint condition
 TARGET_POINTS = []  # Checkpoints
 UPDATE_RATE_ENV = 5  # Update rate environment (frames)
 SAVE_RATE_METADATA = 50  # Update rate metadata csv (frames)
 PIEZO_RESONANCES = {0: 2350, 1: 1500, 2: 2000, 3: 1900}  # kHz
+RESONANCE_SCAN_RANGE = (1000, 3000)  # Frequency range of the resonance scans (kHz, resonance_scan.py)
+RESONANCE_SCAN_TIME = 20  # Duration of the frequency sweep per piezo (s)
 
 # Model settings
-import numpy as np
 # MODELS_FOLDER = 'C:\\Users\\ARSL\\PycharmProjects\\Project_Matt\\venv\\Include\\AI_Actuated_Micrswarm_4\\models'
-MODELS_FOLDER = "C:\\Users\\Matthijs\\PycharmProjects\\ARSL_Autonomous_Navigation\\models"
+MODELS_FOLDER = _env("MODELS_FOLDER", "C:\\Users\\Matthijs\\PycharmProjects\\ARSL_Autonomous_Navigation\\models")
 MODEL_NAME = 'Circles_final_week.npy'
-# Q_VALUES_INITIAL = np.load(f"{MODELS_FOLDER}\\{MODEL_NAME}")
-Q_VALUES_INITIAL = np.zeros((4, IMG_SIZE, IMG_SIZE, 2))
-Q_VALUES_INITIAL[0, :, :, 0] -= 1
-Q_VALUES_INITIAL[1, :, :, 1] += 1
-Q_VALUES_INITIAL[2, :, :, 0] += 1
-Q_VALUES_INITIAL[3, :, :, 1] -= 1
+RESUME_Q_VALUES = False  # Start from the latest checkpoint in CHECKPOINTS_FOLDER instead of Q_VALUES_INITIAL
+# Q_VALUES_INITIAL and Q_VALUES_UPDATE_KERNEL are built on first access (see _q_values_initial/_q_values_update_kernel)
 MAX_VELO = 10
 Q_VALUES_UPDATE_KERNEL_FUNC = lambda x, y: np.log(x**2 + y**2 + 1)
-xx = np.linspace(-IMG_SIZE, IMG_SIZE-1, int(IMG_SIZE*2))
-yy = np.linspace(-IMG_SIZE, IMG_SIZE-1, int(IMG_SIZE*2))
-xx, yy = np.meshgrid(xx, yy)
-Q_VALUES_UPDATE_KERNEL = np.array(list(map(Q_VALUES_UPDATE_KERNEL_FUNC, xx, yy)))
-Q_VALUES_UPDATE_KERNEL = np.repeat(np.abs((Q_VALUES_UPDATE_KERNEL / np.max(Q_VALUES_UPDATE_KERNEL)) - 1)[:, :, np.newaxis], 2, axis=2)
 UPDATE_RATE_Q_VALUES = UPDATE_RATE_ENV  # Update rate Q values (frames)
 MAX_MEM_LEN = UPDATE_RATE_ENV  # Max length of memory (datapoints)
+SAVE_RATE_Q_VALUES = 500  # Checkpoint rate Q values (frames)
+CHECKPOINT_ATOL = 1e-3  # Q value tiles that changed less than this since they were last written are not rewritten
+TILED_Q_VALUES = False  # Keep Q values in a tiled field (full resolution only near the swarm)
 GAMMA = 0.9  # Discount factor
-EPSILON = 0.01  # Exploration coefficient
+EPSILON = 0.01  # Exploration coefficient (random action probability in every mode, including 'learned')
+POLICY_MODE = "single_choice"  # Selection mode of calc_action
+SWITCH_HOLDOFF = True  # Keep a piezo on for at least its calibrated onset latency (LATENCY_CALIBRATION_FILENAME) before switching
+DYNAMICS_MODEL_NAME = 'DecisionTreeRegressor_angle_normed.pkl'  # Regressor from construct_model.py (used in 'learned' mode)
+DYNAMICS_VPPS = np.linspace(10, 20, 6)  # Vpp grid of the learned dynamics lookup table
+DYNAMICS_FREQUENCIES = np.linspace(50, 150, 201)  # Frequency grid of the learned dynamics lookup table (kHz)
+DYNAMICS_POSITIONS = np.arange(0, IMG_SIZE, 25)  # Position grid of the learned dynamics lookup table (pixels)
 
 # Data location settings
-import datetime
-import os
 PROJECT_NAME = 'Project_Matt'  # Project name (use only one project name per person, this makes it easy to keep track)
 DATE = datetime.date.today() # Todays date, for keeping track of the experiments
-EXPERIMENT_RUN_NAME = 'Circles_final_week'  # Use a descriptive name here so you know what you did during the experiment
+EXPERIMENT_RUN_NAME = _env("EXPERIMENT_RUN_NAME", 'Circles_final_week')  # Use a descriptive name here so you know what you did during the experiment
 # SAVE_DIR = f"C:\\Users\\ARSL\\PycharmProjects\\{PROJECT_NAME}\\{DATE}"  # Location for images all the images and metadata
-SAVE_DIR = f"E:\\{DATE}"  # Location for images all the images and metadata
+DATA_ROOT = _env("DATA_ROOT", "E:")  # Folder with the date folders (SAVE_DIR) of all experiments
+SAVE_DIR = _env("SAVE_DIR", f"{DATA_ROOT}\\{DATE}")  # Location for images all the images and metadata
 SNAPSHOTS_SAVE_DIR = f'{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}\\'  # For saving metadata from experimental run
-if not os.path.isdir(SAVE_DIR):
-    os.mkdir(SAVE_DIR)  # For saving all data from TODAY
-if not os.path.isdir(SNAPSHOTS_SAVE_DIR):
-    os.mkdir(SNAPSHOTS_SAVE_DIR)  # For saving snapshots from one experimental run
+CHECKPOINTS_FOLDER = f"{MODELS_FOLDER}\\{EXPERIMENT_RUN_NAME}_checkpoints"  # Incremental Q values checkpoints
+CATALOG_FILENAME = f"{DATA_ROOT}\\experiment_catalog.sqlite"  # Catalog of all runs in the SAVE_DIR folders
+LATENCY_CALIBRATION_FILENAME = f"{MODELS_FOLDER}\\onset_latencies.json"  # Piezo onset latencies (latency_calibration.py)
+RESONANCE_SCAN_FILENAME = f"{MODELS_FOLDER}\\piezo_resonances.json"  # Swept piezo responses (resonance_scan.py)
+# SAVE_DIR and SNAPSHOTS_SAVE_DIR are created by make_data_dirs (called by the environments)
 
 # Data settings
-import pandas
 METADATA_FILENAME = f"{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}.csv"
-try:
-    METADATA = pandas.read_csv(METADATA_FILENAME)  # Make this file if you don't have it yet
-    del METADATA['Unnamed: 0']  # Remove unwanted column
-except:
-    METADATA = pandas.DataFrame()
\ No newline at end of file
+# The binary log and journal of every episode get a unique name when the episode starts (see episode_filenames)
+# METADATA (contents of METADATA_FILENAME) is read on first access (see _metadata)
+
+# Overrides of the settings not used to derive others above. Settings derived from another setting (e.g.
+# UPDATE_RATE_Q_VALUES and MAX_MEM_LEN from UPDATE_RATE_ENV, SNAPSHOTS_SAVE_DIR and METADATA_FILENAME from SAVE_DIR) are
+# computed before this loop, so they follow an override only if their input is read with _env above
+for _name in [_name for _name in globals() if _name.isupper()]:
+    globals()[_name] = _env(_name, globals()[_name])
+
+
+def make_data_dirs():
+    """
+    Create SAVE_DIR (all data from TODAY) and SNAPSHOTS_SAVE_DIR (snapshots from one experimental run)
+    """
+    for directory in (SAVE_DIR, SNAPSHOTS_SAVE_DIR):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+def episode_filenames():
+    """
+    Unique name and file names of a new episode (several episodes can run in one process)
+    :return:    Episode name ({EXPERIMENT_RUN_NAME}_{time in ms}), binary episode log (.episode.npy) and crash-safe
+                journal (.journal, removed on close) in SAVE_DIR
+    """
+    name = f"{EXPERIMENT_RUN_NAME}_{round(time.time() * 1e3)}"
+    return name, f"{SAVE_DIR}\\{name}.episode.npy", f"{SAVE_DIR}\\{name}.journal"
+
+
+# Lazy settings
+def _q_values_initial():
+    q_values = np.zeros((4, IMG_SIZE, IMG_SIZE, 2))
+    q_values[0, :, :, 0] -= 1
+    q_values[1, :, :, 1] += 1
+    q_values[2, :, :, 0] += 1
+    q_values[3, :, :, 1] -= 1
+    return q_values
+
+
+def _q_values_update_kernel():
+    xx = np.linspace(-IMG_SIZE, IMG_SIZE-1, int(IMG_SIZE*2))
+    yy = np.linspace(-IMG_SIZE, IMG_SIZE-1, int(IMG_SIZE*2))
+    xx, yy = np.meshgrid(xx, yy)
+    kernel = Q_VALUES_UPDATE_KERNEL_FUNC(xx, yy)
+    return np.repeat(np.abs((kernel / np.max(kernel)) - 1)[:, :, np.newaxis], 2, axis=2)
+
+
+def _metadata():
+    import pandas
+    try:
+        metadata = pandas.read_csv(METADATA_FILENAME)  # Make this file if you don't have it yet
+        del metadata['Unnamed: 0']  # Remove unwanted column
+    except (OSError, KeyError, pandas.errors.EmptyDataError):
+        metadata = pandas.DataFrame()
+    return metadata
+
+
+_LAZY_SETTINGS = {"Q_VALUES_INITIAL": _q_values_initial,
+                  "Q_VALUES_UPDATE_KERNEL": _q_values_update_kernel,
+                  "METADATA": _metadata}
+
+# Only the settings are exported by `from settings import *` (not the modules imported here), lazy settings are not
+# exported, access them as settings.<NAME>
+__all__ = [_name for _name in globals() if _name.isupper()]
+
+
+def __getattr__(name):
+    """
+    Build a lazy setting on first access (it is cached as a module attribute afterwards)
+    """
+    if name not in _LAZY_SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = _LAZY_SETTINGS[name]()
+    return value
\ No newline at end of file
@@ -0,0 +1,411 @@
+import re
+import time
+from collections import deque
+import numpy as np
+import cv2
+import pyvisa
+from settings import *
+from serial_loopback import LoopbackArduino, LoopbackLeica
+
+# Directions the swarm moves in when a piezo is actuated (x, y) in pixels
+PIEZO_DIRECTIONS = {0: (-1, 0),  # Right piezo --> move left
+                    1: (0, -1),  # Bottom piezo --> move up
+                    2: (1, 0),  # Left piezo --> move right
+                    3: (0, 1)}  # Top piezo --> move down
+
+# Short forms of the function shapes returned by the instrument
+SHAPES = {"SINUSOID": "SIN", "SQUARE": "SQU", "PULSE": "PULS", "PRNOISE": "PRN"}
+
+_COMMAND = re.compile(r"^(?P<header>[*:A-Z0-9]+)(?P<query>\?)?\s*(?P<argument>.*)$")
+_VALUE = re.compile(r"^(?P<value>[-+0-9.E]+)\s*(?P<unit>[A-Z]*)$")
+
+
+def _matches(header, *patterns):
+    """
+    Check if a SCPI header matches one of the patterns, where optional parts of the keywords are lowercase
+    (e.g. "SOURce1:FREQuency" matches SOUR1:FREQ, SOURCE1:FREQUENCY, ...)
+    """
+    for pattern in patterns:
+        regex = "".join(f"{char}" if char.isupper() or not char.isalpha() else f"{char.upper()}?" for char in pattern)
+        if re.fullmatch(regex.replace("*", r"\*"), header):
+            return True
+    return False
+
+
+class SimulatedInstrument:
+
+    def __init__(self, latency=0.0, model="AFG3022B", serial_number="SIM0001"):
+        """
+        VISA resource stand-in for the Tektronix function generator, answers the SCPI subset used by FuncGen
+        (settings of both channels, manual frequency sweeps, *SAV/*RCL, compound commands, error queue)
+        :param latency:         Simulated time per write or query (s), one transfer for a compound command
+        :param model:           Model returned by *IDN?
+        :param serial_number:   Serial number returned by *IDN?
+        """
+        self.latency = latency
+        self.idn = f"TEKTRONIX,{model},{serial_number},SCPI:99.0 FV:3.1.1"
+        self.timeout = 1000
+        self.last_status = pyvisa.constants.StatusCode.success
+        self.errors = deque(maxlen=32)
+        self.setups = {}
+        self.edit_memory = np.array([], dtype=np.uint16)
+        self.user_memory = {}
+        self.frequency_lock = 0
+        self.writes = 0
+        self.queries = 0
+        self.connected = True
+        self.reset()
+
+    def reset(self):
+        """
+        Default settings (*RST)
+        """
+        self.channels = {channel: {"output": 0, "function": "SIN", "amplitude": 1.0, "offset": 0.0,
+                                   "frequency": 1e6, "mode": "CW", "start": 100.0, "stop": 1e6, "sweep_time": 0.01,
+                                   "hold": 0.0, "return": 1e-3, "spacing": "LIN", "triggered": None}
+                         for channel in (1, 2)}
+
+    def output_frequency(self, channel, now=None):
+        """
+        Frequency of a channel, the instantaneous frequency of a triggered sweep in sweep mode
+        :param channel: Channel (1, 2)
+        :param now:     time.perf_counter() time, now if None
+        :return:        Frequency (Hz)
+        """
+        state = self.channels[channel]
+        if state["mode"] != "SWEEP":
+            return state["frequency"]
+        if state["triggered"] is None:
+            return state["start"]
+        elapsed = (time.perf_counter() if now is None else now) - state["triggered"]
+        if elapsed > state["sweep_time"] + state["hold"]:
+            return state["start"]  # A manual sweep waits at the start frequency for the next trigger
+        fraction = min(max(elapsed / state["sweep_time"], 0), 1)
+        if state["spacing"] == "LOG":
+            return state["start"] * (state["stop"] / state["start"]) ** fraction
+        return state["start"] + (state["stop"] - state["start"]) * fraction
+
+    def _check_connected(self):
+        if not self.connected:
+            raise pyvisa.errors.InvalidSession()
+
+    def drop_connection(self):
+        """
+        Lose the connection (e.g. the USB cable was unplugged), the session works again after it is reopened
+        """
+        self.connected = False
+
+    def write(self, message):
+        self._check_connected()
+        time.sleep(self.latency)
+        self.writes += 1
+        for command in message.split(";"):
+            self._execute(command)
+        return len(message)
+
+    def query(self, message):
+        self._check_connected()
+        time.sleep(self.latency)
+        self.queries += 1
+        responses = [self._execute(command) for command in message.split(";")]
+        if any(response is None for response in responses):
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return ";".join(responses) + "\n"
+
+    def write_binary_values(self, message, values, datatype="H", is_big_endian=True):
+        self._check_connected()
+        time.sleep(self.latency + 2 * len(values) / SIMULATED_VISA_THROUGHPUT)
+        self.writes += 1
+        if _matches(message.strip().rstrip(",").upper(), "DATA:DATA EMEMory"):
+            self.edit_memory = np.asarray(values, dtype=np.uint16)
+        return 2 * len(values)
+
+    def query_binary_values(self, message, datatype="H", is_big_endian=True, container=list):
+        self._check_connected()
+        time.sleep(self.latency + 2 * len(self.edit_memory) / SIMULATED_VISA_THROUGHPUT)
+        self.queries += 1
+        values = self.edit_memory.copy()
+        return values if container is np.ndarray else container(values)
+
+    def close(self):
+        self.connected = False
+
+    def _execute(self, command):
+        """
+        Execute one command of a (compound) message
+        :return:    Response to a query, None if the command is not a query
+        """
+        match = _COMMAND.match(command.strip().lstrip(":").upper())
+        if match is None:
+            self.errors.append('-102,"Syntax error"')
+            return None
+        header, query, argument = match["header"], match["query"], match["argument"].strip()
+
+        # Common commands
+        if header == "*IDN" and query:
+            return self.idn
+        if header == "*TRG":
+            for state in self.channels.values():
+                if state["mode"] == "SWEEP":
+                    state["triggered"] = time.perf_counter()
+            return None
+        if header == "*CLS" or _matches(header, "PHASe:INITiate"):
+            return None
+        if header == "*RST":
+            self.reset()
+            return None
+        if header in ("*SAV", "*RCL"):
+            slot = int(argument)
+            if header == "*SAV":
+                self.setups[slot] = {channel: dict(state) for channel, state in self.channels.items()}
+            elif slot in self.setups:
+                self.channels = {channel: dict(state) for channel, state in self.setups[slot].items()}
+            else:
+                self.errors.append('-222,"Data out of range"')
+            return None
+        if _matches(header, "SYSTem:ERRor", "SYSTem:ERRor:NEXT") and query:
+            return self.errors.popleft() if self.errors else '0,"No error"'
+
+        # Arbitrary waveform memories
+        if _matches(header, "DATA:CATalog") and query:
+            return ",".join(f'"USER{n}"' for n in sorted(self.user_memory))
+        if _matches(header, "DATA:POINts") and query:
+            return str(len(self.edit_memory))
+        if _matches(header, "DATA:DATA:VALue", "DATA:VALue") and query:
+            point = int(argument.split(",")[-1])
+            return str(int(self.edit_memory[point - 1])) if 0 < point <= len(self.edit_memory) else None
+        if _matches(header, "DATA:COPY"):
+            target, source = argument.replace(" ", "").split(",")
+            if source.startswith("EMEM"):
+                self.user_memory[int(target[4:])] = self.edit_memory.copy()
+            elif int(source[4:]) in self.user_memory:
+                self.edit_memory = self.user_memory[int(source[4:])].copy()
+            else:
+                self.errors.append('-222,"Data out of range"')
+            return None
+
+        # Channel commands
+        channel = re.search(r"(?:SOUR(?:CE)?|OUTP(?:UT)?)(\d)", header)
+        channel = int(channel[1]) if channel else 1
+        state = self.channels[channel]
+        header = re.sub(r"^(SOUR(?:CE)?|OUTP(?:UT)?)\d", r"\1", header)
+
+        if _matches(header, "OUTPut:STATe", "OUTPut"):
+            if query:
+                return str(state["output"])
+            state["output"] = int(argument in ("ON", "1"))
+        elif _matches(header, "SOURce:FUNCtion:SHAPe", "SOURce:FUNCtion"):
+            if query:
+                return state["function"]
+            state["function"] = SHAPES.get(argument, argument)
+        elif _matches(header, "SOURce:FREQuency:CONCurrent", "SOURce:FREQuency:CONCurrent:STATe"):
+            if query:
+                return str(self.frequency_lock)
+            self.frequency_lock = int(argument in ("ON", "1"))
+        elif _matches(header, "SOURce:FREQuency:MODE"):
+            if query:
+                return "SWE" if state["mode"] == "SWEEP" else "CW"
+            state["mode"] = "SWEEP" if argument.startswith("SWE") else "CW"
+            state["triggered"] = None
+        elif _matches(header, "SOURce:FREQuency:STARt", "SOURce:FREQuency:STOP", "SOURce:SWEep:TIME",
+                      "SOURce:SWEep:HTIMe", "SOURce:SWEep:RTIMe"):
+            key = {"STAR": "start", "STOP": "stop", "TIME": "sweep_time", "HTIM": "hold",
+                   "RTIM": "return"}[header.split(":")[-1][:4]]
+            if query:
+                return repr(state[key])
+            state[key] = self._value(argument, state[key])
+        elif _matches(header, "SOURce:SWEep:SPACing"):
+            if query:
+                return state["spacing"]
+            state["spacing"] = "LOG" if argument.startswith("LOG") else "LIN"
+        elif _matches(header, "SOURce:SWEep:MODE"):
+            if query:
+                return "MAN"
+            if not argument.startswith("MAN"):
+                self.errors.append('-224,"Illegal parameter value; only manual sweeps are simulated"')
+        elif _matches(header, "SOURce:FREQuency", "SOURce:FREQuency:FIXed", "SOURce:FREQuency:CW"):
+            if query:
+                return repr(state["frequency"])
+            state["frequency"] = self._value(argument, state["frequency"])
+        elif _matches(header, "SOURce:VOLTage:LEVel:OFFSet", "SOURce:VOLTage:OFFSet",
+                      "SOURce:VOLTage:LEVel:IMMediate:OFFSet"):
+            if query:
+                return repr(state["offset"])
+            state["offset"] = self._value(argument, state["offset"])
+        elif _matches(header, "SOURce:VOLTage:LEVel", "SOURce:VOLTage:AMPLitude", "SOURce:VOLTage",
+                      "SOURce:VOLTage:LEVel:IMMediate:AMPLitude"):
+            if query:
+                return repr(state["amplitude"])
+            state["amplitude"] = self._value(argument, state["amplitude"])
+        else:
+            self.errors.append(f'-113,"Undefined header; {command.strip()}"')
+        return None
+
+    def _value(self, argument, current):
+        """
+        Numeric argument in base units (Hz, V), the current value if it cannot be parsed
+        """
+        match = _VALUE.match(argument.replace(" ", ""))
+        if match is None:
+            self.errors.append(f'-104,"Data type error; {argument}"')
+            return current
+        unit = match["unit"]
+        factor = 1e6 if unit.startswith("MHZ") else 1e3 if unit.startswith("K") else 1e-3 if unit.startswith("M") else 1
+        return float(match["value"]) * factor
+
+
+class SimulatedResourceManager:
+
+    def __init__(self, instruments=None, open_latency=0.0):
+        """
+        pyvisa.ResourceManager stand-in
+        :param instruments:     Dictionary of VISA address and SimulatedInstrument, unknown addresses get a new instrument
+        :param open_latency:    Simulated time to open a session (s)
+        """
+        self.instruments = {} if instruments is None else instruments
+        self.open_latency = open_latency
+        self.opened = 0
+
+    def list_resources(self):
+        return tuple(self.instruments)
+
+    def open_resource(self, address):
+        time.sleep(self.open_latency)
+        self.opened += 1
+        if address not in self.instruments:
+            self.instruments[address] = SimulatedInstrument()
+        self.instruments[address].connected = True
+        return self.instruments[address]
+
+    def close(self):
+        pass
+
+
+class SimulatedSwarm:
+
+    def __init__(self, arduino, instrument, position=None, speed=SIMULATED_SWARM_SPEED, bandwidth=100, noise=0.5,
+                 radius=8, onset=0.0, seed=None):
+        """
+        Swarm that moves away from the actuated piezo, faster with a higher Vpp and closer to the piezo resonance
+        :param arduino:     LoopbackArduino (which piezo is actuated)
+        :param instrument:  SimulatedInstrument (Vpp and frequency of the channels with their output on)
+        :param position:    Initial position (x, y) in pixels, the image center if None
+        :param speed:       Speed at 10 Vpp on resonance (pixels/s)
+        :param bandwidth:   Half width of the resonance peaks (kHz)
+        :param noise:       Standard deviation of the random displacement per frame (pixels)
+        :param radius:      Radius of the swarm (pixels)
+        :param onset:       Time between switching a piezo on and the swarm starting to move (s)
+        :param seed:        Random seed
+        """
+        self.arduino = arduino
+        self.instrument = instrument
+        self.position = np.array((IMG_SIZE / 2, IMG_SIZE / 2) if position is None else position, dtype=float)
+        self.speed = speed
+        self.bandwidth = bandwidth
+        self.noise = noise
+        self.radius = radius
+        self.onset = onset
+        self.rng = np.random.default_rng(seed)
+        self._t = time.perf_counter()
+
+    def velocity(self, now=None):
+        """
+        Current velocity (x, y) in pixels/s
+        """
+        velocity = np.zeros(2)
+        now = time.perf_counter() if now is None else now
+        if now - self.arduino.switch_time < self.onset:
+            return velocity
+        for piezo, on in enumerate(self.arduino.outputs):
+            if not on:
+                continue
+            for channel, state in self.instrument.channels.items():
+                if state["output"]:
+                    frequency = self.instrument.output_frequency(channel, now)
+                    detuning = (frequency / 1e3 - PIEZO_RESONANCES[piezo]) / self.bandwidth
+                    response = state["amplitude"] / 10 / (1 + detuning ** 2)  # Lorentzian resonance
+                    velocity += np.array(PIEZO_DIRECTIONS[piezo]) * self.speed * response
+        return velocity
+
+    def update(self):
+        """
+        Move the swarm for the time since the previous update
+        :return:    Position (x, y)
+        """
+        now = time.perf_counter()
+        self.position += self.velocity(now) * (now - self._t) + self.rng.normal(0, self.noise, 2)
+        self.position = np.clip(self.position, self.radius, IMG_SIZE - 1 - self.radius)
+        self._t = now
+        return self.position
+
+    def bbox(self):
+        """
+        Bounding box [x, y, width, height] around the swarm
+        """
+        x, y = self.position - 2 * self.radius
+        return [int(x), int(y), 4 * self.radius, 4 * self.radius]
+
+
+class SimulatedCamera:
+
+    def __init__(self, swarm, frame_time=0.025, seed=None):
+        """
+        Camera stand-in that renders the simulated swarm as a bright blob on a noisy background
+        :param swarm:       SimulatedSwarm
+        :param frame_time:  Minimum time between frames (s), like the exposure of the Hammamatsu
+        :param seed:        Random seed
+        """
+        self.swarm = swarm
+        self.frame_time = frame_time
+        self.rng = np.random.default_rng(seed)
+        self._t = 0
+
+    def snap(self, f_name, size=(IMG_SIZE, IMG_SIZE)):
+
+        # Wait for the next frame
+        wait = self._t + self.frame_time - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        self._t = time.perf_counter()
+
+        # Render swarm
+        img = self.rng.integers(20, 60, size=(IMG_SIZE, IMG_SIZE), dtype=np.uint8)
+        x, y = self.swarm.update()
+        cv2.circle(img, (int(round(x)), int(round(y))), self.swarm.radius, 220, -1)
+        if size != (IMG_SIZE, IMG_SIZE):
+            img = cv2.resize(img, size)
+
+        # Save image
+        cv2.imwrite(f_name, img)
+
+        return img
+
+
+class SimulatedHardware:
+
+    def __init__(self, latencies=SIMULATED_LATENCIES, leica_speed=SIMULATED_LEICA_SPEED, seed=None):
+        """
+        Simulated camera, piezo Arduino, Leica xy-platform and function generator (POSIX only, the serial devices are
+        pseudo terminals), use the ports and the resource manager in place of the real devices
+        :param latencies:   Dictionary of simulated latencies (s): "camera" (frame time), "visa" (per transfer),
+                            "arduino" (per command) and "onset" (piezo on --> swarm moves)
+        :param leica_speed: Simulated motor speed of the Leica (steps/s)
+        :param seed:        Random seed of the swarm and camera noise
+        """
+        self.arduino = LoopbackArduino(ack=ACK_PIEZOS, latency=latencies.get("arduino", 0.0))
+        self.leica = LoopbackLeica(speed=leica_speed)
+        self.instrument = SimulatedInstrument(latency=latencies.get("visa", 0.0))
+        self.resource_manager = SimulatedResourceManager({INSTR_DESCRIPTOR: self.instrument},
+                                                         open_latency=latencies.get("visa_open", 0.0))
+        self.swarm = SimulatedSwarm(arduino=self.arduino, instrument=self.instrument,
+                                    onset=latencies.get("onset", 0.0), seed=seed)
+        self.camera = SimulatedCamera(swarm=self.swarm, frame_time=latencies.get("camera", 0.0), seed=seed)
+
+        # Checkpoints on a square around the image center
+        d = IMG_SIZE // 4
+        c = IMG_SIZE // 2
+        self.target_points = [[c - d, c - d], [c + d, c - d], [c + d, c + d], [c - d, c + d]]
+
+    def close(self):
+        self.arduino.close()
+        self.leica.close()
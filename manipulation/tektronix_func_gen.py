@@ -4,7 +4,12 @@
 
 """
 
+import atexit
 import copy
+import contextlib
+import hashlib
+import threading
+import time
 import pyvisa
 import numpy as np
 from typing import Tuple, List, Union
@@ -50,6 +55,174 @@ class NotCompatibleError(Exception):
     """Error for when the instrument is not compatible with this module"""
 
 
+## ~~~~~~~~~~~~~~~~~~~~~~~~~~~ VISA SESSIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
+
+
+class VisaPool:
+    """Process-wide pool of VISA sessions, so that `FuncGen` objects for the
+    same address share one resource manager and one connection instead of
+    opening new ones (and repeating the handshake) every time
+
+    A session stays open when its last user closes it, ready to be handed
+    out again, until `discard` or `close_all` (called at exit).
+
+    Attributes
+    ----------
+    metrics : dict
+        Number of sessions opened, reused and reconnected, and the time spent
+        creating the resource manager, opening sessions and in the handshake
+        (`*CLS` and `*IDN?`) of new sessions in seconds
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resource_manager = None
+        self._sessions = {}
+        self.metrics = {
+            "opened": 0,
+            "reused": 0,
+            "reconnects": 0,
+            "resource_manager_seconds": 0.0,
+            "open_seconds": 0.0,
+            "handshake_seconds": 0.0,
+        }
+
+    def resource_manager(self, resource_manager=None):
+        """The given resource manager, or the shared `pyvisa.ResourceManager`
+        (created on first use) if `None`"""
+        if resource_manager is not None:
+            return resource_manager
+        with self._lock:
+            if self._resource_manager is None:
+                t0 = time.perf_counter()
+                self._resource_manager = pyvisa.ResourceManager()
+                self.metrics["resource_manager_seconds"] += time.perf_counter() - t0
+            return self._resource_manager
+
+    def acquire(self, visa_address: str, resource_manager=None, share: bool = True) -> dict:
+        """Get a session for an address, an open one if there is one
+
+        Parameters
+        ----------
+        visa_address : str
+            VISA address of the instrument
+        resource_manager : `pyvisa.ResourceManager`, optional
+            Resource manager to open the session with, the shared one if `None`
+        share : bool, default `True`
+            Reuse an open session and keep this one for reuse, otherwise open
+            a private session that is closed when released
+
+        Returns
+        -------
+        dict
+            The session with the keys "inst" (the PyVISA resource), "id"
+            (response to `*IDN?`, `None` until the first handshake), "users",
+            and the state shared by all `FuncGen` objects of the session:
+            "waveform_hashes" (cache of `FuncGen.set_custom_waveform`),
+            "channel_states" (cached settings of every channel), "setups"
+            (channel states stored by `FuncGen.save_setup`), "batch" (the
+            commands collected by `FuncGen.batch`, `None` outside a batch),
+            "batch_settings" (the cached settings those commands changed) and
+            "batch_check_errors" (check the error queue when the batch is written)
+
+        Raises
+        ------
+        pyvisa.Error
+            If the address cannot be connected to
+        """
+        rm = self.resource_manager(resource_manager)
+        key = (id(rm), visa_address)
+        with self._lock:
+            session = self._sessions.get(key) if share else None
+            if session is not None:
+                session["users"] += 1
+                self.metrics["reused"] += 1
+                return session
+            session = {
+                "key": key,
+                "resource_manager": rm,
+                "address": visa_address,
+                "shared": share,
+                "users": 1,
+                "batch": None,
+                "batch_settings": [],
+                "batch_check_errors": False,
+            }
+            self._connect(session)
+            if share:
+                self._sessions[key] = session
+            return session
+
+    def _connect(self, session: dict):
+        """Open the PyVISA resource of a session"""
+        t0 = time.perf_counter()
+        session["inst"] = session["resource_manager"].open_resource(session["address"])
+        session["id"] = None
+        # The instrument might have been restarted, forget everything known
+        # about its memory and settings
+        session.setdefault("waveform_hashes", {}).clear()
+        session.setdefault("setups", {}).clear()
+        for state in session.setdefault("channel_states", {1: {}, 2: {}}).values():
+            state.clear()
+        self.metrics["opened"] += 1
+        self.metrics["open_seconds"] += time.perf_counter() - t0
+
+    def reconnect(self, session: dict):
+        """Close a (failed) session and open it again for all its users"""
+        with self._lock:
+            with contextlib.suppress(pyvisa.Error):
+                session["inst"].close()
+            self._connect(session)
+            self.metrics["reconnects"] += 1
+
+    def release(self, session: dict, close: bool = False):
+        """Return a session, a private session is closed
+
+        Parameters
+        ----------
+        session : dict
+            Session from `acquire`
+        close : bool, default `False`
+            Also close a shared session if no one else uses it
+        """
+        with self._lock:
+            session["users"] -= 1
+            if session["users"] <= 0 and (close or not session["shared"]):
+                self.discard(session)
+
+    def discard(self, session: dict):
+        """Close a session and remove it from the pool"""
+        with self._lock:
+            if self._sessions.get(session["key"]) is session:
+                del self._sessions[session["key"]]
+            with contextlib.suppress(pyvisa.Error):
+                session["inst"].close()
+
+    def close_all(self):
+        """Close all pooled sessions"""
+        with self._lock:
+            for session in list(self._sessions.values()):
+                self.discard(session)
+
+    def stats(self) -> dict:
+        """Metrics with the number of open sessions and the mean open and
+        handshake times in milliseconds"""
+        stats = dict(self.metrics, sessions=len(self._sessions))
+        if self.metrics["opened"]:
+            stats["open_mean_ms"] = round(
+                1e3 * self.metrics["open_seconds"] / self.metrics["opened"], 3
+            )
+            stats["handshake_mean_ms"] = round(
+                1e3 * self.metrics["handshake_seconds"] / self.metrics["opened"], 3
+            )
+        return stats
+
+
+visa_pool = VisaPool()
+"""`VisaPool`: The sessions shared by all `FuncGen` objects"""
+atexit.register(visa_pool.close_all)
+
+
 ## ~~~~~~~~~~~~~~~~~~~~~ FUNCTION GENERATOR CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
 
 
@@ -69,6 +242,10 @@ class FuncGen:
         Timeout in milliseconds of instrument connection
     verify_param_set : bool, default False
         Verify that a value is successfully set after executing a set function
+    cache_state : bool, default True
+        Remember the last confirmed settings of the channels, so that setting
+        a value that is already set does not write to the instrument and the
+        limit checks do not query the instrument (unless `verify_param_set`)
     verbose : bool, default `True`
         Choose whether to print information such as model upon connecting etc
     override_compatibility : str, default `""`
@@ -77,6 +254,16 @@ class FuncGen:
         AFG1022, AFG1062, or AFG3022 limits, use their respecive model names as
         argument. Note that this might lead to unexpected behaviour for custom
         waveforms and 'MIN'/'MAX' keywords.
+    resource_manager : `pyvisa.ResourceManager`, optional
+        Resource manager used to open the instrument (e.g. a simulated one),
+        the `pyvisa.ResourceManager` shared by `visa_pool` if `None`
+    share_session : bool, default `True`
+        Use the open session of `visa_pool` for this address if there is one
+        (and keep the session open for reuse after `close`), otherwise open a
+        private session
+    reconnect : bool, default `True`
+        Reopen the session and retry once if a write or query fails because
+        the connection was lost (timeouts are not retried)
 
     Attributes
     ----------
@@ -86,7 +273,12 @@ class FuncGen:
         Comma separated string with maker, model, serial and firmware of
         the instrument
     _inst : `pyvisa.resources.Resource`
-        The PyVISA resource
+        The PyVISA resource of the session
+    _session : dict
+        The `visa_pool` session
+    connect_time : dict
+        Time spent opening the session and in the handshake in seconds, and
+        whether an open session was reused
     _arbitrary_waveform_length : list
         The permitted minimum and maximum length of an arbitrary waveform,
         e.g. [2, 8192]
@@ -95,6 +287,10 @@ class FuncGen:
         => 2**14-1 = 16383
     _max_waveform_memory_user_locations : int
         The number of the last user memory location available
+    n_writes : int
+        Number of commands written to the instrument
+    n_queries : int
+        Number of queries sent to the instrument
 
     Raises
     ------
@@ -133,13 +329,30 @@ class FuncGen:
         verify_param_set: bool = False,
         override_compatibility: str = "",
         verbose: bool = True,
+        cache_state: bool = True,
+        resource_manager=None,
+        share_session: bool = True,
+        reconnect: bool = True,
     ):
         self._override_compat = override_compatibility
         self._visa_address = visa_address
         self.verify_param_set = verify_param_set
         """bool:  Verify that a value is successfully set after executing a set function"""
+        self.cache_state = cache_state
+        """bool: Remember the last confirmed channel settings to skip redundant writes and queries"""
+        self.n_writes = 0
+        self.n_queries = 0
+        self.channels = ()
+        self._waveform_hashes = {}
+        self.waveform_transfers = {"uploads": 0, "skipped": 0, "bytes": 0, "seconds": 0.0}
+        """dict: Number of waveform uploads and skipped (cached) uploads, and
+        the bytes and time spent transferring waveforms"""
         self.verbose = verbose
         """bool: Choose whether to print information such as model upon connecting etc"""
+        self._resource_manager = resource_manager
+        self.share_session = share_session
+        self.reconnect = reconnect
+        """bool: Reopen the session and retry once if the connection was lost"""
         self.open(visa_address, timeout)
         self._initialise_model_properties()
         self.channels = (
@@ -163,34 +376,93 @@ class FuncGen:
         self.close()
 
     def open(self, visa_address: str, timeout: int):
+        t0 = time.perf_counter()
         try:
-            rm = pyvisa.ResourceManager()
-            self._inst = rm.open_resource(visa_address)
+            self._session = visa_pool.acquire(
+                visa_address, self._resource_manager, share=self.share_session
+            )
         except pyvisa.Error:
             print(f"\nVisaError: Could not connect to '{visa_address}'")
             raise
         self._is_connected = True
+        self._waveform_hashes = self._session["waveform_hashes"]
+        self._setups = self._session["setups"]
+        t_open = time.perf_counter() - t0
+        reused = self._session["id"] is not None
         self.timeout = timeout
-        # Clear all the event registers and queues used in the instrument
-        # status and event reporting system
-        self.write("*CLS")
-        # Get information about the connected device
-        self._id = self.query("*IDN?")
-        # Second query might be needed due to unknown reason
-        if self._id == "":
-            self._id = self.query("*IDN?")
-        self._maker, self._model, self._serial = self._id.split(",")[:3]
+        self._handshake()
+        self.connect_time = {
+            "open": t_open,
+            "handshake": time.perf_counter() - t0 - t_open,
+            "reused": reused,
+        }
         if self.verbose:
             print(
                 f"Connected to {self._maker} model {self._model}, "
                 f"serial {self._serial}"
+                + (" (reused session)" if reused else "")
             )
 
+    def _handshake(self):
+        """Clear the status registers and identify the instrument, the
+        identification of a reused session is not queried again"""
+        t0 = time.perf_counter()
+        # Clear all the event registers and queues used in the instrument
+        # status and event reporting system
+        self.write("*CLS")
+        if self._session["id"] is None:
+            # Get information about the connected device
+            self._session["id"] = self.query("*IDN?")
+            # Second query might be needed due to unknown reason
+            if self._session["id"] == "":
+                self._session["id"] = self.query("*IDN?")
+            visa_pool.metrics["handshake_seconds"] += time.perf_counter() - t0
+        self._id = self._session["id"]
+        self._maker, self._model, self._serial = self._id.split(",")[:3]
+
     def close(self):
-        """Close the connection to the instrument"""
+        """Close the connection to the instrument (a shared session stays
+        open in `visa_pool` for reuse)"""
         if self._is_connected:
-            self._inst.close()
             self._is_connected = False
+            visa_pool.release(self._session)
+
+    @property
+    def _inst(self):
+        return self._session["inst"]
+
+    @property
+    def _batch(self):
+        return self._session["batch"]
+
+    @_batch.setter
+    def _batch(self, commands):
+        self._session["batch"] = commands
+
+    def _call(self, method: str, *args, **kwargs):
+        """Call a method of the PyVISA resource, reopen the session and retry
+        once if the connection was lost (see `reconnect`)"""
+        try:
+            return getattr(self._inst, method)(*args, **kwargs)
+        except pyvisa.Error as err:
+            timed_out = (
+                isinstance(err, pyvisa.errors.VisaIOError)
+                and err.error_code == pyvisa.constants.StatusCode.error_timeout
+            )
+            if not self.reconnect or timed_out:
+                raise
+            if self.verbose:
+                print(f"(!) {self._visa_address}: {err}, reconnecting")
+        timeout = self._timeout
+        visa_pool.reconnect(self._session)
+        self.timeout = timeout
+        # Retry only once: a handshake that fails on the new session raises
+        self.reconnect = False
+        try:
+            self._handshake()
+        finally:
+            self.reconnect = True
+        return getattr(self._inst, method)(*args, **kwargs)
 
     @property
     def timeout(self) -> int:
@@ -199,6 +471,7 @@ class FuncGen:
 
     @timeout.setter
     def timeout(self, ms: int):
+        self._timeout = ms
         self._inst.timeout = ms
 
     def _initialise_model_properties(self):
@@ -318,7 +591,20 @@ class FuncGen:
             If status returned by PyVISA write command is not
             `pyvisa.constants.StatusCode.success`
         """
-        num_bytes = self._inst.write(command)
+        headers = [part.strip().lstrip(":").upper() for part in command.split(";")]
+        # Commands that change all settings invalidate the cached channel states
+        if any(header.startswith(("*RST", "*RCL")) for header in headers):
+            self.invalidate_state()
+        # Inside `batch` the command is written later as part of one compound
+        # command, except setup memory commands, which are written right away
+        # (after the commands before them)
+        if self._batch is not None:
+            if not any(header.startswith(("*RST", "*RCL", "*SAV")) for header in headers):
+                self._batch.append(command)
+                return 0
+            self._flush_batch()
+        num_bytes = self._call("write", command)
+        self.n_writes += 1
         self._check_pyvisa_status(command, custom_err_message=custom_err_message)
         return num_bytes
 
@@ -346,10 +632,105 @@ class FuncGen:
             If status returned by PyVISA write command is not
             `pyvisa.constants.StatusCode.success`
         """
-        response = self._inst.query(command).strip()
+        self._flush_batch()  # Commands written before the query must arrive first
+        response = self._call("query", command).strip()
+        self.n_queries += 1
         self._check_pyvisa_status(command, custom_err_message=custom_err_message)
         return response
 
+    def query_many(self, commands: List[str]) -> List[str]:
+        """Send several queries as one compound query
+
+        Parameters
+        ----------
+        commands : list of str
+            The VISA query commands
+
+        Returns
+        -------
+        list of str
+            The instrument's responses, one per query
+        """
+        responses = self.query(";:".join(commands)).split(";")
+        if not len(responses) == len(commands):
+            raise RuntimeError(
+                f"Expected {len(commands)} responses to {commands}, got {responses}"
+            )
+        return [response.strip() for response in responses]
+
+    @contextlib.contextmanager
+    def batch(self, check_errors: bool = False):
+        """Context manager that joins the commands written inside it into one
+        semicolon-separated compound command, written when the context exits
+        (or before a query, to keep the order). Nested batches join the
+        outermost batch.
+
+        Parameters
+        ----------
+        check_errors : bool, default `False`
+            Query the error queue once after the compound command is written
+            (an extra round trip, meant for setup rather than for switching)
+
+        Example
+        -------
+        >>> with fgen.batch():
+        ...     fgen.ch1.set_frequency(2e6)
+        ...     fgen.ch1.set_amplitude(10)
+        ...     fgen.ch1.set_output("ON")
+        """
+        if self._batch is not None:
+            self._session["batch_check_errors"] |= check_errors
+            yield self
+            return
+        self._batch = []
+        self._session["batch_check_errors"] = check_errors
+        try:
+            yield self
+            self._flush_batch()
+        except Exception:
+            # The cached states may contain settings that were never written
+            self._forget_batch_settings()
+            raise
+        finally:
+            self._batch = None
+            self._session["batch_check_errors"] = False
+
+    def _flush_batch(self):
+        """Write the commands collected by `batch` as one compound command,
+        and check the error queue once (`SYSTem:ERRor?`) if the batch was
+        opened with `check_errors`
+
+        Raises
+        ------
+        RuntimeError
+            If the instrument reports an error, the cached settings changed by
+            the batch are forgotten
+        """
+        if not self._batch:
+            return
+        commands, self._batch = self._batch, None
+        error = "0"
+        try:
+            self.write(";:".join(commands), custom_err_message=f"write {commands}")
+            if self._session["batch_check_errors"]:
+                error = self.query("SYSTem:ERRor?")
+        except Exception:
+            self._forget_batch_settings()
+            raise
+        finally:
+            self._batch = []
+        if not error.startswith("0"):
+            self._forget_batch_settings()
+            raise RuntimeError(f"Could not write {commands}: instrument error {error}")
+        self._session["batch_settings"] = []
+
+    def _forget_batch_settings(self):
+        """Remove the settings changed by the current batch from the cached
+        channel states"""
+        settings, self._session["batch_settings"] = self._session["batch_settings"], []
+        for state, key in settings:
+            state.pop(key, None)
+
     def _check_pyvisa_status(self, command: str, custom_err_message: str = None):
         """Check the last status code of PyVISA
 
@@ -384,6 +765,44 @@ class FuncGen:
             raise RuntimeError(msg)
         return status
 
+    def save_setup(self, slot: int):
+        """Save the current settings of the instrument to a setup memory
+        location (`*SAV`), the cached channel states are stored with it
+
+        Parameters
+        ----------
+        slot : int
+            Setup memory location 1-4
+        """
+        if slot not in range(1, 5):
+            raise ValueError(f"Setup memory location {slot} must be 1, 2, 3 or 4")
+        self.write(f"*SAV {slot}", custom_err_message=f"save setup {slot}")
+        self._setups[slot] = [ch.state for ch in self.channels]
+
+    def recall_setup(self, slot: int):
+        """Recall the settings saved in a setup memory location (`*RCL`), a
+        single short command. The cached channel states are restored to those
+        stored by `save_setup` (if it was saved in this session)
+
+        Parameters
+        ----------
+        slot : int
+            Setup memory location 1-4
+        """
+        if slot not in range(1, 5):
+            raise ValueError(f"Setup memory location {slot} must be 1, 2, 3 or 4")
+        self.write(f"*RCL {slot}", custom_err_message=f"recall setup {slot}")
+        if self.cache_state and slot in self._setups:
+            for ch, state in zip(self.channels, self._setups[slot]):
+                ch._state.clear()
+                ch._state.update(state)
+
+    def invalidate_state(self):
+        """Forget the cached settings of both channels (e.g. after the
+        instrument was changed from the front panel)"""
+        for ch in self.channels:
+            ch.invalidate_state()
+
     def get_error(self) -> str:
         """Get the contents of the Error/Event queue on the device
 
@@ -409,7 +828,14 @@ class FuncGen:
             with keys output, function, amplitude, offset, and frequency with
             corresponding values
         """
-        return [ch.get_settings() for ch in self.channels]
+        # One compound query for all channels
+        queries = [ch._settings_queries() for ch in self.channels]
+        responses = self.query_many([query for qs in queries for query in qs])
+        settings, i = [], 0
+        for ch, qs in zip(self.channels, queries):
+            settings.append(ch._parse_settings(responses[i:i + len(qs)]))
+            i += len(qs)
+        return settings
 
     def print_settings(self):
         """Prints table of the current setting for both channels"""
@@ -542,7 +968,8 @@ class FuncGen:
             # Get the length of the waveform
             waveform_length = int(self.query("DATA:POINts? EMEMory"))
             # Get the waveform (returns binary values)
-            waveform = self._inst.query_binary_values(
+            waveform = self._call(
+                "query_binary_values",
                 "DATA:DATA? EMEMory",
                 datatype="H",
                 is_big_endian=True,
@@ -558,6 +985,38 @@ class FuncGen:
         print(f"Waveform USER{memory_num} is not in use")
         return np.array([])
 
+    @staticmethod
+    def waveform_hash(waveform: np.ndarray) -> str:
+        """Hash of a waveform as it is transferred to the instrument"""
+        return hashlib.sha1(np.asarray(waveform).astype(">u2").tobytes()).hexdigest()
+
+    def invalidate_waveform_cache(self, memory_num: int = None):
+        """Forget which waveforms were uploaded to the user memories (e.g.
+        after they were changed from the front panel)
+
+        Parameters
+        ----------
+        memory_num : int, optional
+            Only forget this user memory
+        """
+        if memory_num is None:
+            self._waveform_hashes.clear()
+        else:
+            self._waveform_hashes.pop(memory_num, None)
+
+    def waveform_transfer_stats(self) -> dict:
+        """Statistics of the waveform uploads
+
+        Returns
+        -------
+        dict
+            `waveform_transfers` and the mean throughput in kB/s
+        """
+        stats = dict(self.waveform_transfers)
+        if stats["seconds"] > 0:
+            stats["throughput"] = round(stats["bytes"] / stats["seconds"] / 1e3, 1)
+        return stats
+
     def set_custom_waveform(
         self,
         waveform: np.ndarray,
@@ -565,9 +1024,12 @@ class FuncGen:
         memory_num: int = 0,
         verify: bool = True,
         print_progress: bool = True,
+        use_cache: bool = True,
+        fast_verify: bool = False,
     ):
         """Transfer waveform data to edit memory and then user memory.
-        NOTE: Will overwrite without warnings
+        NOTE: Will overwrite without warnings (unless the same waveform was
+        uploaded to the user memory before in this session, see `use_cache`)
 
         Parameters
         ----------
@@ -582,6 +1044,12 @@ class FuncGen:
         verify : bool, default `True`
             Verify that the waveform has been transferred and is what was sent
         print_progress : bool, default `True`
+        use_cache : bool, default `True`
+            Skip the upload if the user memory already contains the waveform
+            (compared by hash with the waveform uploaded in this session)
+        fast_verify : bool, default `False`
+            Verify by the length and values sampled at a few points (one
+            compound query) instead of reading back the full waveform
 
         Returns
         -------
@@ -614,11 +1082,29 @@ class FuncGen:
             waveform = self._normalise_to_waveform(waveform)
         if print_progress:
             print("ok")
+        # Skip the upload if the user memory already contains the waveform
+        waveform_hash = self.waveform_hash(waveform)
+        if use_cache and self._waveform_hashes.get(memory_num) == waveform_hash:
+            if print_progress:
+                print(f"USER{memory_num} already contains the waveform")
+            self.waveform_transfers["skipped"] += 1
+            return waveform
+        self._waveform_hashes.pop(memory_num, None)
+        if print_progress:
             print("Transfer waveform to function generator..", end=" ")
         # Transfer waveform
-        self._inst.write_binary_values(
-            "DATA:DATA EMEMory,", waveform, datatype="H", is_big_endian=True
+        self._flush_batch()
+        t0 = time.perf_counter()
+        self._call(
+            "write_binary_values",
+            "DATA:DATA EMEMory,",
+            waveform,
+            datatype="H",
+            is_big_endian=True,
         )
+        self.waveform_transfers["seconds"] += time.perf_counter() - t0
+        self.waveform_transfers["bytes"] += 2 * len(waveform)
+        self.waveform_transfers["uploads"] += 1
         # Check for errors and check lengths are matching
         transfer_error = self.get_error()
         emem_wf_length = self.query("DATA:POINts? EMEMory")
@@ -629,8 +1115,13 @@ class FuncGen:
                 f"\nError from the instrument: {transfer_error}"
             )
             raise RuntimeError(msg)
+        if verify and fast_verify and not self._spot_check_waveform(waveform):
+            raise RuntimeError(
+                "Waveform in temporary EMEMory does not match the waveform at "
+                f"the sampled points.\nError from the instrument: {transfer_error}"
+            )
         if print_progress:
-            print("ok")
+            print(f"ok ({self.waveform_transfer_stats().get('throughput')} kB/s)")
             print(f"Copy waveform to USER{memory_num}..", end=" ")
         self.write(f"DATA:COPY USER{memory_num},EMEMory")
         if print_progress:
@@ -638,7 +1129,9 @@ class FuncGen:
         if verify:
             if print_progress:
                 print(f"Verify waveform USER{memory_num}..")
-            if f"USER{memory_num}" in self.get_waveform_catalogue():
+            if f"USER{memory_num}" not in self.get_waveform_catalogue():
+                raise RuntimeError(f"USER{memory_num} is empty")
+            if not fast_verify:
                 verif = self._verify_waveform(
                     waveform,
                     memory_num,
@@ -649,10 +1142,32 @@ class FuncGen:
                     raise RuntimeError(
                         f"USER{memory_num} does not contain the waveform"
                     )
-            else:
-                raise RuntimeError(f"USER{memory_num} is empty")
+        self._waveform_hashes[memory_num] = waveform_hash
         return waveform
 
+    def _spot_check_waveform(self, waveform: np.ndarray, n_points: int = 16) -> bool:
+        """Compare the waveform in edit memory to argument waveform at a few
+        points spread over the waveform (including the first and last point),
+        all points are queried in one compound query
+
+        Parameters
+        ----------
+        waveform : ndarray
+            Waveform as ints spanning the resolution of the function gen
+        n_points : int, default 16
+            Number of points to compare
+
+        Returns
+        -------
+        bool
+            Boolean according to equal/not equal at the sampled points
+        """
+        indices = np.unique(np.linspace(0, len(waveform) - 1, n_points).astype(int))
+        responses = self.query_many(
+            [f"DATA:VALue? EMEMory,{i + 1}" for i in indices]  # points count from 1
+        )
+        return np.array_equal(np.array(responses, dtype=int), np.asarray(waveform)[indices])
+
     def _normalise_to_waveform(self, shape: np.ndarray) -> np.ndarray:
         """Normalise a shape of any discretisation and range to a waveform that
         can be transmitted to the function generator
@@ -725,10 +1240,7 @@ class FuncGen:
                 )
             return False, instrument_waveform, None
         # Compare each element
-        not_equal = []
-        for i in range(len_wav):
-            if not instrument_waveform[i] == waveform[i]:
-                not_equal.append(i)
+        not_equal = np.flatnonzero(np.asarray(instrument_waveform) != waveform).tolist()
         # Return depending of whether list is empty or not
         if not not_equal:  # if list is empty
             if print_result:
@@ -825,6 +1337,9 @@ class FuncGenChannel:
     _state_to_str = {"1": "ON", "0": "OFF", 1: "ON", 0: "OFF"}
     """Dictionary for converting output states to "ON" and "OFF" """
 
+    _state_to_int = {"ON": 1, "OFF": 0, "1": 1, "0": 0, 1: 1, 0: 0}
+    """Dictionary for converting output states to 1 and 0"""
+
     def __init__(self, fgen: FuncGen, channel: int, impedance: str):
         self._fgen = fgen
         self._channel = channel
@@ -837,6 +1352,82 @@ class FuncGenChannel:
         self.channel_limits = copy.deepcopy(self._fgen.instrument_limits)
         """Channel limits for the individual channel, same form as
         `FuncGen.instrument_limits`"""
+        self._state = self._fgen._session["channel_states"][channel]
+        """dict: Last confirmed settings (output, function, amplitude, offset,
+        frequency in V and Hz) when `FuncGen.cache_state` is enabled, shared
+        with the channels of other `FuncGen` objects using the same session"""
+        self.sweep = None
+        """dict: The sweep configured with `set_sweep` (start and stop in Hz,
+        times in s, spacing and the time of the last trigger)"""
+
+    @property
+    def state(self) -> dict:
+        """Copy of the cached settings of the channel (only the settings that
+        were set or queried since the cache was last invalidated)"""
+        return dict(self._state)
+
+    def invalidate_state(self):
+        """Forget the cached settings of the channel"""
+        self._state.clear()
+
+    def _remember(self, key: str, value):
+        """Store a confirmed setting in the cache (inside `FuncGen.batch` it is
+        confirmed when the batch is written without errors)"""
+        if self._fgen.cache_state:
+            self._state[key] = value
+            if self._fgen._batch is not None:
+                self._fgen._session["batch_settings"].append((self._state, key))
+        return value
+
+    def is_set(self, key: str, value) -> bool:
+        """Check if a setting is known to already have a value (in which case
+        writing it can be skipped)
+
+        Parameters
+        ----------
+        key : {"output", "function", "amplitude", "offset", "frequency"}
+            The setting, a key of `state`
+        value
+            The value in the units of `state` (V and Hz)
+
+        Returns
+        -------
+        bool
+            `True` if the cached setting has the value, `False` if it differs,
+            is unknown or the cache is disabled (`FuncGen.cache_state`) or
+            bypassed (`FuncGen.verify_param_set`)
+        """
+        return (
+            self._fgen.cache_state
+            and not self._fgen.verify_param_set
+            and key in self._state
+            and self._state[key] == value
+        )
+
+    def cached(self, key: str):
+        """Value of a setting from the cache, queried from the instrument
+        (and cached) if it is unknown
+
+        Parameters
+        ----------
+        key : {"output", "function", "amplitude", "offset", "frequency"}
+            The setting, a key of `state`
+
+        Returns
+        -------
+        int, str or float
+            The value in the units of `state` (V and Hz)
+        """
+        if self._fgen.cache_state and key in self._state:
+            return self._state[key]
+        getters = {
+            "output": self.get_output_state,
+            "function": self.get_function,
+            "amplitude": self.get_amplitude,
+            "offset": self.get_offset,
+            "frequency": self.get_frequency,
+        }
+        return getters[key]()
 
     def _impedance_dependent_limit(self, limit_type: str) -> bool:
         """Check if the limit type is impedance dependent (voltages) or
@@ -956,23 +1547,33 @@ class FuncGenChannel:
     # Get currently used parameters from function generator
     def get_output_state(self) -> int:
         """Returns 0 for "OFF", 1 for "ON" """
-        return int(self._fgen.query(f"OUTPut{self._channel}:STATe?"))
+        return self._remember(
+            "output", int(self._fgen.query(f"OUTPut{self._channel}:STATe?"))
+        )
 
     def get_function(self) -> str:
         """Returns string of function name"""
-        return self._fgen.query(f"{self._source}FUNCtion:SHAPe?")
+        return self._remember(
+            "function", self._fgen.query(f"{self._source}FUNCtion:SHAPe?")
+        )
 
     def get_amplitude(self) -> float:
         """Returns peak-to-peak voltage in volts"""
-        return float(self._fgen.query(f"{self._source}VOLTage:AMPLitude?"))
+        return self._remember(
+            "amplitude", float(self._fgen.query(f"{self._source}VOLTage:AMPLitude?"))
+        )
 
     def get_offset(self) -> float:
         """Returns offset voltage in volts"""
-        return float(self._fgen.query(f"{self._source}VOLTage:OFFSet?"))
+        return self._remember(
+            "offset", float(self._fgen.query(f"{self._source}VOLTage:OFFSet?"))
+        )
 
     def get_frequency(self) -> float:
         """Returns frequency in Hertz"""
-        return float(self._fgen.query(f"{self._source}FREQuency?"))
+        return self._remember(
+            "frequency", float(self._fgen.query(f"{self._source}FREQuency?"))
+        )
 
     # Get limits set in the channel class
     def get_frequency_lims(self) -> List[float]:
@@ -1003,10 +1604,23 @@ class FuncGenChannel:
             function, amplitude, offset, and frequency and values tuples of
             the corresponding return and unit
         """
+        return self._parse_settings(self._fgen.query_many(self._settings_queries()))
+
+    def _settings_queries(self) -> List[str]:
+        """Queries for `get_settings`"""
+        return [
+            f"{self._source}FUNCtion:SHAPe?",
+            f"{self._source}VOLTage:AMPLitude?",
+            f"{self._source}FREQuency?",
+        ]
+
+    def _parse_settings(self, responses: List[str]) -> dict:
+        """Settings dictionary from the responses to `_settings_queries`"""
+        function, amplitude, frequency = responses
         return {
-            "function": (self.get_function(), ""),
-            "amplitude": (self.get_amplitude(), "Vpp"),
-            "frequency": (self.get_frequency(), "Hz"),
+            "function": (self._remember("function", function), ""),
+            "amplitude": (self._remember("amplitude", float(amplitude)), "Vpp"),
+            "frequency": (self._remember("frequency", float(frequency)), "Hz"),
         }
 
     def print_settings(self):
@@ -1057,10 +1671,13 @@ class FuncGenChannel:
             applying the set function does not match the value returned by the
             get function
         """
+        if self.is_set("output", self._state_to_int.get(state)):
+            return
         err_msg = f"turn channel {self._channel} to state {state}"
         self._fgen.write(
             f"OUTPut{self._channel}:STATe {state}", custom_err_message=err_msg
         )
+        self._remember("output", self._state_to_int.get(state))
         if self._fgen.verify_param_set:
             actual_state = self.get_output_state()
             if not actual_state == state:
@@ -1101,8 +1718,11 @@ class FuncGenChannel:
             applying the set function does not match the value returned by the
             get function
         """
+        if self.is_set("function", shape):
+            return
         cmd = f"{self._source}FUNCtion:SHAPe {shape}"
         self._fgen.write(cmd, custom_err_message=f"set function {shape}")
+        self._remember("function", shape)
         if self._fgen.verify_param_set:
             actual_shape = self.get_function()
             if not actual_shape == shape:
@@ -1149,9 +1769,11 @@ class FuncGenChannel:
                     f"[{min_ampl}, {max_ampl}]{unit}"
                 )
                 raise NotSetError(msg)
+        if self.is_set("amplitude", amplitude):
+            return
         # Check that the new amplitude will not violate voltage limits
         min_volt, max_volt = self.get_voltage_lims()
-        current_offset = self.get_offset()
+        current_offset = self.cached("offset")
         if (
             amplitude / 2 - current_offset < min_volt
             or amplitude / 2 + current_offset > max_volt
@@ -1166,6 +1788,7 @@ class FuncGenChannel:
         cmd = f"{self._source}VOLTage:LEVel {amplitude}{unit}"
         err_msg = f"set amplitude {amplitude}{unit}"
         self._fgen.write(cmd, custom_err_message=err_msg)
+        self._remember("amplitude", amplitude)
         # Verify that the amplitude has been set
         if self._fgen.verify_param_set:
             actual_amplitude = self.get_amplitude()
@@ -1203,8 +1826,10 @@ class FuncGenChannel:
         """
         # Check that the new offset will not violate voltage limits
         min_volt, max_volt = self.get_voltage_lims()
-        current_amplitude = self.get_amplitude()
         offset = _SI_prefix_to_factor(unit) * offset
+        if self.is_set("offset", offset):
+            return
+        current_amplitude = self.cached("amplitude")
         if (
             current_amplitude / 2 - offset < min_volt
             or current_amplitude / 2 + offset > max_volt
@@ -1219,6 +1844,7 @@ class FuncGenChannel:
         cmd = f"{self._source}VOLTage:LEVel:OFFSet {offset}{unit}"
         err_msg = f"set offset {offset}{unit}"
         self._fgen.write(cmd, custom_err_message=err_msg)
+        self._remember("offset", offset)
         # Verify that the offset has been set
         if self._fgen.verify_param_set:
             actual_offset = self.get_offset()
@@ -1233,21 +1859,28 @@ class FuncGenChannel:
                 )
                 raise NotSetError(msg)
 
-    def set_frequency(self, freq: float, unit: str = "Hz"):
-        """Set the frequency in Hertz (or mHz, kHz, MHz, see options)
+    def prepare_frequency(self, freq: float, unit: str = "Hz") -> Tuple[str, float]:
+        """Check a frequency against the limits and build the command that
+        sets it, so it can be written later without any checks (see
+        `write_prepared`)
 
         Parameters
         ----------
-        freq : float
-            The resolution is 1 μHz or 12 digits.
+        freq : float or {"min", "max"}
+            The frequency
         unit : {mHz, Hz, kHz, MHz}, default Hz
 
+        Returns
+        -------
+        command : str
+            The command that sets the frequency
+        freq : float
+            The frequency in Hz
+
         Raises
         ------
         NotSetError
-            If `self._fgen.verify_param_set` is `True` and the value after
-            applying the set function does not match the value returned by the
-            get function
+            If the frequency is not within the frequency limits
         """
         if str(freq).lower() in ["min", "max"]:  # handle min and max keywords
             unit = ""  # no unit for MIN/MAX
@@ -1264,11 +1897,47 @@ class FuncGenChannel:
                     f"[{min_freq}, {max_freq}]Hz"
                 )
                 raise NotSetError(msg)
+        return f"{self._source}FREQuency:FIXed {freq}{unit}", freq
+
+    def write_prepared(self, command: str, key: str, value):
+        """Write a command built by one of the `prepare_` functions and
+        remember the setting it changes
+
+        Parameters
+        ----------
+        command : str
+            The prepared command
+        key : str
+            The setting changed by the command (e.g. "frequency")
+        value
+            The new value of the setting
+        """
+        self._fgen.write(command, custom_err_message=f"write {command}")
+        self._remember(key, value)
+
+    def set_frequency(self, freq: float, unit: str = "Hz"):
+        """Set the frequency in Hertz (or mHz, kHz, MHz, see options)
+
+        Parameters
+        ----------
+        freq : float
+            The resolution is 1 μHz or 12 digits.
+        unit : {mHz, Hz, kHz, MHz}, default Hz
+
+        Raises
+        ------
+        NotSetError
+            If `self._fgen.verify_param_set` is `True` and the value after
+            applying the set function does not match the value returned by the
+            get function
+        """
+        if str(freq).lower() in ["min", "max"]:
+            unit = ""  # no unit for MIN/MAX
+        command, freq = self.prepare_frequency(freq, unit)
+        if self.is_set("frequency", freq):
+            return
         # Set the frequency
-        self._fgen.write(
-            f"{self._source}FREQuency:FIXed {freq}{unit}",
-            custom_err_message=f"set frequency {freq}{unit}",
-        )
+        self.write_prepared(command, "frequency", freq)
         # Verify that the amplitude has been set
         if self._fgen.verify_param_set:
             actual_freq = self.get_frequency()
@@ -1287,6 +1956,153 @@ class FuncGenChannel:
                 )
                 raise NotSetError(msg)
 
+    ## ~~~~~~~~~~~~~~~~~~~~~~~~~~ FREQUENCY SWEEP ~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
+
+    def set_sweep(
+        self,
+        start: float,
+        stop: float,
+        sweep_time: float,
+        spacing: str = "LINear",
+        hold_time: float = 0,
+        return_time: float = 1e-3,
+        unit: str = "Hz",
+    ):
+        """Configure the built-in frequency sweep of the channel in manual
+        mode: the output stays at the start frequency until a trigger (see
+        `start_sweep`), then sweeps once to the stop frequency, holds it for
+        `hold_time` and returns to the start frequency
+
+        Parameters
+        ----------
+        start : float
+            Start frequency
+        stop : float
+            Stop frequency (can be lower than the start frequency)
+        sweep_time : float
+            Duration of the sweep in seconds (1 ms to 300 s)
+        spacing : {"LINear", "LOGarithmic"}, default "LINear"
+            Linear or logarithmic change of the frequency with time
+        hold_time : float, default 0
+            Time at the stop frequency after the sweep in seconds
+        return_time : float, default 1e-3
+            Time to return to the start frequency in seconds
+        unit : {mHz, Hz, kHz, MHz}, default Hz
+            Unit of the start and stop frequencies
+
+        Raises
+        ------
+        NotSetError
+            If a frequency is not within the frequency limits
+        ValueError
+            If the spacing is not recognised or the sweep time is out of range
+        """
+        if spacing.upper() not in ["LIN", "LINEAR", "LOG", "LOGARITHMIC"]:
+            raise ValueError(f"Unknown sweep spacing '{spacing}'")
+        if not 1e-3 <= sweep_time <= 300:
+            raise ValueError(f"Sweep time {sweep_time}s is not within [1ms, 300s]")
+        # Check the frequencies against the limits
+        _, start = self.prepare_frequency(start, unit)
+        _, stop = self.prepare_frequency(stop, unit)
+        with self._fgen.batch(check_errors=True):
+            for command in [
+                f"{self._source}FREQuency:STARt {start}Hz",
+                f"{self._source}FREQuency:STOP {stop}Hz",
+                f"{self._source}SWEep:TIME {sweep_time}",
+                f"{self._source}SWEep:HTIMe {hold_time}",
+                f"{self._source}SWEep:RTIMe {return_time}",
+                f"{self._source}SWEep:SPACing {spacing}",
+                f"{self._source}SWEep:MODE MANual",
+                f"{self._source}FREQuency:MODE SWEep",
+            ]:
+                self._fgen.write(command, custom_err_message="configure the sweep")
+        # The fixed frequency no longer describes the output
+        self._state.pop("frequency", None)
+        self.sweep = {
+            "start": start,
+            "stop": stop,
+            "time": sweep_time,
+            "hold": hold_time,
+            "return": return_time,
+            "spacing": "LOG" if spacing.upper().startswith("LOG") else "LIN",
+            "triggered": None,
+        }
+
+    def start_sweep(self) -> float:
+        """Trigger one sweep and timestamp it
+
+        The trigger (`*TRG`) also starts a configured sweep on the other
+        channel.
+
+        Returns
+        -------
+        float
+            `time.perf_counter()` when the trigger was sent, the time base of
+            `frequency_at`
+        """
+        if self.sweep is None:
+            raise RuntimeError("Configure the sweep with set_sweep first")
+        self._fgen.software_trig()
+        self._fgen._flush_batch()
+        self.sweep["triggered"] = time.perf_counter()
+        return self.sweep["triggered"]
+
+    def stop_sweep(self):
+        """Return the channel to a fixed frequency (the configured sweep is
+        kept to map frames acquired during the sweep with `frequency_at`)"""
+        self._fgen.write(
+            f"{self._source}FREQuency:MODE CW", custom_err_message="stop the sweep"
+        )
+
+    def sweep_remaining(self, t: float = None) -> float:
+        """Time left until the triggered sweep reaches the stop frequency
+
+        Parameters
+        ----------
+        t : float, optional
+            `time.perf_counter()` time, now if `None`
+
+        Returns
+        -------
+        float
+            Remaining time in seconds (negative after the sweep)
+        """
+        if self.sweep is None or self.sweep["triggered"] is None:
+            raise RuntimeError("No sweep was started")
+        t = time.perf_counter() if t is None else t
+        return self.sweep["triggered"] + self.sweep["time"] - t
+
+    def frequency_at(self, t, delay: float = 0.0) -> np.ndarray:
+        """Instantaneous frequency of the triggered sweep at given times
+
+        Parameters
+        ----------
+        t : float or array_like
+            `time.perf_counter()` times (e.g. the times the camera frames were
+            taken)
+        delay : float, default 0.0
+            Time between the trigger and the effect of interest (e.g. the
+            response time of the system that is observed), the frequency at
+            `t - delay` is returned
+
+        Returns
+        -------
+        np.ndarray
+            The frequency in Hz, the stop frequency during the hold time and
+            NaN before the sweep and from the return to the start frequency
+        """
+        if self.sweep is None or self.sweep["triggered"] is None:
+            raise RuntimeError("No sweep was started")
+        sweep = self.sweep
+        elapsed = np.asarray(t, dtype=float) - sweep["triggered"] - delay
+        fraction = np.clip(elapsed / sweep["time"], 0, 1)
+        if sweep["spacing"] == "LOG":
+            freq = sweep["start"] * (sweep["stop"] / sweep["start"]) ** fraction
+        else:
+            freq = sweep["start"] + (sweep["stop"] - sweep["start"]) * fraction
+        swept = (elapsed >= 0) & (elapsed <= sweep["time"] + sweep["hold"])
+        return np.where(swept, freq, np.nan)
+
 
 ## ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ EXAMPLES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
 
@@ -1389,6 +2205,121 @@ def example_set_and_use_custom_waveform(
         fgen.close()
 
 
+def example_waveform_cache(address: str, memory_num: int = 1) -> dict:
+    """Example of the waveform cache: uploading the same waveform again is
+    skipped, and verifying by sampled points instead of a full readback"""
+    print("\n\n", example_waveform_cache.__doc__)
+    x = np.linspace(0, 4 * np.pi, 8000)
+    signals = {"first": np.sin(x), "same": np.sin(x), "changed": np.cos(x)}
+    with FuncGen(address) as fgen:
+        for fast_verify in (False, True):
+            fgen.invalidate_waveform_cache()
+            for name, signal in signals.items():
+                t0 = time.perf_counter()
+                fgen.set_custom_waveform(
+                    signal,
+                    memory_num=memory_num,
+                    fast_verify=fast_verify,
+                    print_progress=False,
+                )
+                print(
+                    f"{name:>8s} waveform, {'fast' if fast_verify else 'full'} "
+                    f"verification: {(time.perf_counter() - t0) * 1e3:.1f} ms"
+                )
+        stats = fgen.waveform_transfer_stats()
+    print(stats)
+    return stats
+
+
+def example_batched_commands(address: str, n_repeats: int = 20) -> dict:
+    """Example comparing the latency of separate commands and queries with
+    batched compound commands (frequency, amplitude and output in one write,
+    all settings in one query)"""
+    print("\n\n", example_batched_commands.__doc__)
+    values = [(2.35e6, 10), (1.5e6, 12)]  # Alternate so the cache does not skip writes
+    latencies = {}
+    with FuncGen(address) as fgen:
+        for name, batched in (("separate", False), ("batched", True)):
+            t0 = time.perf_counter()
+            for i in range(n_repeats):
+                freq, ampl = values[i % 2]
+                with fgen.batch() if batched else contextlib.nullcontext():
+                    fgen.ch1.set_frequency(freq)
+                    fgen.ch1.set_amplitude(ampl)
+                    fgen.ch1.set_output("ON")
+            latencies[f"{name} set"] = (time.perf_counter() - t0) / n_repeats
+            t0 = time.perf_counter()
+            for i in range(n_repeats):
+                if batched:
+                    fgen.get_settings()
+                else:
+                    [
+                        (ch.get_function(), ch.get_amplitude(), ch.get_frequency())
+                        for ch in fgen.channels
+                    ]
+            latencies[f"{name} get settings"] = (time.perf_counter() - t0) / n_repeats
+        fgen.ch1.set_output("OFF")
+    for name, latency in latencies.items():
+        print(f"{name:>22s}: {latency * 1e3:.2f} ms")
+    return latencies
+
+
+def example_presets(
+    address: str,
+    frequencies: Tuple[float, ...] = (2.35e6, 1.5e6, 2e6, 1.9e6),
+    n_repeats: int = 20,
+) -> dict:
+    """Example comparing the latency of switching between a few frequencies
+    with `set_frequency`, prepared commands and setup memory recalls"""
+    print("\n\n", example_presets.__doc__)
+    latencies = {}
+    with FuncGen(address) as fgen:
+        fgen.ch1.set_output("ON")
+        prepared = [fgen.ch1.prepare_frequency(freq) for freq in frequencies]
+        for slot, freq in enumerate(frequencies, start=1):
+            fgen.ch1.set_frequency(freq)
+            fgen.save_setup(slot)
+        switches = {
+            "set_frequency": lambda i: fgen.ch1.set_frequency(frequencies[i]),
+            "prepared command": lambda i: fgen.ch1.write_prepared(
+                prepared[i][0], "frequency", prepared[i][1]
+            ),
+            "recall setup": lambda i: fgen.recall_setup(i + 1),
+        }
+        for name, switch in switches.items():
+            t0 = time.perf_counter()
+            for i in range(n_repeats):
+                switch(i % len(frequencies))
+            latencies[name] = (time.perf_counter() - t0) / n_repeats
+        fgen.ch1.set_output("OFF")
+    for name, latency in latencies.items():
+        print(f"{name:>22s}: {latency * 1e3:.2f} ms")
+    return latencies
+
+
+def example_frequency_sweep(
+    address: str, start: float = 1e6, stop: float = 3e6, sweep_time: float = 2
+) -> np.ndarray:
+    """Example of a triggered frequency sweep, where the instantaneous
+    frequency is looked up for timestamps taken during the sweep (e.g. the
+    times camera frames were taken)"""
+    print("\n\n", example_frequency_sweep.__doc__)
+    with FuncGen(address) as fgen:
+        fgen.ch1.set_sweep(start, stop, sweep_time)
+        fgen.ch1.set_output("ON")
+        fgen.ch1.start_sweep()
+        timestamps = []
+        while fgen.ch1.sweep_remaining() > 0:
+            time.sleep(sweep_time / 10)
+            timestamps.append(time.perf_counter())
+        fgen.ch1.stop_sweep()
+        fgen.ch1.set_output("OFF")
+        freqs = fgen.ch1.frequency_at(timestamps)
+    for timestamp, freq in zip(timestamps, freqs):
+        print(f"{timestamp - timestamps[0]:6.3f} s: {freq / 1e6:.4f} MHz")
+    return freqs
+
+
 ## ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ MAIN FUNCTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
 
 if __name__ == "__main__":
@@ -1398,3 +2329,7 @@ if __name__ == "__main__":
     example_changing_limits(_VISA_ADDRESS)
     with FuncGen(_VISA_ADDRESS) as fgen:
         example_set_and_use_custom_waveform(fgen)
+    example_batched_commands(_VISA_ADDRESS)
+    example_presets(_VISA_ADDRESS)
+    example_waveform_cache(_VISA_ADDRESS)
+    example_frequency_sweep(_VISA_ADDRESS)
@@ -2,13 +2,18 @@ import serial
 import time
 from settings import *
 from pynput import keyboard
+from piezo_driver import switch_frame
 import datetime
 # import tektronix_func_gen as tfg
 
-# Initiate contact with arduino
-arduino = serial.Serial(port=SERIAL_PORT_ARDUINO, baudrate=BAUDRATE_ARDUINO)
-print(arduino.readline().decode())
-time.sleep(1)  # give serial communication time to establish
+# Initiate contact with arduino (or the simulated one)
+port = SERIAL_PORT_ARDUINO
+if SIMULATE_HARDWARE:
+    from serial_loopback import LoopbackArduino
+    simulated_arduino = LoopbackArduino()
+    port = simulated_arduino.port
+arduino = serial.Serial(port=port, baudrate=BAUDRATE_ARDUINO)
+print(arduino.readline().decode())  # Wait for the greeting, the Arduino is ready once it is sent
 
 # Initiate status of 4 piëzo transducers
 status_channels = [False, False, False, False]
@@ -20,8 +25,7 @@ def move(action):
 
     global status_channels
 
-    arduino.write(b"9")  # Turn old piezo off
-    arduino.write(f"{action}".encode())  # Turn new piezo on
+    arduino.write(switch_frame(action))  # Turn old piezo off and new piezo on
 
     # Reset channels
     channels = [False, False, False, False]
@@ -0,0 +1,319 @@
+import time
+import numpy as np
+
+
+def update_kernel(dx, dy, size):
+    """
+    Q values update kernel as a function of the distance to the swarm, analytic form of Q_VALUES_UPDATE_KERNEL
+    :param dx:      Distance along the first spatial axis
+    :param dy:      Distance along the second spatial axis
+    :param size:    Size of the environment
+    :return:        Kernel values
+    """
+    return np.abs(np.log(dx**2 + dy**2 + 1) / np.log(2 * size**2 + 1) - 1)
+
+
+class TiledQValues:
+
+    def __init__(self, size, default_vectors, tile_size=32, update_radius=64, nr_actions=4, dtype=float):
+        """
+        Two-level Q values field: every tile is a single vector per action until the swarm comes near, then it is
+        allocated at full (per pixel) resolution. Indexes like the dense (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2) array.
+        :param size:            Size of the environment (IMG_SIZE)
+        :param default_vectors: Initial vector per action, shape (NR_OF_PIEZOS, 2)
+        :param tile_size:       Size of the square tiles (pixels)
+        :param update_radius:   Tiles within this distance (pixels) of the swarm are updated per pixel, further tiles
+                                are updated at tile resolution, full resolution tiles lazily (None updates every tile
+                                per pixel)
+        :param nr_actions:      NR_OF_PIEZOS
+        :param dtype:           Data type of the values
+        """
+        self.size = size
+        self.tile_size = tile_size
+        self.update_radius = update_radius
+        self.dtype = np.dtype(dtype)
+        self.shape = (nr_actions, size, size, 2)
+        self.ndim = 4
+        self.n_tiles = -(-size // tile_size)
+
+        # Coarse value of each tile, used as long as the tile is not allocated
+        self.coarse = np.empty((nr_actions, self.n_tiles, self.n_tiles, 2), dtype=self.dtype)
+        self.coarse[:] = np.asarray(default_vectors, dtype=self.dtype)[:, np.newaxis, np.newaxis, :]
+
+        # Full resolution tiles {(tile_x, tile_y): array of shape (NR_OF_PIEZOS, tile_size, tile_size, 2)}
+        self.tiles = {}
+
+        # Updates of full resolution tiles far from the swarm that are not applied yet, the values of tile (a, b) are
+        # scale[:, a, b] * tiles[(a, b)] + offset[:, a, b]
+        self.scale = np.ones((nr_actions, self.n_tiles, self.n_tiles), dtype=self.dtype)
+        self.offset = np.zeros((nr_actions, self.n_tiles, self.n_tiles, 2), dtype=self.dtype)
+
+    @property
+    def nbytes(self):
+        return (self.coarse.nbytes + self.scale.nbytes + self.offset.nbytes
+                + sum(tile.nbytes for tile in self.tiles.values()))
+
+    def _bounds(self, a, b):
+        """
+        Pixel bounds of tile (a, b)
+        """
+        return (a * self.tile_size, min((a + 1) * self.tile_size, self.size),
+                b * self.tile_size, min((b + 1) * self.tile_size, self.size))
+
+    def _allocate(self, a, b):
+        """
+        Allocate tile (a, b) at full resolution from its coarse value (an allocated tile gets its pending updates)
+        """
+        if (a, b) not in self.tiles:
+            x0, x1, y0, y1 = self._bounds(a, b)
+            tile = np.empty((self.shape[0], x1 - x0, y1 - y0, 2), dtype=self.dtype)
+            tile[:] = self.coarse[:, a, b, np.newaxis, np.newaxis, :]
+            self.tiles[(a, b)] = tile
+            self.scale[:, a, b] = 1
+            self.offset[:, a, b] = 0
+        return self._tile(a, b)
+
+    def _tile(self, a, b):
+        """
+        Full resolution tile (a, b) with its pending updates applied
+        """
+        tile = self.tiles[(a, b)]
+        scale, offset = self.scale[:, a, b], self.offset[:, a, b]
+        if np.any(scale != 1) or np.any(offset != 0):
+            tile *= scale[:, np.newaxis, np.newaxis, np.newaxis]
+            tile += offset[:, np.newaxis, np.newaxis, :]
+            scale[:] = 1
+            offset[:] = 0
+        return tile
+
+    ## Conversion from and to the dense .npy format
+
+    @classmethod
+    def from_dense(cls, q_values, tile_size=32, update_radius=64, atol=0.0):
+        """
+        Build a tiled field from dense Q values, tiles that are constant (within atol) are stored as a single vector
+        :param q_values:        Dense Q values, shape (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2)
+        :param tile_size:       Size of the square tiles (pixels)
+        :param update_radius:   See __init__
+        :param atol:            Tolerance to consider a tile constant
+        :return:                TiledQValues
+        """
+        q_values = np.asarray(q_values)
+        field = cls(size=q_values.shape[1],
+                    default_vectors=q_values[:, 0, 0, :],
+                    tile_size=tile_size,
+                    update_radius=update_radius,
+                    nr_actions=q_values.shape[0],
+                    dtype=q_values.dtype)
+
+        for a in range(field.n_tiles):
+            for b in range(field.n_tiles):
+                x0, x1, y0, y1 = field._bounds(a, b)
+                block = q_values[:, x0:x1, y0:y1, :]
+                if np.all(np.abs(block - block[:, :1, :1, :]) <= atol):
+                    field.coarse[:, a, b, :] = block[:, 0, 0, :]
+                else:
+                    field.tiles[(a, b)] = block.copy()
+
+        return field
+
+    def to_dense(self):
+        """
+        Convert to dense Q values
+        :return:    Array of shape (NR_OF_PIEZOS, IMG_SIZE, IMG_SIZE, 2)
+        """
+        q_values = np.empty(self.shape, dtype=self.dtype)
+        for a in range(self.n_tiles):
+            for b in range(self.n_tiles):
+                x0, x1, y0, y1 = self._bounds(a, b)
+                if (a, b) in self.tiles:
+                    q_values[:, x0:x1, y0:y1, :] = self._tile(a, b)
+                else:
+                    q_values[:, x0:x1, y0:y1, :] = self.coarse[:, a, b, np.newaxis, np.newaxis, :]
+        return q_values
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError('TiledQValues can only be converted to a new dense array')
+        q_values = self.to_dense()
+        return q_values if dtype is None else q_values.astype(dtype, copy=False)
+
+    def save(self, filename):
+        """
+        Save in the dense .npy format
+        """
+        np.save(filename, self.to_dense())
+
+    @classmethod
+    def load(cls, filename, tile_size=32, update_radius=64):
+        """
+        Load from the dense .npy format
+        """
+        return cls.from_dense(np.load(filename), tile_size=tile_size, update_radius=update_radius)
+
+    ## Indexing (same patterns as used on the dense array by calc_action and calc_actions)
+
+    def _region(self, slice_x, slice_y):
+        """
+        Dense block of all actions for a rectangular region
+        """
+        x0, x1, step_x = slice_x.indices(self.size)
+        y0, y1, step_y = slice_y.indices(self.size)
+        if step_x != 1 or step_y != 1:
+            raise IndexError('Only contiguous slices are supported')
+        x1, y1 = max(x0, x1), max(y0, y1)
+
+        region = np.empty((self.shape[0], x1 - x0, y1 - y0, 2), dtype=self.dtype)
+        for a in range(x0 // self.tile_size, -(-x1 // self.tile_size)):
+            for b in range(y0 // self.tile_size, -(-y1 // self.tile_size)):
+                tx0, tx1, ty0, ty1 = self._bounds(a, b)
+                ix0, ix1, iy0, iy1 = max(tx0, x0), min(tx1, x1), max(ty0, y0), min(ty1, y1)
+                target = (slice(None), slice(ix0 - x0, ix1 - x0), slice(iy0 - y0, iy1 - y0), slice(None))
+                if (a, b) in self.tiles:
+                    region[target] = self._tile(a, b)[:, ix0 - tx0:ix1 - tx0, iy0 - ty0:iy1 - ty0, :]
+                else:
+                    region[target] = self.coarse[:, a, b, np.newaxis, np.newaxis, :]
+        return region
+
+    def _gather(self, xs, ys):
+        """
+        Values of all actions at (broadcast) integer pixel coordinates
+        """
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=int), np.asarray(ys, dtype=int))
+        shape = xs.shape
+        xs, ys = xs.ravel(), ys.ravel()
+        if np.any((xs < 0) | (xs >= self.size) | (ys < 0) | (ys >= self.size)):
+            raise IndexError(f'Index out of bounds for size {self.size}')
+
+        tiles_x, tiles_y = xs // self.tile_size, ys // self.tile_size
+        values = self.coarse[:, tiles_x, tiles_y, :]
+
+        # Overwrite the coarse values with the full resolution tiles that are requested
+        keys = tiles_x * self.n_tiles + tiles_y
+        for key in np.unique(keys):
+            a, b = divmod(int(key), self.n_tiles)
+            if (a, b) in self.tiles:
+                selection = keys == key
+                values[:, selection] = self._tile(a, b)[:, xs[selection] - a * self.tile_size,
+                                                        ys[selection] - b * self.tile_size, :]
+
+        return values.reshape((self.shape[0],) + shape + (2,))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple) or len(key) != 4:
+            raise IndexError('TiledQValues must be indexed with [action, x, y, component]')
+        key_action, key_x, key_y, key_component = key
+
+        if isinstance(key_x, slice) and isinstance(key_y, slice):
+            values = self._region(key_x, key_y)
+            return values[key_action, :, :, key_component]
+        elif not isinstance(key_x, slice) and not isinstance(key_y, slice):
+            values = self._gather(key_x, key_y)
+            return values[(key_action, Ellipsis, key_component)]
+        else:
+            raise IndexError('Mixing slices and integer indices for x and y is not supported')
+
+    ## Update (same rule as update_q_values)
+
+    def update(self, action, memory, gamma):
+        """
+        Update the Q values of one action with the average movement in memory
+        :param action:  Performed action
+        :param memory:  Recent swarm positions
+        :param gamma:   Discount factor
+        :return:        self
+        """
+        # Get mean position of memory and average direction of swarm movement
+        mean_pos = np.mean(memory, 0, dtype=int)
+        avg_speed = np.mean(np.array(memory)[1:] - np.array(memory)[:-1], axis=0)
+
+        # Tiles near the swarm (distance from the swarm to the closest pixel of every tile)
+        starts = np.arange(self.n_tiles) * self.tile_size
+        ends = np.minimum(starts + self.tile_size, self.size) - 1
+        if self.update_radius is None:
+            near = np.ones((self.n_tiles, self.n_tiles), dtype=bool)
+        else:
+            dx = np.clip(mean_pos[1], starts, ends) - mean_pos[1]
+            dy = np.clip(mean_pos[0], starts, ends) - mean_pos[0]
+            near = np.hypot(dx[:, np.newaxis], dy[np.newaxis, :]) <= self.update_radius
+
+        # Allocate and update the tiles near the swarm per pixel
+        for a, b in zip(*np.nonzero(near)):
+            a, b = int(a), int(b)
+            tile = self._allocate(a, b)
+            x0, x1, y0, y1 = self._bounds(a, b)
+            kernel = update_kernel(np.arange(x0, x1)[:, np.newaxis] - mean_pos[1],
+                                   np.arange(y0, y1)[np.newaxis, :] - mean_pos[0],
+                                   self.size)
+            tile[action] = gamma * tile[action] + (1 - gamma) * kernel[:, :, np.newaxis] * avg_speed
+
+        # Update the other tiles at tile resolution (kernel evaluated at the tile centre), the coarse values and the
+        # pending updates of the full resolution tiles
+        centres = (starts + ends) / 2
+        kernel = update_kernel(centres[:, np.newaxis] - mean_pos[1], centres[np.newaxis, :] - mean_pos[0], self.size)
+        change = (1 - gamma) * kernel[:, :, np.newaxis] * avg_speed
+        self.coarse[action] = gamma * self.coarse[action] + change
+        self.scale[action][~near] *= gamma
+        self.offset[action][~near] = gamma * self.offset[action][~near] + change[~near]
+
+        return self
+
+
+def benchmark(sizes=(300, 1000, 2000), n_updates=20, tile_size=32, update_radius=64, mem_len=5):
+    """
+    Compare memory and update time of the dense and tiled Q values for a random walking swarm
+    :param sizes:           Environment sizes to test
+    :param n_updates:       Number of updates per size
+    :param tile_size:       Tile size of the tiled field
+    :param update_radius:   Update radius of the tiled field
+    :param mem_len:         Memory length per update
+    :return:                List of result dictionaries
+    """
+    default_vectors = np.array([[-1, 0], [0, 1], [1, 0], [0, -1]], dtype=float)
+    rng = np.random.default_rng(0)
+    results = []
+
+    for size in sizes:
+
+        # Dense field and precomputed kernel, like Q_VALUES_INITIAL and Q_VALUES_UPDATE_KERNEL in settings
+        dense = np.empty((4, size, size, 2))
+        dense[:] = default_vectors[:, np.newaxis, np.newaxis, :]
+        grid = np.arange(-size, size)
+        dense_kernel = update_kernel(grid[:, np.newaxis], grid[np.newaxis, :], size)
+        tiled = TiledQValues(size=size, default_vectors=default_vectors, tile_size=tile_size, update_radius=update_radius)
+
+        # Random walk of the swarm
+        walk = np.cumsum(rng.integers(-2, 3, size=(n_updates * mem_len, 2)), axis=0) + size // 2
+        walk = np.clip(walk, 0, size - 1)
+        actions = rng.integers(0, 4, size=n_updates)
+
+        dense_times, tiled_times = [], []
+        for n in range(n_updates):
+            memory = walk[n * mem_len:(n + 1) * mem_len]
+            action = actions[n]
+
+            t0 = time.perf_counter()
+            mean_pos = np.mean(memory, 0, dtype=int)
+            avg_speed = np.mean(memory[1:] - memory[:-1], axis=0)
+            kernel = dense_kernel[size - mean_pos[1]:2 * size - mean_pos[1], size - mean_pos[0]:2 * size - mean_pos[0]]
+            dense[action] = 0.9 * dense[action] + 0.1 * kernel[:, :, np.newaxis] * avg_speed
+            dense_times.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            tiled.update(action=action, memory=memory, gamma=0.9)
+            tiled_times.append(time.perf_counter() - t0)
+
+        results.append({"Size": size,
+                        "Dense MB": dense.nbytes / 1e6,
+                        "Tiled MB": tiled.nbytes / 1e6,
+                        "Tiles allocated": len(tiled.tiles),
+                        "Dense ms/update": 1e3 * np.mean(dense_times),
+                        "Tiled ms/update": 1e3 * np.mean(tiled_times)})
+        print(results[-1])
+
+    return results
+
+
+if __name__ == "__main__":
+
+    benchmark()
@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import serial
+from settings import *
+import leica_protocol as protocol
+
+
+class TranslatorLeica:
+
+    def __init__(self, port=SERIAL_PORT_LEICA, poll_interval=LEICA_POLL_INTERVAL, move_timeout=LEICA_MOVE_TIMEOUT,
+                 tolerance=LEICA_TOLERANCE):
+        """
+        Leica xy-platform, moves wait until the motors report the target position (or run in the background)
+        :param port:            Serial port of the Leica
+        :param poll_interval:   Time between position polls while moving (s)
+        :param move_timeout:    Maximum duration of a move (s)
+        :param tolerance:       Maximum distance to the target at which a motor has arrived (steps)
+        """
+
+        # Open Leica
+        self.observer = serial.Serial(port=port,
+                                      baudrate=BAUDRATE_LEICA,  # Baudrate has to be 9600
+                                      timeout=2)  # 2 seconds timeout recommended by the manual
+        print(f"Opened port {port}: {self.observer.isOpen()}")
+        self.pos = (0, 0)  # Reset position to (0, 0)
+
+        # Motion control
+        self.poll_interval = poll_interval
+        self.move_timeout = move_timeout
+        self.tolerance = tolerance
+        self.move_times = deque(maxlen=1000)  # Durations of completed moves (s)
+        self.timeouts = 0
+        self._lock = threading.RLock()  # One command/response at a time (moves run on another thread)
+        self._last_command = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)  # Moves run one after the other
+        self._move = None
+
+    def _write(self, msg):
+        """
+        Write a command, at least SLEEP_TIME after the previous one (the time the Leica needs before the next command)
+        """
+        wait = self._last_command + SLEEP_TIME - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        self.observer.write(msg)
+        self._last_command = time.perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self.observer.write(protocol.RESET)  # Reset device
+            time.sleep(2)  # Give the device time to reset before issuing new commands
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+        self.observer.close()
+        print(f"Closed serial connection")
+
+    def get_status(self, motor: int):
+        assert motor in [0, 1, 2]  # Check if device number is valid
+        with self._lock:
+            self._write(protocol.query_frame(motor, protocol.GET_STATUS))  # Ask for device status
+            received = self.observer.read(1)  # Read response (1 byte)
+        if received:
+            print(f"Received: {received.decode()}")  # Print received message byte
+        return received
+
+    def write_target_pos(self, motor: int, target_pos: int):
+
+        with self._lock:
+            self._write(protocol.set_target_frame(motor, int(target_pos)))  # [device number, command, 3, message, stop signal]
+
+    def _read_coord(self, motor, command):
+        """
+        Ask for a coordinate (position or target) and read the 3-byte response
+        :return:    Coordinate, None if the response timed out
+        """
+        with self._lock:
+            self._write(protocol.query_frame(motor, command))
+            try:
+                received = protocol.read_exact(self.observer, protocol.COORD_BYTES, timeout=self.observer.timeout)
+            except TimeoutError as err:
+                print(f"No bytes received: {err}")
+                self.observer.reset_input_buffer()  # A late response must not be read as the next coordinate
+                return None
+
+        # Return translated message
+        return protocol.decode_coord(received)
+
+    def get_motor_pos(self, motor):
+        return self._read_coord(motor, protocol.GET_POSITION)
+
+    def get_target_pos(self, motor: int):
+        return self._read_coord(motor, protocol.GET_TARGET)
+
+    def move_to_target(self, motor: int, target_pos: int):  # TODO --> Coordinate boundaries so we don't overshoot the table and get the motor stuck, as we need to reset then
+
+        """
+        100k steps is 1 cm in real life
+        """
+
+        # Write target position
+        self.write_target_pos(motor=motor, target_pos=target_pos)
+
+        # Move motor to target coordinate
+        with self._lock:
+            self._write(protocol.go_frame(motor))
+
+    def wait_until_reached(self, targets: dict, timeout=None):
+        """
+        Poll the motor positions until all motors reached their target, a motor without a position reading (timeout)
+        has not arrived
+        :param targets: Dictionary of motor and target position
+        :param timeout: Maximum waiting time (s), self.move_timeout if None
+        :return:        True if all targets were reached in time
+        """
+        timeout = self.move_timeout if timeout is None else timeout
+        t0 = time.perf_counter()
+        remaining = dict(targets)
+        while remaining:
+            positions = {motor: self.get_motor_pos(motor) for motor in remaining}
+            remaining = {motor: target for motor, target in remaining.items()
+                         if positions[motor] is None or abs(positions[motor] - target) > self.tolerance}
+            if not remaining:
+                break
+            if time.perf_counter() - t0 >= timeout:
+                print(f"Move timed out, motors {list(remaining)} did not reach their target")
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def move(self, targets: dict):
+        """
+        Move motors to their targets and wait until they arrived
+        :param targets: Dictionary of motor and target position
+        :return:        Duration of the move (s), None if it timed out
+        """
+        t0 = time.perf_counter()
+        with self._lock:
+            for frame in protocol.move_frames(targets):  # Target and go command of every motor
+                self._write(frame)
+        if not self.wait_until_reached(targets):
+            self.timeouts += 1
+            return None
+        duration = time.perf_counter() - t0
+        self.move_times.append(duration)
+        return duration
+
+    def move_async(self, targets: dict):
+        """
+        Move motors to their targets in the background (imaging can continue)
+        :param targets: Dictionary of motor and target position
+        :return:        Future with the duration of the move
+        """
+        self._move = self._executor.submit(self.move, targets)
+        return self._move
+
+    def is_moving(self):
+        return self._move is not None and not self._move.done()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the background move to finish
+        :return:    Duration of the move (s), None if there was no move or it timed out
+        """
+        if self._move is None:
+            return None
+        return self._move.result(timeout=timeout)
+
+    def move_stats(self):
+        """
+        Statistics of the move durations (s)
+        """
+        stats = {"moves": len(self.move_times), "timeouts": self.timeouts}
+        if self.move_times:
+            times = np.array(self.move_times)
+            stats.update(mean=round(float(times.mean()), 3),
+                         p95=round(float(np.percentile(times, 95)), 3),
+                         max=round(float(times.max()), 3))
+        return stats
+
+    def coord_to_msg(self, coord: int):
+        return list(protocol.encode_coord(coord))
+
+    def msg_to_coord(self, msg: bytes):
+        return protocol.decode_coord(msg)
+
+    def pixels_to_increment(self, pixels: np.array):
+        return np.array([pixels[0]*PIXEL_MULTIPLIER_LEFT_RIGHT, pixels[1]*PIXEL_MULTIPLIER_UP_DOWN])
+
+    def move_increment(self, offset_pixels: np.array, wait=True):
+        """
+        Move the platform by an offset in pixels
+        :param offset_pixels:   Offset (x, y) in pixels
+        :param wait:            Wait until the motors arrived, otherwise move in the background
+        :return:                Duration of the move (s) or a Future of it
+        """
+
+        # Get increments and add to current position
+        self.pos += self.pixels_to_increment(pixels=offset_pixels)
+
+        # Move motors x and y
+        print("Moving...")
+        targets = {1: self.pos[0], 2: self.pos[1]}  # Left/right, up/down
+        if wait:
+            return self.move(targets)
+        return self.move_async(targets)
+
+
+def benchmark(offsets=((10, 0), (0, 10), (50, 50), (-60, -60)), speed=50000):
+    """
+    Compare the fixed 3 s sleep of the old move_increment with polling for completion on a simulated Leica
+    :param offsets: Offsets (pixels) to move
+    :param speed:   Simulated motor speed (steps/s)
+    :return:        Move statistics
+    """
+    from serial_loopback import LoopbackLeica
+
+    device = LoopbackLeica(speed=speed)
+    translator = TranslatorLeica(port=device.port)
+    for offset in offsets:
+        duration = translator.move_increment(np.array(offset))
+        print(f"Moved {offset} pixels in {duration:.3f}s (old: 3s + {4 * SLEEP_TIME}s)")
+
+    # Background move while the main thread keeps working
+    t0 = time.perf_counter()
+    translator.move_increment(np.array((100, 0)), wait=False)
+    print(f"move_increment(wait=False) returned after {(time.perf_counter() - t0) * 1e3:.1f}ms")
+    print(f"Background move took {translator.wait():.3f}s")
+
+    stats = translator.move_stats()
+    print(f"Move statistics: {stats}")
+    translator.close()
+    device.close()
+    return stats
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,56 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from manipulation.episode_log import derive_columns, read_attrs
+
+
+def load_episode_log(filename, mmap=False, derived=False):
+    """
+    Load a binary episode log (structured .npy written by the environment) as a DataFrame
+    :param filename:    Episode log filename
+    :param mmap:        Memory map the file instead of reading it
+    :param derived:     Add the derived Filename and constant (e.g. OFFSET_BOUNDS) columns
+    :return:            DataFrame with numeric State_x, State_y, Target_x, Target_y columns, the episode attributes
+                        (SNAPSHOTS_SAVE_DIR and constants) are in log.attrs
+    """
+    log = pd.DataFrame(np.load(filename, mmap_mode='r' if mmap else None))
+    log.attrs = read_attrs(filename)
+    if derived:
+        for name, values in derive_columns(log, log.attrs).items():
+            log[name] = values
+    return log
+
+
+def load_day(save_dir, experiment_run_name="*"):
+    """
+    Load all binary episode logs of one day
+    :param save_dir:            SAVE_DIR of the day
+    :param experiment_run_name: Only load the episodes of this run (all runs by default)
+    :return:                    DataFrame of all episodes with the episode name in (categorical) column Episode,
+                                the attributes of every episode are in attrs["episodes"]
+    """
+    filenames = sorted(glob.glob(os.path.join(save_dir, f"{experiment_run_name}_*.episode.npy")))
+    episodes, attrs = [], {}
+    for filename in filenames:
+        episode = load_episode_log(filename)
+        name = os.path.basename(filename)[:-len(".episode.npy")]
+        episode["Episode"] = name
+        attrs[name] = episode.attrs
+        episodes.append(episode)
+    if not episodes:
+        return pd.DataFrame()
+    day = pd.concat(episodes, ignore_index=True)
+    day["Episode"] = day["Episode"].astype("category")
+    day.attrs = {"episodes": attrs}
+    return day
+
+
+def positions(log, name="State"):
+    """
+    Positions of a tuple column as an (N, 2) array
+    :param log:     Episode log DataFrame
+    :param name:    State or Target
+    :return:        Array of shape (N, 2)
+    """
+    return log[[f"{name}_x", f"{name}_y"]].to_numpy()
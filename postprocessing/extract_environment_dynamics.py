@@ -1,106 +1,118 @@
 import numpy as np
 import pandas as pd
-import tqdm
-from ast import literal_eval as make_tuple
-import os
-import cv2
-import matplotlib.pyplot as plt
+from postprocessing.metadata_loader import load_metadata_csv
 
 # Initialize metadata
-print('Loading data...')
 PROJECT_NAME = 'Project_Matt'  # Project name
 DATE = ''  # Date of the experiment
 EXPERIMENT_RUN_NAME = 'TEST'  # Name of the experiment run
 SAVE_DIR = f"C:\\Users\\ARSL\\PycharmProjects\\{PROJECT_NAME}\\{DATE}"  # Location for images all the images and metadata
-METADATA = pd.read_csv(f"{SAVE_DIR}{EXPERIMENT_RUN_NAME}_processed.csv")
-del csv['Unnamed: 0'] # Delete unwanted column to save memory
+METADATA_CSV = f"{SAVE_DIR}{EXPERIMENT_RUN_NAME}_processed.csv"  # Cluster columns parsed to Cluster{i}_x, _y, _size
 
 # Initialize dynamics csv
-PRED_SECONDS = 1.5 # Length of movement timestep
-DYNAMICS_CSV = f"{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}_dynamics_{PRED_SECONDS}s.csv"
+PRED_SECONDS = [0.5, 1.0, 1.5]  # Lengths of movement timestep, all extracted in one pass
+DYNAMICS_CSV = f"{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}_dynamics.csv"  # All lengths (Horizon column)
+DYNAMICS_HORIZON_CSV = f"{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}_dynamics_{{}}s.csv"  # One length (as read by construct_model.py)
+
+# Column names of the dynamics csv
+COLUMNS = ['Time', 'Vpp', 'Frequency', 'Action', 'Cluster', 'Size', 'X0', 'Y0', 'X1', 'Y1', 'Magnitude', 'dX', 'dY']
+
+
+def segment_bounds(metadata):
+    """
+    Segments of consecutive datapoints with the same frequency, action and vpp
+    :param metadata:    Parsed metadata DataFrame
+    :return:            First rows and end rows (exclusive) of the segments
+    """
+    inputs = metadata[["Frequency", "Action", "Vpp"]].to_numpy()
+    changes = np.flatnonzero(np.any(inputs[1:] != inputs[:-1], axis=1)) + 1
+    return np.concatenate(([0], changes)), np.concatenate((changes, [len(metadata)]))
+
+
+def pair_horizon(times, horizon):
+    """
+    Pair every datapoint of a segment with the datapoint closest to horizon seconds later, with a sorted-time search.
+    The last datapoint of the segment is never a partner, and pairing stops after the first datapoint whose partner is
+    the end of the segment (the horizon reaches beyond the segment)
+    :param times:       Sorted times of the segment (s)
+    :param horizon:     Length of the movement timestep (s)
+    :return:            Rows and partner rows (relative to the start of the segment)
+    """
+    last = len(times) - 2
+    if last < 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    rows = np.arange(last + 1)
+    targets = times[:last + 1] + horizon
+    right = np.clip(np.searchsorted(times[:last + 1], targets), rows, last)
+    left = np.clip(right - 1, rows, last)
+    partners = np.where(np.abs(times[left] - targets) <= np.abs(times[right] - targets), left, right)
+    stop = np.argmax(partners == last)
+    return rows[:stop + 1], partners[:stop + 1]
+
+
+def extract_dynamics(metadata, horizons=PRED_SECONDS):
+    """
+    Change in position of every cluster over one or more movement timesteps, in one pass over the segments
+    :param metadata:    Parsed metadata DataFrame (load_metadata_csv)
+    :param horizons:    Lengths of the movement timestep (s)
+    :return:            DataFrame with a Horizon column and the dynamics columns (COLUMNS), one row per datapoint,
+                        cluster and horizon
+    """
+    times = metadata["Time"].to_numpy(dtype=np.float64)
+    starts, ends = segment_bounds(metadata)
+
+    # Pair the datapoints of every segment for all horizons
+    rows, partners, horizon_index = [], [], []
+    for start, end in zip(starts, ends):
+        for h, horizon in enumerate(horizons):
+            segment_rows, segment_partners = pair_horizon(times[start:end], horizon)
+            rows.append(segment_rows + start)
+            partners.append(segment_partners + start)
+            horizon_index.append(np.full(len(segment_rows), h))
+    rows, partners, horizon_index = np.concatenate(rows), np.concatenate(partners), np.concatenate(horizon_index)
+
+    # One line per cluster of every pair
+    num_clusters = metadata["num_clusters"].to_numpy()
+    tables = []
+    for i in range(int(np.nanmax(num_clusters)) if len(metadata) else 0):
+        mask = num_clusters[rows] > i
+        row, partner = rows[mask], partners[mask]
+        x = metadata[f"Cluster{i}_x"].to_numpy(dtype=np.float64)
+        y = metadata[f"Cluster{i}_y"].to_numpy(dtype=np.float64)
+        tables.append(pd.DataFrame({"Horizon": np.asarray(horizons)[horizon_index[mask]],
+                                    "Time": times[row],
+                                    "Vpp": metadata["Vpp"].to_numpy()[row],
+                                    "Frequency": metadata["Frequency"].to_numpy()[row],
+                                    "Action": metadata["Action"].to_numpy()[row],
+                                    "Cluster": i,
+                                    "Size": metadata[f"Cluster{i}_size"].to_numpy()[row],
+                                    "X0": x[row], "Y0": y[row], "X1": x[partner], "Y1": y[partner],
+                                    "_row": row}))
+    if not tables:
+        return pd.DataFrame(columns=["Horizon"] + COLUMNS)
+
+    # Order by horizon, datapoint and cluster
+    dynamics = pd.concat(tables, ignore_index=True)
+    dynamics = dynamics.sort_values(["Horizon", "_row", "Cluster"], kind="mergesort").drop(columns="_row")
+
+    # Magnitude and direction of the change in position
+    dx, dy = (dynamics["X1"] - dynamics["X0"]).to_numpy(), (dynamics["Y1"] - dynamics["Y0"]).to_numpy()
+    magnitude = np.hypot(dx, dy)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dynamics["Magnitude"] = magnitude
+        dynamics["dX"] = np.where(magnitude > 0, dx / magnitude, 0)
+        dynamics["dY"] = np.where(magnitude > 0, dy / magnitude, 0)
+    return dynamics[["Horizon"] + COLUMNS].reset_index(drop=True)
 
-# Define the three input variables and make sets of the same input variables
-df = processed_csv[["Frequency", "Action", "Vpp"]]
-uniques = sorted(df.groupby(list(METADATA)).apply(lambda x: tuple(x.index)).tolist())
-starting_points = {}
-for i, unique in enumerate(uniques):
-    starting_points.__setitem__(unique[0], len(unique))
 
 if __name__ == "__main__":
 
-    # Specify column names that you would like to save in metadata
-    columns = ['Time', 'Vpp', 'Frequency', 'Action', 'Cluster', 'Size', 'X0', 'Y0', 'X1', 'Y1', 'Magnitude', 'dX', 'dY']
-
-    # Initielize empty array for dynamics data
-    dynamics_array = np.zeros((METADATA.shape[0] * METADATA.shape[1], len(columns)))
-    j = 0
-
-    for n, datapoint in tqdm.tqdm(metadata.iterrows()):
-
-        # Loop through datapoints and record the change in position over PRED_SECONDS seconds
-        if n in starting_points.keys():
-            a = 0
-            num_entries = starting_points[n]
-            closest = np.argmin(np.array(np.abs(metadata[n:n + int(num_entries - 1 - a)]['Time'] - datapoint["Time"] - PRED_SECONDS)))
-        else:
-            if a + closest >= num_entries - 2:
-                continue
-            else:
-                a += 1
-                closest = np.argmin(np.array(np.abs(metadata[n:n + int(num_entries - 1 - a)]['Time'] - datapoint['Time'] - PRED_SECONDS)))
-
-        # Datapoint closest to PRED_SECONDS seconds
-        datapoint1 = metadata.iloc[n+closest]
-
-        # Exception handling
-        if datapoint["Action"] != datapoint1["Action"]:
-            raise ValueError("Something went wrong!")
-
-        # Initalize metadata
-        initial_data = {"Time": datapoint['Time'],
-                        "Vpp": datapoint['Vpp'],
-                        "Frequency": datapoint['Frequency'],
-                        "Action": datapoint['Action']}
-
-        # Loop trhough clusters and add their dynamics to the dynamics csv
-        for i in range(int(datapoint["num_clusters"])):
-
-            data = initial_data.copy()
-
-            pos0, size = make_tuple(datapoint[f"Cluster{i}"])
-            pos1, _ = make_tuple(datapoint1[f"Cluster{i}"])
-
-            data.__setitem__("Cluster", i)
-            data.__setitem__("Size", size)
-            data.__setitem__("X0", pos0[0])
-            data.__setitem__("Y0", pos0[1])
-            data.__setitem__("X1", pos1[0])
-            data.__setitem__("Y1", pos1[1])
-
-            # Exception handling
-            if None in data.values():
-                raise ValueError("Something went wrong!")
-
-            offset = np.array(pos1) - np.array(pos0)
-            magnitude = np.linalg.norm(offset)
-
-            if not magnitude:
-                data.__setitem__("Magnitude", 0)
-                data.__setitem__("dX", 0)
-                data.__setitem__("dY", 0)
-            else:
-                vector = tuple(offset / magnitude)
-                data.__setitem__("Magnitude", magnitude)
-                data.__setitem__("dX", vector[0])
-                data.__setitem__("dY", vector[1])
-
-            # Add to dynamics array
-            dynamics_array[j] = list(data.values())
-
-            j += 1
-
-    # Save data from array to csv (really fast this way)
-    dynamics_array = np.delete(dynamics_array, slice(j, len(dynamics_array), 1), axis=0)
-    dynamics_csv = pd.DataFrame(dynamics_array, columns=['Time', 'Vpp', 'Frequency', 'Action', 'Cluster', 'Size', 'X0', 'Y0', 'X1', 'Y1', 'Magnitude', 'dX', 'dY'])
-    dynamics_csv.to_csv(f"{training_data_folder}{filename_dynamics_csv}.csv")
+    print('Loading data...')
+    metadata = load_metadata_csv(METADATA_CSV)
+    dynamics = extract_dynamics(metadata, horizons=PRED_SECONDS)
 
+    # Save all horizons together and every horizon in its own csv
+    dynamics.to_csv(DYNAMICS_CSV)
+    for horizon, table in dynamics.groupby("Horizon"):
+        table[COLUMNS].reset_index(drop=True).to_csv(DYNAMICS_HORIZON_CSV.format(horizon))
+    print(f"{len(dynamics)} dynamics datapoints for {len(PRED_SECONDS)} horizons saved to {DYNAMICS_CSV}")
@@ -3,18 +3,17 @@ import tqdm
 import os
 import time
 import pandas
-from ast import literal_eval as make_tuple
 from collections import deque
 import numpy as np
 from settings import *
+from metadata_loader import load_metadata_csv
 import shutil
 
 if __name__ == "__main__":
 
     # Read metadata and specify folder for the images
     filename = 'experiments_square_channel_29_11_2021_L.csv'
-    metadata = pandas.read_csv(f"{filename}")  # Make this file if you don't have it yet
-    del metadata['Unnamed: 0']
+    metadata = load_metadata_csv(f"{filename}")  # Make this file if you don't have it yet
     metadata = metadata[metadata['Action'] != -1]
     folder = "C:\\Users\\ARSL\\PycharmProjects\\Project_Matt\\experiments_square_channel_29_11_2021\\"
     imgs = os.listdir(folder)
@@ -38,7 +37,8 @@ if __name__ == "__main__":
             img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
 
         # Parameters
-        state = make_tuple(datapoint['State'])
+        state = (int(datapoint['State_x']), int(datapoint['State_y']))
+        target = (int(datapoint['Target_x']), int(datapoint['Target_y']))
         action = datapoint['Action']
         size = datapoint['Size']
         bbox = [int(state[0] - 0.5 * size), int(state[1] - 0.5 * size), size, size]
@@ -54,13 +54,13 @@ if __name__ == "__main__":
             cv2.line(img, (0, 2), (IMG_SIZE, 2), (0, 255, 0), 4)
 
         centers.append(state)
-        targets.append(make_tuple(datapoint["Target"]))
+        targets.append(target)
 
         # Tracking center, bounding box, action
         p1 = (int(bbox[0]), int(bbox[1]))
         p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
         cv2.rectangle(img, p1, p2, (255, 255, 255))
-        cv2.circle(img, make_tuple(datapoint['Target']), 0, (178, 255, 102), 5)
+        cv2.circle(img, target, 0, (178, 255, 102), 5)
         cv2.putText(img, f"Vpp: {round(datapoint['Vpp'], 2)}", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         cv2.putText(img, f"Freq: {round(datapoint['Frequency'], 2)}kHz", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         centers.append(state)
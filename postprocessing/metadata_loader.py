@@ -0,0 +1,116 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Names of the numeric columns a tuple column is split into, by number of values
+TUPLE_SUFFIXES = {2: ("x", "y"), 3: ("x", "y", "size")}
+FLOAT64_COLUMNS = ("Time",)  # Columns that need double precision (timestamps)
+INTEGER_COLUMNS = ("Action", "Step", "OFFSET_BOUNDS")  # Columns that may be read as floats but hold integers
+
+
+def parse_tuple_column(series):
+    """
+    Parse a column of tuple strings like "[12, 34]" or "[(12, 34), 56.0]" into numeric columns, vectorised
+    :param series:  Column of tuple strings
+    :return:        DataFrame with one float column per value
+    """
+    stripped = series.astype(str).str.replace(r"[\[\]()\s]", "", regex=True)
+    values = stripped.str.split(",", expand=True)
+    values = values.apply(pd.to_numeric, errors="coerce")
+    suffixes = TUPLE_SUFFIXES.get(values.shape[1], range(values.shape[1]))
+    values.columns = [f"{series.name}_{suffix}" for suffix in suffixes]
+    return values
+
+
+def _is_tuple_column(series):
+    """
+    Check if an object column holds tuple strings
+    """
+    first = series.dropna()
+    return series.dtype == object and len(first) > 0 and str(first.iloc[0]).lstrip()[:1] in ("[", "(")
+
+
+def parse_metadata(metadata, tuple_columns=None):
+    """
+    Replace the tuple string columns of a metadata DataFrame by numeric columns
+    :param metadata:        DataFrame as read from a metadata CSV
+    :param tuple_columns:   Names of the tuple columns (detected automatically if None)
+    :return:                DataFrame with e.g. State_x, State_y instead of State
+    """
+    if "Unnamed: 0" in metadata:
+        del metadata["Unnamed: 0"]  # Remove unwanted column
+    if tuple_columns is None:
+        tuple_columns = [name for name in metadata.columns if _is_tuple_column(metadata[name])]
+
+    parsed = [parse_tuple_column(metadata[name]) for name in tuple_columns]
+    return pd.concat([metadata.drop(columns=list(tuple_columns))] + parsed, axis=1)
+
+
+def downcast(metadata, category_fraction=0.5):
+    """
+    Reduce the memory of a metadata DataFrame: integer valued columns (e.g. Action) to the smallest integer type, other
+    floats (positions, sizes, Vpp, frequency) to float32 and repeated strings to categoricals. Columns with a single
+    value (e.g. OFFSET_BOUNDS) are also stored in metadata.attrs["constants"]
+    :param metadata:            Parsed metadata DataFrame
+    :param category_fraction:   Make string columns with at most this fraction of unique values categorical
+    :return:                    Downcast DataFrame
+    """
+    constants = {}
+    for name in metadata.columns:
+        column = metadata[name]
+        if name in FLOAT64_COLUMNS or len(column) == 0:
+            continue
+        if column.dtype == object:
+            n_unique = column.nunique(dropna=False)
+            if n_unique <= category_fraction * len(column):
+                metadata[name] = column.astype("category")
+        elif np.issubdtype(column.dtype, np.integer) or (name in INTEGER_COLUMNS and column.notna().all()):
+            metadata[name] = pd.to_numeric(column.astype(np.int64), downcast="integer")
+        elif np.issubdtype(column.dtype, np.floating):
+            metadata[name] = column.astype(np.float32)
+        else:
+            continue
+        if column.nunique(dropna=False) == 1:
+            constants[name] = column.iloc[0].item() if hasattr(column.iloc[0], "item") else column.iloc[0]
+    metadata.attrs["constants"] = constants
+    return metadata
+
+
+def _cache_filename(filename):
+    return f"{os.path.splitext(filename)[0]}.parsed.npy"
+
+
+def load_metadata_csv(filename, tuple_columns=None, cache=True, small=True):
+    """
+    Load a legacy metadata CSV with parsed tuple columns, the parsed result is cached next to the CSV
+    :param filename:        Metadata CSV
+    :param tuple_columns:   Names of the tuple columns (detected automatically if None)
+    :param cache:           Read/write the parsed cache ({name}.parsed.npy), it is refreshed when the CSV is newer
+    :param small:           Downcast the columns (see downcast)
+    :return:                DataFrame with numeric {name}_x, {name}_y (and {name}_size) columns
+    """
+    cache_filename = _cache_filename(filename)
+    if cache and os.path.isfile(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(filename):
+        metadata = pd.DataFrame(np.load(cache_filename))
+        return downcast(metadata) if small else metadata
+
+    metadata = parse_metadata(pd.read_csv(filename), tuple_columns=tuple_columns)
+
+    if cache:
+        records = metadata.to_records(index=False)
+        dtype = [(name, f"U{max(1, metadata[name].astype(str).str.len().max())}" if records.dtype[name] == object
+                  else records.dtype[name]) for name in records.dtype.names]
+        np.save(cache_filename, records.astype(dtype))
+
+    return downcast(metadata) if small else metadata
+
+
+def tuples(metadata, name="State", dtype=int):
+    """
+    Values of a parsed tuple column as a list of tuples (e.g. for drawing with OpenCV)
+    :param metadata:    Parsed metadata DataFrame
+    :param name:        Name of the tuple column
+    :param dtype:       Type of the values
+    :return:            List of tuples
+    """
+    return list(map(tuple, metadata[[f"{name}_x", f"{name}_y"]].to_numpy().astype(dtype)))
@@ -6,6 +6,7 @@ import cv2
 import tqdm
 import os
 from manipulation.settings import *
+from manipulation import settings
 
 
 class TrackNClusters:
@@ -60,13 +61,13 @@ if __name__ == "__main__":
 
     # Initialize metadata
     print('Loading data...')
-    csv = METADATA.copy()
+    csv = settings.METADATA.copy()
     del csv['Unnamed: 0']  # Delete unwanted column to save memory
     csv = csv.dropna()  # Drop NaN rows
     METADATA_CENTROIDS_EXTRACTED = pd.DataFrame()  # Empty dataframe for extracted data
 
     # Loop through datapoints
-    for n, datapoint in tqdm.tqdm(METADATA.iterrows()):
+    for n, datapoint in tqdm.tqdm(settings.METADATA.iterrows()):
 
         # Load image and metadata from image
         img = cv2.imread(f"{SAVE_DIR}\\{EXPERIMENT_RUN_NAME}\\{datapoint['Time']}.png", cv2.IMREAD_GRAYSCALE)
@@ -6,6 +6,7 @@ import cv2
 import tqdm
 import os
 from manipulation.settings import *
+from postprocessing.metadata_loader import load_metadata_csv
 
 
 class TrackNClusters:
@@ -52,10 +53,11 @@ if __name__ == "__main__":
 
     # Initialize metadata
     print('Loading data...')
+    metadata = load_metadata_csv(METADATA_FILENAME)
     METADATA_CENTROID_EXTRACTED = pd.DataFrame()  # Empty dataframe for extracted data
 
     # Loop through datapoints
-    for n, datapoint in tqdm.tqdm(METADATA.iterrows()):
+    for n, datapoint in tqdm.tqdm(metadata.iterrows()):
 
         if "reset" in datapoint["Filename"]:
             filename = f"{datapoint['Time']}-reset.png"
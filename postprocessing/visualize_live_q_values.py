@@ -7,7 +7,8 @@ import tqdm
 import os
 from collections import deque
 from manipulation.settings import *
-from ast import literal_eval as make_tuple
+from manipulation import settings
+from postprocessing.metadata_loader import load_metadata_csv, tuples
 import matplotlib.pyplot as plt
 import time
 #
@@ -170,7 +171,7 @@ def update_q_values(action, memory, q_values):
         kernel_slice_y = slice(300 - mean_pos[0], 600 - mean_pos[0])
 
         # Update q values
-        q_values[action] = GAMMA * q_values[action] + (1-GAMMA) * Q_VALUES_UPDATE_KERNEL[kernel_slice_x, kernel_slice_y] * avg_speed
+        q_values[action] = GAMMA * q_values[action] + (1-GAMMA) * settings.Q_VALUES_UPDATE_KERNEL[kernel_slice_x, kernel_slice_y] * avg_speed
 
 
         return q_values
@@ -245,13 +246,16 @@ if __name__ == "__main__":
     # plt.imshow(Q_VALUES_UPDATE_KERNEL[:, :, 0])
     # plt.show()
 
+    # Load metadata with parsed State and Target columns
+    metadata = load_metadata_csv(METADATA_FILENAME)
+    states, targets = tuples(metadata, "State"), tuples(metadata, "Target")
+
     # Loop through datapoints
-    for n, datapoint in tqdm.tqdm(METADATA.iterrows()):
+    for n, (filename, state, new_target, new_action) in tqdm.tqdm(enumerate(zip(metadata["Filename"], states, targets, metadata["Action"]))):
 
-        if "reset" in datapoint["Filename"]:
+        if "reset" in filename:
             memory = deque(maxlen=(mem_len))
-            state = make_tuple(datapoint["State"])
-            target = make_tuple(datapoint["Target"])
+            target = new_target
             memory.append(state)
             q_values = np.zeros((4, 300, 300, 2))
             q_values[0, :, :, 0] -= 1
@@ -259,14 +263,13 @@ if __name__ == "__main__":
             q_values[2, :, :, 0] += 1
             q_values[3, :, :, 1] += 1
         else:
-            state = make_tuple(datapoint["State"])
             memory.append(state)
             if not n % mem_len:
 
                 q_values = update_q_values(q_values=q_values, memory=memory, action=int(action))
 
-                target = make_tuple(datapoint["Target"])
-                action = datapoint["Action"]
+                target = new_target
+                action = new_action
                 offset = np.array(state) - np.array(target)
 
                 # action = calc_action(pos0=state, offset=offset, q_values=q_values, mode="single_choice")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The manipulation scripts import each other as top-level modules (e.g. `import leica_protocol`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "manipulation"))
@@ -0,0 +1,105 @@
+import binascii
+import os
+import random
+import pytest
+import leica_protocol as protocol
+
+
+def legacy_coord_to_msg(coord):
+    """
+    Previous implementation of TranslatorLeica.coord_to_msg
+    """
+    if coord < 0:
+        coord += 16777216
+    hexa = hex(coord).split("x")[-1].zfill(6)
+    four_digit_binaries = [bin(int(n, 16))[2:].zfill(4) for n in hexa]
+    eight_digit_binaries = [f"{four_digit_binaries[n] + four_digit_binaries[n + 1]}".encode() for n in range(0, 6, 2)][::-1]
+    return [int(m, 2) for m in eight_digit_binaries]
+
+
+def legacy_msg_to_coord(msg):
+    """
+    Previous implementation of TranslatorLeica.msg_to_coord, it decodes coordinates >= 2**21 as negative because the
+    sign bit is read from a string that is not padded to 24 bits
+    """
+    coord = int(binascii.hexlify(bytearray(msg[::-1])), 16)
+    if bin(coord).zfill(24)[2] == '1':
+        coord -= 16777216
+    return int(coord)
+
+
+EDGES = [0, 1, -1, 255, 256, -256, 2**16, -2**16, 2**21 - 1, -2**21, protocol.COORD_MIN, protocol.COORD_MAX]
+SAMPLES = EDGES + [random.Random(0).randint(protocol.COORD_MIN, protocol.COORD_MAX) for _ in range(10000)]
+
+
+def test_round_trip():
+    for coord in SAMPLES:
+        msg = protocol.encode_coord(coord)
+        assert len(msg) == protocol.COORD_BYTES
+        assert protocol.decode_coord(msg) == coord
+
+
+def test_matches_legacy_codec():
+    for coord in SAMPLES:
+        msg = protocol.encode_coord(coord)
+        assert list(msg) == legacy_coord_to_msg(coord)
+        if -2**21 <= coord < 2**21:  # The legacy decoder was only correct in this range
+            assert legacy_msg_to_coord(msg) == coord
+
+
+@pytest.mark.parametrize("coord", [protocol.COORD_MIN - 1, protocol.COORD_MAX + 1])
+def test_out_of_range(coord):
+    with pytest.raises(ValueError):
+        protocol.encode_coord(coord)
+
+
+def test_move_frames():
+    assert protocol.move_frames({1: -5, 2: 70000}) == [bytes([1, 84, 3]) + protocol.encode_coord(-5) + b":",
+                                                       bytes([1, 71, 58]),
+                                                       bytes([2, 84, 3]) + protocol.encode_coord(70000) + b":",
+                                                       bytes([2, 71, 58])]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="The loopback Leica runs on a pseudo terminal")
+def test_move_writes_every_command_separately():
+    pytest.importorskip("serial")
+    import time
+    import settings
+    from serial_loopback import LoopbackLeica
+    from translator_leica import TranslatorLeica
+
+    leica = LoopbackLeica(speed=10**6)
+    translator = TranslatorLeica(port=leica.port, poll_interval=0.01)
+    writes = []
+    write = translator._write
+    translator._write = lambda msg: (write(msg), writes.append((time.perf_counter(), msg)))
+    try:
+        assert translator.move({1: 1000, 2: -2000}) is not None
+        assert [msg for _, msg in writes[:4]] == protocol.move_frames({1: 1000, 2: -2000})
+        gaps = [t1 - t0 for (t0, _), (t1, _) in zip(writes[:4], writes[1:4])]
+        assert min(gaps) >= settings.SLEEP_TIME * 0.9
+    finally:
+        translator.close()
+        leica.close()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="The loopback Leica runs on a pseudo terminal")
+def test_move_without_position_readings_times_out():
+    pytest.importorskip("serial")
+    from serial_loopback import LoopbackLeica
+    from translator_leica import TranslatorLeica
+
+    class SilentLeica(LoopbackLeica):
+        def reply(self, data):
+            pass  # Position queries are never answered
+
+    leica = SilentLeica()
+    translator = TranslatorLeica(port=leica.port, poll_interval=0.01, move_timeout=0.3)
+    translator.observer.timeout = 0.05
+    try:
+        assert translator.get_motor_pos(1) is None
+        assert translator.move({1: 0}) is None  # A target at 0 is not reached without a reading
+        assert translator.timeouts == 1
+    finally:
+        translator.close()
+        leica.close()
@@ -0,0 +1,84 @@
+import os
+import time
+import numpy as np
+import pytest
+
+if os.name != "posix":
+    pytest.skip("The simulated serial devices are pseudo terminals (POSIX only)", allow_module_level=True)
+
+pytest.importorskip("serial")
+pytest.importorskip("pyvisa")
+pytest.importorskip("cv2")
+
+import tektronix_func_gen as tfg
+from settings import BAUDRATE_ARDUINO, IMG_SIZE, INSTR_DESCRIPTOR, PIEZO_RESONANCES
+from simulated_hardware import PIEZO_DIRECTIONS, SimulatedHardware
+
+
+@pytest.fixture
+def hardware():
+    hardware = SimulatedHardware(latencies={"camera": 0.01, "visa": 0.001}, seed=0)
+    yield hardware
+    tfg.visa_pool.close_all()
+    hardware.close()
+
+
+@pytest.fixture
+def fgen(hardware):
+    fgen = tfg.FuncGen(INSTR_DESCRIPTOR, resource_manager=hardware.resource_manager, verbose=False)
+    yield fgen
+    fgen.close()
+
+
+def test_func_gen_settings(fgen):
+    with fgen.batch():
+        fgen.ch1.set_function("SQUARE")
+        fgen.ch1.set_amplitude(10)
+        fgen.ch1.set_output("ON")
+    fgen.invalidate_state()
+    settings = fgen.ch1.get_settings()
+    assert settings["function"][0] == "SQU"
+    assert settings["amplitude"][0] == 10
+    assert fgen.get_error().startswith("0")
+
+
+@pytest.mark.parametrize("piezo", sorted(PIEZO_DIRECTIONS))
+def test_piezo_moves_swarm(hardware, fgen, piezo, n_steps=40):
+    from piezo_driver import PiezoDriver
+
+    driver = PiezoDriver(port=hardware.arduino.port, baudrate=BAUDRATE_ARDUINO)
+    try:
+        with fgen.batch():
+            fgen.ch1.set_function("SQUARE")
+            fgen.ch1.set_amplitude(10)
+            fgen.ch1.set_frequency(PIEZO_RESONANCES[piezo] * 1e3)
+            fgen.ch1.set_output("ON")
+        hardware.swarm.position[:] = IMG_SIZE / 2
+        driver.send(piezo)
+        driver.flush()
+        start = hardware.swarm.update().copy()
+        time.sleep(n_steps * hardware.camera.frame_time)
+        displacement = hardware.swarm.update() - start
+    finally:
+        driver.close()
+    assert np.dot(displacement, PIEZO_DIRECTIONS[piezo]) > np.linalg.norm(displacement) / 2
+
+
+def test_camera_shows_swarm(hardware, tmp_path):
+    from cluster_detection_and_tracking import find_clusters
+
+    img = hardware.camera.snap(f_name=str(tmp_path / "simulated_frame.png"))
+    centroids, _, _ = find_clusters(image=img, amount_of_clusters=1)
+    assert np.linalg.norm(np.array(centroids[0]) - hardware.swarm.position) < 3
+
+
+def test_visa_session_reuse_and_reconnect(hardware, fgen):
+    fgen.close()
+    fgen = tfg.FuncGen(INSTR_DESCRIPTOR, resource_manager=hardware.resource_manager, verbose=False)
+    assert fgen.connect_time["reused"] and hardware.resource_manager.opened == 1
+    reconnects = tfg.visa_pool.metrics["reconnects"]
+    hardware.instrument.drop_connection()
+    assert fgen.get_error().startswith("0")
+    assert hardware.resource_manager.opened == 2
+    assert tfg.visa_pool.metrics["reconnects"] == reconnects + 1
+    fgen.close()